@@ -17,6 +17,11 @@ PYTHONPATH=$(BUILD_ROOT)/../python
 
 export PYTHONPATH
 
+# CDC constraint generation by the installed gbs NSL plugin (see
+# build/gbs) instead of the support/ shell scripts, when non-empty
+NSL_CDC_NATIVE ?=
+NSL_CDC ?= python3 -m gbs.plugin.nsl.cdc.cli
+
 -include $(TOOL_ROOT)/$(tool)-pre.mk
 
 # Uniq without reordering (unlike sort), keeping first entry
@@ -323,7 +328,14 @@ ifneq ($(nsl-build-debug),)
 $(info all-packages: $(all-packages))
 endif
 
-$(eval $(foreach p,$(all-packages),$(call package_deep_deps_calc,$p)))
+# Optional precomputed closures, as generated by
+# python -m gbs.plugin.nsl.repository.graph. Packages it defines skip the
+# recursive calculation.
+ifneq ($(NSL_DEPS_MK),)
+include $(NSL_DEPS_MK)
+endif
+
+$(eval $(foreach p,$(all-packages),$(if $(filter undefined,$(origin $p-deepdeps-unsorted)),$(call package_deep_deps_calc,$p))))
 
 ## This is the set of packages we'll build
 enabled-packages := $(top-package) $($(top-package)-deepdeps-unsorted)
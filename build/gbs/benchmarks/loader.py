@@ -0,0 +1,251 @@
+"""Benchmarks of the NSL Makefile interpreter and tree loader
+
+Runs against the real lib/ tree of the NSL checkout this plugin lives in,
+with on-disk caches disabled, so results only depend on the code and the
+host. Phases:
+
+- parse: read and nest every Makefile of the tree, from a cold parse cache,
+- interpret: evaluate every Makefile under each filter set,
+- resolve: expand the dependency closure of a few top partitions under each
+  filter set, with a freshly loaded repository,
+- expand: expand deeply nested variable references and function calls.
+
+Each phase reports its best wall time over a few repetitions, and its peak
+traced memory from one extra run under tracemalloc. Results are printed as
+JSON, and compared against a baseline written by an earlier run, e.g.
+
+    python benchmarks/loader.py -o before.json
+    ... change makefile.py ...
+    python benchmarks/loader.py -b before.json
+
+Baselines are host-specific and are not kept in the repository.
+"""
+
+from pathlib import Path
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# Cold, reproducible runs: no persistent cache, no tracing overhead
+os.environ["GBS_NSL_CACHE_DIR"] = "off"
+os.environ.pop("GBS_NSL_TRACE", None)
+
+import click
+
+from gbs.plugin.nsl import NslPlugin
+from gbs.plugin.nsl.repository.cache import ParseCache
+from gbs.plugin.nsl.repository.evaluation import (
+    LIBRARY_VARIABLES, PACKAGE_VARIABLES, evaluate, filter_context_vars,
+)
+from gbs.plugin.nsl.repository.makefile import Context, Makefile, Reader, parse_cache
+from gbs.plugin.nsl.repository.tree import NSLTreeLoader
+
+FORMAT = 1
+
+# Canonical gbs filter variables of the flows the tree is built for, turned
+# into NSL Makefile variables by NslPlugin.transform_filter_vars()
+FILTER_SETS = {
+    "simulation": {
+        "purpose": "simulation",
+        "simulation_engine": "ghdl_llvm",
+    },
+    "vivado": {
+        "purpose": "synthesis",
+        "vendor": "xilinx",
+        "family": "artix7",
+        "part": "xc7a35t",
+        "speed": "-1",
+        "synthesis_engine": "vivado",
+    },
+    "gowin": {
+        "purpose": "synthesis",
+        "vendor": "gowin",
+        "family": "gw1n",
+        "part": "GW1N-9",
+        "synthesis_engine": "gowin",
+    },
+    "ise": {
+        "purpose": "synthesis",
+        "vendor": "xilinx",
+        "family": "spartan6",
+        "part": "xc6slx9",
+        "speed": "-2",
+        "synthesis_engine": "ise",
+    },
+}
+
+# Top partitions with deep dependency closures
+DEFAULT_TOPS = (
+    "nsl_amba.stream_to_udp",
+    "nsl_bnoc.testing",
+    "nsl_usb.device",
+    "nsl_math.cordic",
+)
+
+# Nesting depth of the expand phase, well within the recursion limit
+EXPANSION_DEPTH = 150
+
+
+def default_lib() -> Path:
+    """lib/ of the NSL checkout holding this plugin"""
+    return Path(__file__).resolve().parents[3] / "lib"
+
+
+def makefiles(lib: Path) -> list[Path]:
+    return sorted(Path(d) / "Makefile"
+                  for d, _, names in os.walk(lib) if "Makefile" in names)
+
+
+def nsl_filter_sets() -> dict[str, dict[str, str]]:
+    plugin = NslPlugin()
+    return {name: plugin.transform_filter_vars(canonical)
+            for name, canonical in FILTER_SETS.items()}
+
+
+def phase_parse(lib: Path) -> int:
+    cache = ParseCache(lambda path, text: list(Reader(path, text)))
+    paths = makefiles(lib)
+    for path in paths:
+        Makefile(path, cache).structure()
+    return len(paths)
+
+
+def phase_interpret(lib: Path) -> int:
+    names = LIBRARY_VARIABLES + PACKAGE_VARIABLES
+    count = 0
+    for filter_vars in nsl_filter_sets().values():
+        context_vars = filter_context_vars(filter_vars)
+        for path in makefiles(lib):
+            evaluate(path, context_vars, names)
+            count += 1
+    return count
+
+
+def phase_resolve(lib: Path, tops: tuple[str, ...]) -> int:
+    count = 0
+    for filter_vars in nsl_filter_sets().values():
+        repository = NSLTreeLoader(lib).load()
+        seen = set()
+        pending = list(tops)
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            partition = repository.partition_lookup(name, filter_vars)
+            if partition is not None:
+                pending.extend(partition.deps)
+        count += len(seen)
+    return count
+
+
+def phase_expand(depth: int = EXPANSION_DEPTH, rounds: int = 20) -> int:
+    values = {"leaf": "a b c"}
+    # A chain of variables, each referencing the previous one
+    for i in range(depth):
+        values[f"v{i}"] = f"$(v{i - 1}) w{i}" if i else "$(leaf)"
+    # Function calls nested in each other's arguments
+    nested = "$(leaf)"
+    for i in range(depth // 2):
+        nested = f"$(subst w,W,$(filter a b w{i},{nested} w{i}))"
+
+    for _ in range(rounds):
+        context = Context(values)
+        context.variable(f"v{depth - 1}")
+        context.expand(nested)
+    return rounds
+
+
+def measure(function, repeat: int) -> dict:
+    """Best wall time over repeat runs, then peak memory of one more"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "items": items}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Phases slower or hungrier than the baseline, beyond tolerance"""
+    regressions = []
+    for name, result in results["phases"].items():
+        base = baseline.get("phases", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]:.6g} -> {result[metric]:.6g} "
+                                   f"(+{100 * (result[metric] / base[metric] - 1):.0f}%)")
+    return regressions
+
+
+@click.command()
+@click.option("-l", "--lib", type = click.Path(file_okay = False, exists = True), default = None,
+              help = "NSL lib/ directory, defaults to the one of this checkout")
+@click.option("-p", "--phase", "phases", multiple = True,
+              type = click.Choice(["parse", "interpret", "resolve", "expand"]),
+              help = "Phase to run, all by default")
+@click.option("-t", "--top", "tops", multiple = True, help = "Top partition of the resolve phase")
+@click.option("-r", "--repeat", type = int, default = 5, show_default = True)
+@click.option("-o", "--output", type = click.Path(dir_okay = False), help = "Write results there")
+@click.option("-b", "--baseline", type = click.Path(dir_okay = False, exists = True),
+              help = "Results of an earlier run to compare against")
+@click.option("--tolerance", type = float, default = 0.10, show_default = True,
+              help = "Relative slowdown or memory growth tolerated against the baseline")
+def main(lib, phases, tops, repeat, output, baseline, tolerance):
+    lib = Path(lib) if lib else default_lib()
+    tops = tuple(tops) or DEFAULT_TOPS
+    runs = {
+        "parse": lambda: phase_parse(lib),
+        "interpret": lambda: phase_interpret(lib),
+        "resolve": lambda: phase_resolve(lib, tops),
+        "expand": phase_expand,
+    }
+    # Later phases run with a warm process-wide parse cache
+    for path in makefiles(lib):
+        parse_cache().statements(path)
+
+    results = {
+        "format": FORMAT,
+        "host": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "phases": {name: measure(runs[name], repeat)
+                   for name in (phases or runs)},
+    }
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if output:
+        Path(output).write_text(text + "\n")
+
+    if baseline:
+        base = json.loads(Path(baseline).read_text())
+        if base.get("format") != FORMAT:
+            raise click.ClickException(f"{baseline}: unsupported baseline format")
+        regressions = compare(results, base, tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
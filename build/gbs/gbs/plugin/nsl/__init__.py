@@ -2,10 +2,13 @@
 
 Provides:
 - tree: NSL tree repository loader
-- cdc: CDC constraint generation dispatchers for Gowin and ISE
+- cdc: CDC constraint generation dispatchers for Gowin, ISE, Synplify and
+  Vivado, also callable from Make flows, see cdc.cli
 - filter_vars: legacy variable aliases for the NSL Makefile tree
+- trace: opt-in timing of the hot paths, see GBS_NSL_TRACE
 
-The CDC dispatchers activate when a netlist is generated (gowin-netlist or ise-netlist).
+The CDC dispatchers activate when a netlist is generated (gowin-netlist,
+ise-netlist, or synplify-netlist with GBS_NSL_SYNPLIFY_CDC set).
 """
 
 import sys
@@ -49,8 +52,12 @@ class NslPlugin(BasePlugin):
 
     def enumerate_backends(self):
         """Return NSL CDC backends"""
-        from .cdc import CdcIseBackend
-        return [CdcIseBackend()]
+        from .cdc import CdcIseBackend, CdcSynplifyBackend
+        from .cdc.synplify import enabled as synplify_enabled
+        backends = [CdcIseBackend()]
+        if synplify_enabled():
+            backends.append(CdcSynplifyBackend())
+        return backends
 
     def enumerate_repository_parsers(self):
         """Return NSL tree repository parser class"""
@@ -1,3 +1,4 @@
 from .gowin import CdcGowinDispatcher
 from .ise import CdcIseBackend
+from .synplify import CdcSynplifyBackend
 from .vivado import CdcVivadoDispatcher
@@ -0,0 +1,80 @@
+"""CDC constraint generation from the command line
+
+Runs the constraint generators of the CDC dispatchers in a single process,
+for the Make flows of build/tool/ that are not driven by gbs. Each command
+reads a netlist once and writes constraints to stdout, or to a file:
+
+    python -m gbs.plugin.nsl.cdc.cli ucf design.ndf < clocks.ccf > clocks.ucf
+    python -m gbs.plugin.nsl.cdc.cli gowin-sdc design.vg -o all.sdc
+    python -m gbs.plugin.nsl.cdc.cli synplify-sdc design.edf >> design.sdc
+
+ucf replaces support/ccf_ucf_gen and gowin-sdc support/gowin_sdc_auto.sh;
+the Gowin and ISE Make flows use them when NSL_CDC_NATIVE is set.
+synplify-sdc emits the rules support/synplify_sdc_gen disables, for iCE40
+cells only, so the iCEcube2 flow keeps calling that script until they are
+validated.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import sys
+
+
+def write_lines(lines: Iterable[str], output: Optional[str]) -> None:
+    """Write constraint lines to a file, or to stdout if output is None"""
+    text = ''.join(f'{line}\n' for line in lines)
+    if output is None:
+        sys.stdout.write(text)
+    else:
+        Path(output).write_text(text)
+
+
+if __name__ == "__main__":
+    import click
+
+    netlist_argument = click.argument(
+        "netlist", type = click.Path(dir_okay = False, exists = True, path_type = Path))
+    output_option = click.option(
+        "-o", "--output", type = click.Path(dir_okay = False), default = None,
+        help = "Write constraints there instead of stdout")
+
+    @click.group()
+    def cli():
+        pass
+
+    @cli.command()
+    @netlist_argument
+    @click.option("-c", "--ccf", "ccf_files", multiple = True,
+                  type = click.Path(dir_okay = False, exists = True, path_type = Path),
+                  help = "Clock constraint file, read from stdin if none is given")
+    @output_option
+    def ucf(netlist, ccf_files, output):
+        """ISE UCF constraints from an EDIF netlist and CCF clocks"""
+        from .ise import CdcIseConstraintTask
+
+        texts = [f.read_text() for f in ccf_files] if ccf_files else [sys.stdin.read()]
+        clocks = [clock for text in texts for clock in CdcIseConstraintTask.parse_ccf(text)]
+        lines, _, _ = CdcIseConstraintTask.generate(netlist, clocks)
+        write_lines(lines, output)
+
+    @cli.command("gowin-sdc")
+    @netlist_argument
+    @output_option
+    def gowin_sdc(netlist, output):
+        """Gowin SDC constraints from a Verilog netlist"""
+        from .gowin import CdcGowinConstraintTask
+
+        lines, _ = CdcGowinConstraintTask.generate_sdc(netlist)
+        write_lines(lines, output)
+
+    @cli.command("synplify-sdc")
+    @netlist_argument
+    @output_option
+    def synplify_sdc(netlist, output):
+        """Synplify SDC constraints from an EDIF netlist"""
+        from .synplify import CdcSynplifyConstraintTask
+
+        lines, _ = CdcSynplifyConstraintTask.generate_sdc(netlist)
+        write_lines(lines, output)
+
+    cli()
@@ -0,0 +1,146 @@
+"""Clock domains of registers, from EDIF connectivity
+
+ISE constrains resynchronization registers with one TIMESPEC per ordered
+pair of CCF clocks, most of which never exchange data. clock_pairs() finds
+the pairs that actually cross: for each register holding a marker, the
+clock of the register feeding its D input, and its own clock.
+
+A clock is the first CCF-named net found walking back from a register C
+pin through single-input clock buffers (IBUFG, BUFG...: an O output driven
+from an I input). Connectivity is read in one streaming pass over the
+netlist, keeping only output drivers and I, C and D inputs of instances.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import re
+
+from .scanner import CHUNK_SIZE, read_windows
+
+# Buffer levels walked back from a register clock pin at most
+MAX_BUFFERS = 8
+
+_FORMS = re.compile(
+    rb"\((?:(?P<contents>contents)\b"
+    rb"|(?P<kind>instance|net)\s+(?:\(rename\s+(?P<rid>[^\s()]+)\s+\"(?P<name>[^\"]*)\"|(?P<id>[^\s()]+))"
+    rb"|portRef\s+(?P<port>[^\s()]+)\s*(?:\(instanceRef\s+(?P<inst>[^\s()]+))?)")
+
+# Ports kept, by role
+_OUTPUTS = {b"O", b"Q"}
+_INPUTS = {b"I", b"C", b"D"}
+
+
+class Connectivity:
+    """Drivers and inputs of a flat EDIF netlist"""
+
+    def __init__(self):
+        # net -> (instance, output port) driving it
+        self.drivers: dict[bytes, tuple[bytes, bytes]] = {}
+        # (instance, input port) -> net
+        self.inputs: dict[tuple[bytes, bytes], bytes] = {}
+        # Marked instances
+        self.marked: list[bytes] = []
+        # CCF clock of nets named after one
+        self.clocks: dict[bytes, str] = {}
+        # Cells with contents
+        self.scopes = 0
+
+    @classmethod
+    def read(cls, path: Path, marker: str, clock_nets: Iterable[str],
+             chunk_size: int = CHUNK_SIZE) -> "Connectivity":
+        """Read the connectivity of a netlist
+
+        Args:
+            path: EDIF netlist
+            marker: Fragment of the original name of instances to list
+            clock_nets: CCF clock net names
+        """
+        result = cls()
+        marker = marker.encode()
+        wanted = {name.encode(): name for name in clock_nets}
+        net = None
+        for window in read_windows(path, b"\n", chunk_size):
+            for m in _FORMS.finditer(window):
+                port = m.group("port")
+                if port is not None:
+                    instance = m.group("inst")
+                    if net is None or instance is None:
+                        continue
+                    if port in _OUTPUTS:
+                        result.drivers[net] = (instance, port)
+                    elif port in _INPUTS:
+                        result.inputs[(instance, port)] = net
+                    continue
+
+                if m.group("contents"):
+                    result.scopes += 1
+                    continue
+
+                identifier = m.group("rid") or m.group("id")
+                name = m.group("name")
+                if m.group("kind") == b"net":
+                    net = identifier
+                    clock = wanted.get(name) or wanted.get(identifier)
+                    if clock is not None:
+                        result.clocks[net] = clock
+                else:
+                    net = None
+                    if marker in (name or identifier):
+                        result.marked.append(identifier)
+        return result
+
+    def clock(self, net: Optional[bytes]) -> Optional[str]:
+        """CCF clock a net is buffered from, if any"""
+        for _ in range(MAX_BUFFERS + 1):
+            if net is None:
+                return None
+            clock = self.clocks.get(net)
+            if clock is not None:
+                return clock
+            driver = self.drivers.get(net)
+            if driver is None or driver[1] != b"O":
+                return None
+            net = self.inputs.get((driver[0], b"I"))
+        return None
+
+    def crossing(self, instance: bytes) -> Optional[tuple[str, str]]:
+        """(source clock, destination clock) of a register, if resolved"""
+        destination = self.clock(self.inputs.get((instance, b"C")))
+        driver = self.drivers.get(self.inputs.get((instance, b"D")))
+        if destination is None or driver is None or driver[1] != b"Q":
+            return None
+        source = self.clock(self.inputs.get((driver[0], b"C")))
+        if source is None:
+            return None
+        return source, destination
+
+
+def clock_pairs(path: Path, marker: str, clock_nets: Iterable[str],
+                chunk_size: int = CHUNK_SIZE) -> Optional[set[tuple[str, str]]]:
+    """Clock pairs crossed by the registers holding a marker
+
+    Args:
+        path: EDIF netlist
+        marker: Fragment of the names of the registers
+        clock_nets: CCF clock net names
+
+    Returns:
+        (source clock, destination clock) pairs of distinct clocks, or
+        None when any register could not be resolved, or when the netlist
+        is hierarchical, as identifiers are then relative to their cell
+    """
+    connectivity = Connectivity.read(path, marker, clock_nets, chunk_size)
+    if connectivity.scopes > 1:
+        return None
+
+    pairs = set()
+    for instance in connectivity.marked:
+        if (instance, b"C") not in connectivity.inputs:
+            # Not a register, e.g. logic named after one
+            continue
+        pair = connectivity.crossing(instance)
+        if pair is None:
+            return None
+        if pair[0] != pair[1]:
+            pairs.add(pair)
+    return pairs
@@ -15,12 +15,12 @@ This backend:
 1. Runs after Gowin synthesis
 2. Reads the generated netlist file
 3. Searches for NSL TIG patterns
-4. Generates set_false_path constraints
+4. Generates set_false_path constraints, on the pins of the marked
+   instances of the netlist, or on wildcards where they cannot be listed
 5. Adds the SDC file to the fileset for PnR
 """
 
 from pathlib import Path
-import re
 from typing import Any
 import sys
 
@@ -28,10 +28,28 @@ from gbs.base import *
 from gbs.build.context import BuildContext
 from gbs.build.task import Task, ResourceTypology
 
+from ..trace import traced
+from .scanner import verilog_marked_pins
+from .sdc import false_paths
+
 
 class CdcGowinConstraintTask(Task):
     """Generate NSL CDC constraints from Gowin netlist"""
 
+    # NSL TIG patterns and their corresponding SDC constraints
+    # Each pattern is (netlist marker, pin_type, pin_name)
+    PATTERNS = [
+        ('tig_reg_clr', 'to', 'CLEAR'),
+        ('tig_reg_pre', 'to', 'PRE'),
+        ('tig_reg_q', 'from', 'O'),
+        ('tig_reg_q', 'from', 'Q'),
+        ('tig_static_reg', 'from', 'Q'),
+        ('tig_static_reg', 'to', 'D'),
+        ('cross_region_reg', 'to', 'D'),
+        ('async_net', 'to', 'D'),
+        ('async_net', 'from', 'Q'),
+    ]
+
     def __init__(
         self,
         dispatcher,
@@ -46,6 +64,25 @@ class CdcGowinConstraintTask(Task):
             description="Generate NSL CDC constraints"
         )
 
+    @classmethod
+    def generate_sdc(cls, netlist_file: Path):
+        """SDC constraint lines for a Gowin netlist, after 3 header lines
+
+        The netlist is scanned once for all patterns, without loading it.
+
+        Returns:
+            The lines, and the marked pins they name, see sdc.false_paths()
+        """
+        constraints = [
+            "# NSL CDC Constraints",
+            f"# Generated from {netlist_file.name}",
+            "",
+        ]
+        paths, marked = false_paths(netlist_file, cls.PATTERNS, verilog_marked_pins)
+        constraints.extend(paths)
+        return constraints, marked
+
+    @traced("CdcGowinConstraintTask.work")
     async def work(self):
         """Generate SDC constraints by parsing netlist"""
         netlist, = self.inputs
@@ -56,35 +93,9 @@ class CdcGowinConstraintTask(Task):
 
         self.info(f"Generating NSL CDC constraints from {netlist_file}")
 
-        netlist_content = netlist_file.read_text()
-
-        # Generate constraints
-        constraints = []
-
-        # NSL TIG patterns and their corresponding SDC constraints
-        # Each pattern is (regex_pattern, pin_type, pin_name)
-        patterns = [
-            (r'tig_reg_clr', 'to', 'CLEAR'),
-            (r'tig_reg_pre', 'to', 'PRE'),
-            (r'tig_reg_q', 'from', 'O'),
-            (r'tig_reg_q', 'from', 'Q'),
-            (r'tig_static_reg', 'from', 'Q'),
-            (r'tig_static_reg', 'to', 'D'),
-            (r'cross_region_reg', 'to', 'D'),
-            (r'async_net', 'to', 'D'),
-            (r'async_net', 'from', 'Q'),
-        ]
-
-        constraints.append("# NSL CDC Constraints")
-        constraints.append(f"# Generated from {netlist_file.name}")
-        constraints.append("")
-
-        # Check each pattern and generate constraints
-        for pattern, direction, pin_name in patterns:
-            if re.search(pattern, netlist_content):
-                constraint = f"set_false_path -{direction} [get_pins {{*{pattern}*/{pin_name}}}]"
-                constraints.append(constraint)
-                self.debug(f"Added constraint: {constraint}")
+        constraints, marked = self.generate_sdc(netlist_file)
+        if marked is not None and marked.hierarchical:
+            self.info("Hierarchical netlist, using wildcard constraints")
 
         # Write SDC file
         sdc_file.parent.mkdir(parents=True, exist_ok=True)
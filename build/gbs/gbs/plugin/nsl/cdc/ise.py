@@ -16,7 +16,9 @@ This dispatcher:
 2. Reads the generated EDIF netlist
 3. Reads NSL CCF (clock constraint file) for clock definitions
 4. Searches for NSL TIG patterns in netlist
-5. Generates UCF constraints with TIG timespecs and cross-domain paths
+5. Generates UCF constraints with TIG timespecs and cross-domain paths,
+   grouping the pins of the marked instances of the netlist, or wildcards
+   where they cannot be listed
 6. Adds the UCF file to the fileset for NGDBUILD
 """
 
@@ -29,10 +31,34 @@ from gbs.base import *
 from gbs.build.context import BuildContext
 from gbs.build.task import Task, ResourceTypology
 
+from ..trace import traced
+from .edif import clock_pairs
+from .scanner import edif_marked_pins, scan_markers, wildcards_only
+
 
 class CdcIseConstraintTask(Task):
     """Generate NSL CDC UCF constraints from ISE EDIF netlist and CCF files"""
 
+    # Netlist marker and pin of each pattern of generate_ucf_constraints()
+    TIG_PINS = {
+        'tig_clr': ('tig_reg_clr', 'CLR'),
+        'tig_pre': ('tig_reg_pre', 'PRE'),
+        'tig_d': ('tig_reg_d', 'D'),
+        'tig_q': ('tig_reg_q', 'Q'),
+#        'tig_static_d': ('tig_static_reg_d', None),
+        'ff_cross': ('cross_region_reg_d', 'D'),
+    }
+
+    # TPTHRU group of each pattern
+    TIG_GROUPS = {
+        'tig_clr': 'ff_tig_clr',
+        'tig_pre': 'ff_tig_pre',
+        'tig_d': 'ff_tig_d',
+        'tig_q': 'ff_tig_q',
+#        'tig_static_d': 'ff_tig_static_d',
+        'ff_cross': 'ff_cross',
+    }
+
     def __init__(
         self,
         dispatcher,
@@ -47,6 +73,7 @@ class CdcIseConstraintTask(Task):
             description="Generate NSL CDC UCF constraints for ISE"
         )
 
+    @traced("CdcIseConstraintTask.work")
     async def work(self):
         """Generate UCF constraints by parsing netlist and CCF files"""
 
@@ -76,11 +103,6 @@ class CdcIseConstraintTask(Task):
             output_ucf_file.write_text("")
             return
 
-        edif_content = edif_file.read_text()
-
-        # Check for TIG patterns in netlist
-        patterns = self.check_tig_patterns(edif_content)
-
         # Parse all CCF files
         clocks = []
         for ccf_resource in ccf_resources:
@@ -96,7 +118,12 @@ class CdcIseConstraintTask(Task):
             return
 
         # Generate constraints
-        constraint_lines = self.generate_ucf_constraints(clocks, patterns)
+        constraint_lines, patterns, pairs = self.generate(edif_file, clocks)
+        if patterns['ff_cross'] and len(clocks) > 1:
+            if pairs is None:
+                self.info("Clock domains of resync registers unresolved, constraining all clock pairs")
+            else:
+                self.debug(f"Resync registers cross {len(pairs)} clock pairs")
 
         # Write UCF file
         output_ucf_file.parent.mkdir(parents=True, exist_ok=True)
@@ -109,6 +136,30 @@ class CdcIseConstraintTask(Task):
         )
 
 
+    @classmethod
+    def generate(cls, edif_file: Path, clocks):
+        """UCF constraint lines for an EDIF netlist and CCF clocks
+
+        The netlist is scanned for TIG patterns and their pins, then for the
+        clock pairs resynchronization registers cross, see
+        generate_ucf_constraints().
+
+        Returns:
+            Constraint lines, patterns found, and clock pairs or None
+        """
+        if wildcards_only():
+            patterns, pins = cls.check_tig_patterns(edif_file), None
+        else:
+            patterns, pins = cls.tig_pins(edif_file)
+
+        # Clock pairs resynchronization registers actually cross
+        pairs = None
+        if patterns['ff_cross'] and len(clocks) > 1:
+            marker, _ = cls.TIG_PINS['ff_cross']
+            pairs = clock_pairs(edif_file, marker, (net for net, _ in clocks))
+
+        return cls.generate_ucf_constraints(clocks, patterns, pins, pairs), patterns, pairs
+
     @classmethod
     def sanitize_token(cls, name: str):
         """Convert a net name to a valid UCF token by replacing non-alphanumeric chars with underscore"""
@@ -137,28 +188,53 @@ class CdcIseConstraintTask(Task):
         return clocks
 
     @classmethod
-    def check_tig_patterns(cls, edif_content: str):
-        """Check which TIG patterns exist in the EDIF netlist"""
-        return {
-            'tig_clr': 'tig_reg_clr' in edif_content,
-            'tig_pre': 'tig_reg_pre' in edif_content,
-            'tig_d': 'tig_reg_d' in edif_content,
-            'tig_q': 'tig_reg_q' in edif_content,
-#            'tig_static_d': 'tig_static_reg_d' in edif_content,
-            'ff_cross': 'cross_region_reg_d' in edif_content,
-        }
+    def check_tig_patterns(cls, edif_file: Path):
+        """Check which TIG patterns exist in the EDIF netlist
+
+        The netlist is streamed, never loaded whole, see scanner.
+        """
+        found = scan_markers(edif_file, (marker for marker, _ in cls.TIG_PINS.values()))
+        return {name: marker in found for name, (marker, _) in cls.TIG_PINS.items()}
+
+    @classmethod
+    def tig_pins(cls, edif_file: Path):
+        """Check which TIG patterns exist, and list the pins they apply to
+
+        Returns:
+            The patterns as returned by check_tig_patterns(), and a dict of
+            pattern_name -> sorted instance names, or None for patterns
+            whose instances cannot be listed. A pattern whose marker only
+            occurs on instances lacking its pin is reported missing.
+        """
+        marked = edif_marked_pins(edif_file, (marker for marker, _ in cls.TIG_PINS.values()))
+        patterns = {}
+        pins = {}
+        for name, (marker, pin) in cls.TIG_PINS.items():
+            instances = marked.pins(marker, pin) if marker in marked.present else []
+            patterns[name] = instances is None or bool(instances)
+            pins[name] = instances
+        return patterns, pins
 
     @classmethod
     def generate_ucf_constraints(
             cls,
             clocks,
-            patterns
+            patterns,
+            pins = None,
+            pairs = None
     ):
         """Generate UCF constraint lines from clocks and TIG patterns
 
         Args:
             clocks: List of (net_name, period_ns) tuples from CCF
             patterns: Dict of pattern_name -> bool indicating which patterns exist
+            pins: Optional dict of pattern_name -> instance names the pattern
+                applies to, as returned by tig_pins(). Patterns without
+                instance names are grouped with a wildcard.
+            pairs: Optional set of (source net, destination net) clock pairs
+                crossed by resynchronization registers, as returned by
+                edif.clock_pairs(). Resync timespecs are emitted for every
+                ordered pair of clocks when None.
 
         Returns:
             List of UCF constraint lines
@@ -166,18 +242,15 @@ class CdcIseConstraintTask(Task):
         lines = []
 
         # Generate PIN TPTHRU definitions for detected patterns
-        if patterns['tig_clr']:
-            lines.append('PIN "*tig_reg_clr*.CLR" TPTHRU = "ff_tig_clr";')
-        if patterns['tig_pre']:
-            lines.append('PIN "*tig_reg_pre*.PRE" TPTHRU = "ff_tig_pre";')
-        if patterns['tig_d']:
-            lines.append('PIN "*tig_reg_d*.D" TPTHRU = "ff_tig_d";')
-        if patterns['tig_q']:
-            lines.append('PIN "*tig_reg_q*.Q" TPTHRU = "ff_tig_q";')
-#        if patterns['tig_static_d']:
-#            lines.append('PIN "*tig_static_reg_d*" TPTHRU = "ff_tig_static_d";')
-        if patterns['ff_cross']:
-            lines.append('PIN "*cross_region_reg_d*.D" TPTHRU = "ff_cross";')
+        for name, (marker, pin) in cls.TIG_PINS.items():
+            if not patterns[name]:
+                continue
+            group = cls.TIG_GROUPS[name]
+            instances = pins.get(name) if pins else None
+            if instances is None:
+                lines.append(f'PIN "*{marker}*.{pin}" TPTHRU = "{group}";')
+            else:
+                lines.extend(f'PIN "{instance}.{pin}" TPTHRU = "{group}";' for instance in instances)
 
         # Generate clock constraints and TIG timespecs for each clock
         for net, period in clocks:
@@ -209,6 +282,8 @@ class CdcIseConstraintTask(Task):
                 for j, (dest_net, dest_period) in enumerate(clocks):
                     if i == j:
                         continue
+                    if pairs is not None and (source_net, dest_net) not in pairs:
+                        continue
 
                     dest_token = cls.sanitize_token(dest_net)
 
@@ -0,0 +1,269 @@
+"""Streaming marker scanner for synthesized netlists
+
+NSL names the registers and nets needing timing exceptions with fixed
+fragments (tig_reg_q, cross_region_reg_d, async_net...), and the CDC
+dispatchers only emit the constraints whose marker shows up in the
+netlist. Netlists of large designs weigh hundreds of megabytes: loading
+them whole as text, then scanning them once per marker, costs as much
+memory as the netlist and as many passes as markers.
+
+scan_markers() reads a netlist once, by fixed-size chunks, and looks for
+every marker not found yet in each chunk. Chunks overlap by the length of
+the longest marker, so a marker split across two reads is still seen.
+Reading stops as soon as every marker was found.
+
+Each chunk is searched with the bytes substring search, once per pending
+marker: for a handful of literals over a chunk still in the CPU cache, it
+outruns a single-pass regex automaton in CPython.
+
+verilog_marked_pins() and edif_marked_pins() go further and list the
+instances whose name holds a marker, along with the pins connected on each,
+so that constraints can name them instead of relying on hierarchical
+wildcards. They read the netlist once as well, by chunks cut at statement
+boundaries, and only parse the statements a marker occurs in. Setting
+GBS_NSL_CDC_WILDCARD makes the dispatchers skip them and keep wildcards.
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+import os
+import re
+
+# Name fragments NSL gives to cells and nets needing timing exceptions
+MARKERS = (
+    "tig_reg_clr",
+    "tig_reg_pre",
+    "tig_reg_d",
+    "tig_reg_q",
+    "tig_static_reg",
+    "tig_static_reg_d",
+    "cross_region_reg",
+    "cross_region_reg_d",
+    "async_net",
+    "dpram_reg",
+)
+
+# Bytes read at once, bounds the memory used by a scan
+CHUNK_SIZE = 1 << 20
+
+
+def scan_markers(path: Path, markers: Iterable[str] = MARKERS,
+                 chunk_size: int = CHUNK_SIZE) -> set[str]:
+    """Markers occurring in a netlist file
+
+    Args:
+        path: Netlist to scan, in any ASCII-compatible encoding
+        markers: Fragments to look for
+        chunk_size: Bytes read at once
+
+    Returns:
+        The markers found
+    """
+    pending = {marker.encode(): marker for marker in markers}
+    found = set()
+    if not pending:
+        return found
+
+    overlap = max(len(needle) for needle in pending) - 1
+    tail = b""
+    with open(path, "rb") as f:
+        while pending:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            window = tail + data if tail else data
+            for needle in [n for n in pending if n in window]:
+                found.add(pending.pop(needle))
+            tail = window[-overlap:] if overlap else b""
+    return found
+
+
+# Longest space-separated name list put in a single constraint command
+COMMAND_LENGTH = 4000
+
+
+def wildcards_only() -> bool:
+    """Whether constraints should use marker wildcards, not instance names"""
+    return os.environ.get("GBS_NSL_CDC_WILDCARD", "") not in ("", "off", "0")
+
+
+class MarkedPins:
+    """Instances of a netlist whose name holds a marker, and their pins"""
+
+    def __init__(self, markers: Iterable[str]):
+        self.markers = tuple(markers)
+        # Markers occurring anywhere in the netlist
+        self.present: set[str] = set()
+        # marker -> instance name -> connected pins
+        self.instances: dict[str, dict[str, set[str]]] = {m: {} for m in self.markers}
+        # Modules or cells with contents the netlist defines
+        self.scopes = 0
+
+    @property
+    def hierarchical(self) -> bool:
+        """Whether instance names are relative to several scopes
+
+        Names are only known relative to the module or cell holding them,
+        without the instance path of that scope.
+        """
+        return self.scopes > 1
+
+    def add(self, instance: str, pins: Iterable[str]) -> None:
+        pins = set(pins)
+        for marker in self.markers:
+            if marker in instance:
+                self.instances[marker].setdefault(instance, set()).update(pins)
+
+    def pins(self, marker: str, pin: str) -> Optional[list[str]]:
+        """Sorted instances of a marker connecting a pin
+
+        Returns None when the instances cannot be listed precisely, and
+        the caller should fall back to a wildcard: the netlist is
+        hierarchical, the marker occurs without any instance holding it
+        being found, or the connections of one of its instances were not
+        seen.
+        """
+        if self.hierarchical:
+            return None
+        instances = self.instances[marker]
+        if marker in self.present and not instances:
+            return None
+        if not all(instances.values()):
+            return None
+        return sorted(name for name, pins in instances.items() if pin in pins)
+
+
+def _marker_regex(markers: Iterable[str], scope: bytes) -> re.Pattern:
+    alternatives = b"|".join(re.escape(m.encode()) for m in sorted(markers, key=len, reverse=True))
+    return re.compile(b"(?P<scope>" + scope + b")|(?P<marker>" + alternatives + b")", re.M)
+
+
+def read_windows(path: Path, separator: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Content of a file by chunks, each cut after a separator
+
+    A chunk grows past chunk_size until it holds a separator, so that
+    statements ending with one are never split.
+    """
+    carry = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            window = carry + data if carry else data
+            if not data:
+                if window:
+                    yield window
+                return
+            cut = window.rfind(separator) + 1
+            if not cut:
+                carry = window
+                continue
+            carry = window[cut:]
+            yield window[:cut]
+
+
+def _statements(path: Path, regex: re.Pattern, separator: bytes,
+                chunk_size: int) -> Iterator[tuple[str, bytes]]:
+    """Statements of a netlist matching regex, with the matching group name
+
+    Each statement is yielded once, for its first match.
+    """
+    for window in read_windows(path, separator, chunk_size):
+        last = -1
+        for m in regex.finditer(window):
+            start = window.rfind(separator, 0, m.start()) + 1
+            if start == last:
+                continue
+            last = start
+            end = window.find(separator, m.end())
+            yield m.lastgroup, window[start:end if end >= 0 else len(window)]
+
+
+_VERILOG_INSTANCE = re.compile(
+    rb"\A\s*(?:\w+\s+)??(?P<cell>[A-Za-z_][\w$]*)\s*(?:#\s*\(.*?\)\s*)?"
+    rb"(?P<name>\\\S+|[A-Za-z_][\w$]*)\s*\(", re.S)
+_VERILOG_PIN = re.compile(rb"\.(\w+)\s*\(")
+# A module header, at the start of a line. Statements are cut at ';', so
+# the header of every module but the first follows the previous endmodule.
+_VERILOG_MODULE = re.compile(rb"^\s*module\b", re.M)
+
+
+def verilog_marked_pins(path: Path, markers: Iterable[str] = MARKERS,
+                        chunk_size: int = CHUNK_SIZE) -> MarkedPins:
+    """Marked instances of a structural Verilog netlist (Gowin .vg)
+
+    Escaped identifiers are returned without their leading backslash, as
+    timing constraints name them.
+    """
+    result = MarkedPins(markers)
+    regex = _marker_regex(result.markers, _VERILOG_MODULE.pattern)
+    for _, statement in _statements(path, regex, b";", chunk_size):
+        text = statement.decode(errors="replace")
+        result.scopes += len(_VERILOG_MODULE.findall(statement))
+        result.present.update(m for m in result.markers if m in text)
+
+        m = _VERILOG_INSTANCE.match(statement)
+        if m is None or m.group("cell") in (b"module", b"wire", b"reg", b"assign",
+                                            b"input", b"output", b"inout", b"defparam"):
+            continue
+        name = m.group("name").decode(errors="replace")
+        if name.startswith("\\"):
+            name = name[1:]
+        result.add(name, (p.decode() for p in _VERILOG_PIN.findall(statement, m.end())))
+    return result
+
+
+_EDIF_INSTANCE = re.compile(
+    rb"\(instance\s+(?:\(rename\s+(?P<id>[^\s()]+)\s+\"(?P<name>[^\"]*)\"\s*\)|(?P<plain>[^\s()]+))")
+_EDIF_PORTREF = re.compile(
+    rb"\(portRef\s+(?P<port>[^\s()]+)\s+\(instanceRef\s+(?P<id>[^\s()]+)\s*\)")
+
+
+def edif_marked_pins(path: Path, markers: Iterable[str] = MARKERS,
+                     chunk_size: int = CHUNK_SIZE) -> MarkedPins:
+    """Marked instances of an EDIF netlist (ISE ngc2edif)
+
+    Instances are named by their original name, from their rename form if
+    any, as UCF constraints name them. Pins are taken from the portRef
+    forms connecting them. Connections are only seen if the EDIF
+    identifier of the instance holds the marker too, as renamed identifiers
+    usually do; pins() falls back to wildcards otherwise.
+    """
+    result = MarkedPins(markers)
+    regex = _marker_regex(result.markers, rb"\(contents\b")
+    names: dict[bytes, str] = {}
+    ports: dict[bytes, set[str]] = {}
+    for kind, line in _statements(path, regex, b"\n", chunk_size):
+        text = line.decode(errors="replace")
+        if kind == "scope" and "(contents" in text:
+            result.scopes += 1
+        result.present.update(m for m in result.markers if m in text)
+
+        for m in _EDIF_INSTANCE.finditer(line):
+            identifier = m.group("id") or m.group("plain")
+            names[identifier] = (m.group("name") or m.group("plain")).decode(errors="replace")
+        for m in _EDIF_PORTREF.finditer(line):
+            ports.setdefault(m.group("id"), set()).add(m.group("port").decode(errors="replace"))
+
+    for identifier, name in names.items():
+        result.add(name, ports.get(identifier, ()))
+    return result
+
+
+def name_lists(names: Iterable[str], limit: int = COMMAND_LENGTH) -> list[str]:
+    """Space-separated lists of names, each at most limit characters long
+
+    A name longer than limit gets a list of its own.
+    """
+    lists = []
+    current: list[str] = []
+    length = 0
+    for name in names:
+        if current and length + 1 + len(name) > limit:
+            lists.append(" ".join(current))
+            current = []
+            length = 0
+        length += len(name) + (1 if current else 0)
+        current.append(name)
+    if current:
+        lists.append(" ".join(current))
+    return lists
@@ -0,0 +1,59 @@
+"""SDC false-path constraints on NSL-marked netlist pins
+
+Shared by the SDC flavors (Gowin, Synplify): each rule is a (marker,
+direction, pin) triple, turned into set_false_path commands on the pins of
+the instances holding the marker, or on a *marker*/pin wildcard when they
+cannot be listed, see scanner.MarkedPins.pins().
+"""
+
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import re
+
+from .scanner import MarkedPins, name_lists, scan_markers, wildcards_only
+
+# (netlist marker, direction, pin name)
+Rule = tuple[str, str, str]
+
+
+def sdc_name(name: str) -> str:
+    """Netlist object name as a literal get_pins pattern"""
+    return re.sub(r'([][*?\\])', r'\\\1', name)
+
+
+def false_paths(netlist_file: Path, rules: Iterable[Rule],
+                extract: Callable[[Path, Iterable[str]], MarkedPins]
+                ) -> tuple[list[str], Optional[MarkedPins]]:
+    """set_false_path commands for the rules whose marker is in a netlist
+
+    Args:
+        netlist_file: Netlist to scan
+        rules: Rules, in output order
+        extract: Marked pin extractor for the netlist format, e.g.
+            scanner.verilog_marked_pins
+
+    Returns:
+        The commands, and the marked pins they name, None when only
+        wildcards are used
+    """
+    rules = list(rules)
+    markers = {marker for marker, _, _ in rules}
+    marked = None
+    if wildcards_only():
+        found = scan_markers(netlist_file, markers)
+    else:
+        marked = extract(netlist_file, markers)
+        found = marked.present
+
+    constraints = []
+    for marker, direction, pin_name in rules:
+        if marker not in found:
+            continue
+        instances = marked.pins(marker, pin_name) if marked else None
+        if instances is None:
+            lists = [f"*{marker}*/{pin_name}"]
+        else:
+            lists = name_lists(sdc_name(f"{instance}/{pin_name}") for instance in instances)
+        for pins in lists:
+            constraints.append(f"set_false_path -{direction} [get_pins {{{pins}}}]")
+    return constraints, marked
@@ -0,0 +1,179 @@
+"""NSL CDC Constraint Generator for Synplify
+
+Generates SDC timing constraints for NSL timing-insensitive constructs in
+iCE40 flows synthesized with Synplify (iCEcube2).
+
+Unlike support/synplify_sdc_gen, which exits before emitting its rules, this
+generator does emit constraints. They name the pins of the iCE40 SB_DFF*
+registers; Diamond and Radiant cells (FD1S3*, with CD, PD and CK pins) are
+not covered. Until the rules are validated on hardware, the backend is only
+registered when GBS_NSL_SYNPLIFY_CDC is set.
+
+NSL uses special naming patterns for signals that should be excluded from
+timing analysis:
+- tig_reg_clr: Registers with timing-ignored clear signals
+- tig_reg_pre: Registers with timing-ignored preset signals
+- tig_reg_d: Registers with timing-ignored data inputs
+- tig_reg_q: Registers with timing-ignored outputs
+
+This backend:
+1. Runs after Synplify synthesis
+2. Reads the generated EDIF netlist
+3. Searches for NSL TIG patterns
+4. Generates set_false_path constraints, on the pins of the marked
+   instances of the netlist, or on wildcards where they cannot be listed
+5. Adds the SDC file to the fileset for PnR
+"""
+
+from pathlib import Path
+from typing import Any
+import os
+import sys
+
+from gbs.base import *
+from gbs.build.context import BuildContext
+from gbs.build.task import Task, ResourceTypology
+
+from ..trace import traced
+from .scanner import edif_marked_pins
+from .sdc import false_paths
+
+
+def enabled() -> bool:
+    """Whether Synplify CDC constraints were opted in"""
+    return os.environ.get("GBS_NSL_SYNPLIFY_CDC", "") not in ("", "off", "0")
+
+
+class CdcSynplifyConstraintTask(Task):
+    """Generate NSL CDC constraints from Synplify EDIF netlist"""
+
+    # Each pattern is (netlist marker, pin_type, pin_name), pin names are
+    # those of SB_DFF* cells: R resets and S sets, synchronously or not
+    PATTERNS = [
+        ('tig_reg_clr', 'to', 'R'),
+        ('tig_reg_pre', 'to', 'S'),
+        ('tig_reg_d', 'to', 'D'),
+        ('tig_reg_q', 'from', 'Q'),
+    ]
+
+    def __init__(
+        self,
+        dispatcher,
+        inputs,
+        outputs
+    ):
+        super().__init__(
+            dispatcher,
+            "nsl_synplify_cdc_constraints",
+            inputs=inputs,
+            outputs=outputs,
+            description="Generate NSL CDC constraints for Synplify"
+        )
+
+    @classmethod
+    def generate_sdc(cls, edif_file: Path):
+        """SDC constraint lines for a Synplify EDIF netlist
+
+        Returns:
+            The lines, and the marked pins they name, see sdc.false_paths()
+        """
+        return false_paths(edif_file, cls.PATTERNS, edif_marked_pins)
+
+    @traced("CdcSynplifyConstraintTask.work")
+    async def work(self):
+        """Generate SDC constraints by parsing netlist"""
+        netlist, = self.inputs_of_type("synplify-netlist")
+        sdc, = self.outputs_of_type("synplify-sdc")
+
+        self.info(f"Generating NSL CDC constraints from {netlist.path}")
+
+        constraints, marked = self.generate_sdc(netlist.path)
+        if marked is not None and marked.hierarchical:
+            self.info("Hierarchical netlist, using wildcard constraints")
+
+        sdc.path.parent.mkdir(parents=True, exist_ok=True)
+        sdc.path.write_text(''.join(f'{c}\n' for c in constraints))
+
+        if constraints:
+            self.info(f"Generated {len(constraints)} NSL CDC constraints")
+        else:
+            self.info("No NSL TIG patterns found in netlist")
+
+
+class CdcSynplifyDispatcher(BaseDispatcher):
+    """NSL CDC constraint generation dispatcher for Synplify
+
+    Workflow:
+    1. Waits for Synplify EDIF netlist to be generated
+    2. Parses netlist for NSL TIG patterns
+    3. Generates SDC file with set_false_path constraints
+    4. Adds SDC file to fileset (Lattice backends pick it up for PnR)
+    """
+
+    def __init__(
+            self,
+            context,
+    ):
+        super().__init__(context, "nsl_cdc_synplify", tool_name = "nsl")
+        self._constraint_task = None
+
+    async def process(
+        self,
+    ):
+        """Process netlist and generate CDC constraints"""
+
+        # Only run once
+        if self._constraint_task:
+            return
+
+        netlist_files = list(self.context.filter_pending(file_type=["synplify-netlist"]))
+        if not netlist_files:
+            self.debug("No synplify-netlist resource in build")
+            return
+
+        # Use first netlist file
+        netlist_resource = netlist_files[0]
+
+        sdc_resource = self.context.get_resource(
+            self.context.output_path / "nsl_cdc_constraints.sdc",
+            file_type='synplify-sdc',
+            typology=ResourceTypology.INTERMEDIATE,
+            generated_by=self.name
+        )
+
+        self._constraint_task = CdcSynplifyConstraintTask(
+            dispatcher = self,
+            inputs=[],
+            outputs=[sdc_resource]
+        )
+        self._constraint_task.add_input(netlist_resource, consume = False)
+
+        self.info(f"Scheduled NSL CDC constraint generation to {sdc_resource.path}")
+
+
+class CdcSynplifyPass(BasePass):
+    name = "nsl-cdc-synplify"
+    input_types = {"synplify-netlist"}
+    output_types = {"synplify-sdc"}
+
+    def dispatchers(self, context):
+        return [CdcSynplifyDispatcher(context)]
+
+
+class CdcSynplifyBackend(BaseBackend):
+    def __init__(self):
+        super().__init__("gbs.plugin.nsl.cdc.synplify")
+
+    def contribute_passes(
+        self,
+        config,
+        output_types,
+        project_config,
+        gbs_config,
+    ):
+        passes = []
+
+        if output_types & {"synplify-sdc"}:
+            passes.append(CdcSynplifyPass(config))
+
+        return passes
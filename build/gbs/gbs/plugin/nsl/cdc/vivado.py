@@ -4,17 +4,34 @@ As vivado allows to inspect the netlist dynamically from TCL, we do
 not need to generate anything dynamically. We only need to inject a
 TCL file in the build.
 
+Resolving cross-region paths that way walks every register pin from TCL,
+which takes minutes on designs with thousands of them. With
+GBS_NSL_VIVADO_CDC=static, the dispatcher instead waits for a CDC report
+of the synthesized design (vivado-cdc-report), as written by
+
+    report_cdc -details -file nsl_cdc_report.txt
+
+and generates a constraint file listing the crossing pins, grouped by
+(source clock, destination clock): each pair gets one batched
+set_max_delay and set_bus_skew, and clock periods are looked up once per
+pair. Only the timing-ignore rules stay pattern queries.
+
+The plugin does not write the report, the flow has to. Without one, once
+a bitstream is pending, the TCL payload is used, with a warning.
 """
 
 from pathlib import Path
+import os
 import re
-from typing import Any
+from typing import Any, Iterable
 import sys
 
 from gbs.base import *
 from gbs.build.context import BuildContext
 from gbs.build.task import Task, ResourceTypology
 
+from ..trace import traced
+
 constraints_paylaod = r"""# -*- tcl -*-
 #
 # Here, we use a little (Vivado-specific ?) TCL to apply timing
@@ -134,6 +151,96 @@ foreach {bscan} [get_cells -hier {jtag_bscane2_inst}] {
 }
 """
 
+# Pattern queries of the TIG rules, shared by both modes
+_tig_payload = constraints_paylaod[:constraints_paylaod.index("## Cross-region")]
+_bscan_payload = constraints_paylaod[constraints_paylaod.index("foreach {bscan}"):]
+
+_REPORT_FROM = re.compile(r"^\s*From Clock:\s*(\S+)")
+_REPORT_TO = re.compile(r"^\s*To Clock:\s*(\S+)")
+_CROSS_REGION_PIN = re.compile(r"cross_region_reg_d.*/D$")
+_DPRAM_PIN = re.compile(r"dpram_reg.*/[^/]+$")
+
+
+def static_mode() -> bool:
+    """Whether constraints are generated from a CDC report"""
+    return os.environ.get("GBS_NSL_VIVADO_CDC", "") == "static"
+
+
+class CdcReport:
+    """Marked crossings of a Vivado CDC report, by clock pair"""
+
+    def __init__(self):
+        # (source clock, destination clock) -> cross-region register D pins
+        self.cross_region: dict[tuple[str, str], set[str]] = {}
+        # (source clock, destination clock) -> FF-RAM cells
+        self.dpram: dict[tuple[str, str], set[str]] = {}
+
+    @classmethod
+    def parse(cls, lines: Iterable[str]) -> "CdcReport":
+        """Read report_cdc -details output
+
+        Crossings are listed under "From Clock:" / "To Clock:" headers,
+        one per row, with source and destination as the last two columns
+        naming pins. Only the endpoints NSL constrains are kept: a
+        cross_region_reg_d D pin as destination, or a pin of a dpram_reg
+        cell as source.
+        """
+        report = cls()
+        source = destination = None
+        for line in lines:
+            m = _REPORT_FROM.match(line)
+            if m:
+                source, destination = m.group(1), None
+                continue
+            m = _REPORT_TO.match(line)
+            if m:
+                destination = m.group(1)
+                continue
+            if source is None or destination is None or source == destination:
+                continue
+            if "cross_region_reg_d" not in line and "dpram_reg" not in line:
+                continue
+
+            # Source and destination are the last two columns naming pins
+            pins = [token for token in line.split() if "/" in token]
+            if len(pins) < 2:
+                continue
+            start, end = pins[-2:]
+            pair = (source, destination)
+            if _CROSS_REGION_PIN.search(end):
+                report.cross_region.setdefault(pair, set()).add(end)
+            if _DPRAM_PIN.search(start):
+                report.dpram.setdefault(pair, set()).add(start.rsplit("/", 1)[0])
+        return report
+
+    def constraints(self) -> str:
+        """Constraint file applying the NSL rules to the listed crossings"""
+        lines = [_tig_payload.rstrip(), "", "## Cross-region resynchronization cells, from CDC report"]
+
+        def pair(source, destination, pins, period):
+            clocks = f"-from [get_clocks {{{source}}}] -to [get_clocks {{{destination}}}]"
+            return [
+                f"set pins {pins}",
+                f"set src_period [get_property -quiet -min PERIOD [get_clocks {{{source}}}]]",
+                f"set dst_period [get_property -quiet -min PERIOD [get_clocks {{{destination}}}]]",
+                f"set_max_delay {clocks} -through $pins ${period}_period -datapath_only",
+                f"set_bus_skew -quiet {clocks} -through $pins [expr min ($src_period, $dst_period)]",
+            ]
+
+        for (source, destination), pins in sorted(self.cross_region.items()):
+            query = f"[get_pins -quiet {{{' '.join(sorted(pins))}}}]"
+            lines += pair(source, destination, query, "src")
+
+        lines += ["", "## Dual-port rams, from CDC report"]
+        for (source, destination), cells in sorted(self.dpram.items()):
+            query = (f"[get_pins -quiet -filter {{DIRECTION == OUT}} "
+                     f"-of_objects [get_cells -quiet {{{' '.join(sorted(cells))}}}]]")
+            lines += pair(source, destination, query, "dst")
+
+        lines += ["", _bscan_payload.rstrip(), ""]
+        return "\n".join(lines)
+
+
 class CdcVivadoConstraintTask(Task):
     """Generate NSL TCL constraints for Vivado"""
 
@@ -150,14 +257,25 @@ class CdcVivadoConstraintTask(Task):
             description="Generate NSL CDC constraints for Vivado"
         )
 
+    @traced("CdcVivadoConstraintTask.work")
     async def work(self):
         """Generate TCL constraints"""
 
         resource, = self.outputs_of_type("xilinx-constraints-tcl")
 
+        reports = self.inputs_of_type("vivado-cdc-report")
+        if reports:
+            with open(reports[0].path, errors="replace") as f:
+                report = CdcReport.parse(f)
+            payload = report.constraints()
+            self.info(f"Constraining {len(report.cross_region)} cross-region and "
+                      f"{len(report.dpram)} FF-RAM clock pairs from {reports[0].path}")
+        else:
+            payload = constraints_paylaod
+
         resource.path.parent.mkdir(parents=True, exist_ok=True)
-        if not resource.path.exists() or resource.path.read_text() != constraints_paylaod:
-            resource.path.write_text(constraints_paylaod)
+        if not resource.path.exists() or resource.path.read_text() != payload:
+            resource.path.write_text(payload)
 
 class CdcVivadoDispatcher(BaseDispatcher):
     """NSL CDC constraint generation dispatcher for Vivado
@@ -175,7 +293,20 @@ class CdcVivadoDispatcher(BaseDispatcher):
     ):
         """Process netlist and generate CDC constraints"""
 
-        if not self._constraint_task and self.context.filter_pending(file_type="vivado-bitstream"):
+        if self._constraint_task:
+            return
+
+        reports = []
+        bitstreams = self.context.filter_pending(file_type="vivado-bitstream")
+        if static_mode():
+            # Static constraints need the CDC report of the synthesized design
+            reports = list(self.context.filter_pending(file_type="vivado-cdc-report"))
+            if not reports and bitstreams:
+                # Nothing may ever produce one, do not build unconstrained
+                self.warning("No vivado-cdc-report resource for static CDC constraints, "
+                             "resolving them from TCL instead")
+
+        if reports or bitstreams:
             # Define output file
             file = self.context.output_path / "nsl_cdc_constraints.tcl"
             resource = self.context.get_resource(
@@ -190,3 +321,5 @@ class CdcVivadoDispatcher(BaseDispatcher):
                 dispatcher = self,
                 outputs=[resource]
             )
+            if reports:
+                self._constraint_task.add_input(reports[0], consume = False)
@@ -0,0 +1,322 @@
+"""Declared versus actual partition dependencies
+
+Package Makefiles list their deps by hand, and many list partitions their
+VHDL never references. Each such dep pulls a whole partition and its
+closure into analysis and synthesis, and adds a false edge to the build
+DAG.
+
+The actual dependencies of a partition are derived from its VHDL sources
+with the design-unit scanner (see vhdl.DesignIndex): a partition uses
+another one when one of its files references a unit the other declares,
+through a use clause, a selected name or an instantiation.
+
+Only VHDL can be judged. A partition with other sources keeps all its
+deps, and a dep without VHDL sources is always considered used.
+"""
+
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import threading
+
+from .graph import DependencyGraph
+from .vhdl import DesignFile, DesignIndex
+
+
+def _vhdl_only(partition: "Partition") -> bool:
+    """Whether every source of a partition can be scanned"""
+    return bool(partition.sources) and all(s.file_type == "vhdl" for s in partition.sources)
+
+
+def _index(partitions: Iterable["Partition"]) -> tuple[DesignIndex, dict[int, str]]:
+    """Index the VHDL sources of partitions
+
+    Sources missing on disk (e.g. in unchecked-out submodules) are skipped.
+
+    Returns:
+        Index and id(DesignFile) -> owning partition name
+    """
+    files = []
+    owners = []
+    for partition in partitions:
+        library = partition.name.split(".", 1)[0]
+        for source in partition.sources:
+            if source.file_type == "vhdl" and source.path.exists():
+                files.append((library, source.path))
+                owners.append(partition.name)
+    index = DesignIndex(files)
+    return index, {id(f): owner for f, owner in zip(index.files, owners)}
+
+
+def _used(index: DesignIndex, owners: dict[int, str], partition_name: str) -> set[str]:
+    """Partitions declaring units the files of a partition use"""
+    used = set()
+    for design_file in index.files:
+        if owners[id(design_file)] != partition_name:
+            continue
+        for dep in index.elaboration_dependencies(design_file):
+            used.add(owners[id(dep)])
+    used.discard(partition_name)
+    return used
+
+
+class DependencyPruner:
+    """Pruned deps of the partitions of one filter set
+
+    Keeps a design index of the VHDL sources of every partition it was
+    given, so that partitions already indexed are pruned without scanning
+    their closure again. Units are resolved within the closure of each
+    partition, as if only it was indexed. Pruned deps are kept until a
+    partition changes, i.e. a lookup returns another object for it.
+
+    Deps are pruned against the closure as pruned: a partition whose unit
+    is used through a dep that no longer reaches it becomes a direct dep.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Partitions indexed, None for names that could not be looked up
+        self._partitions: dict[str, Optional["Partition"]] = {}
+        self._index = DesignIndex([])
+        self._owners: dict[int, str] = {}
+        # Partition name -> its indexed files
+        self._files: dict[str, list[DesignFile]] = {}
+        # Partition name -> pruned deps, for the current index
+        self._pruned: dict[str, set[str]] = {}
+
+    def pruned_deps(self, name: str, partitions: dict[str, Optional["Partition"]]) -> set[str]:
+        """Declared deps of a partition its sources need, see used_dependencies()
+
+        Args:
+            name: Partition to prune
+            partitions: The partition and its declared closure, as
+                currently looked up
+        """
+        with self.lock:
+            if any(n in self._partitions and self._partitions[n] is not p
+                   for n, p in partitions.items()):
+                self._partitions = {}
+                self._index = DesignIndex([])
+                self._owners = {}
+                self._files = {}
+                self._pruned = {}
+            for n, p in partitions.items():
+                if n not in self._partitions:
+                    self._partitions[n] = p
+                    if p is not None and _vhdl_only(p):
+                        self._add(p)
+            return set(self._pruned_deps(name))
+
+    def _add(self, partition: "Partition") -> None:
+        """Index the VHDL sources of a partition, see _index()"""
+        library = partition.name.split(".", 1)[0]
+        files = self._files.setdefault(partition.name, [])
+        for source in partition.sources:
+            if source.path.exists():
+                design_file = self._index.add(library, source.path)
+                self._owners[id(design_file)] = partition.name
+                files.append(design_file)
+
+    def _pruned_deps(self, name: str) -> set[str]:
+        pruned = self._pruned.get(name)
+        if pruned is None:
+            partition = self._partitions[name]
+            # Declared deps while this one is in progress, in case of cycles
+            self._pruned[name] = set(partition.deps)
+            pruned = self._prune(partition)
+            self._pruned[name] = pruned
+        return pruned
+
+    def _closure(self, names: Iterable[str]) -> set[str]:
+        """Names of the declared closure of partitions, themselves included"""
+        closure = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in closure:
+                continue
+            closure.add(name)
+            partition = self._partitions.get(name)
+            if partition is not None:
+                pending.extend(partition.deps)
+        return closure
+
+    def _used(self, partition: "Partition", closure: set[str]) -> Optional[set[str]]:
+        """Partitions of a closure the files of a partition use
+
+        None when the partition cannot be judged: it instantiates a
+        component bound to no entity of the closure.
+        """
+        def scope(design_file: DesignFile) -> bool:
+            return self._owners[id(design_file)] in closure
+
+        used = set()
+        for design_file in self._files.get(partition.name, ()):
+            if self._index.unbound_components(design_file, scope):
+                return None
+            for dep in self._index.elaboration_dependencies(design_file, scope):
+                used.add(self._owners[id(dep)])
+        used.discard(partition.name)
+        return used
+
+    def _prune(self, partition: "Partition") -> set[str]:
+        deps = set(partition.deps)
+        if not _vhdl_only(partition):
+            return deps
+
+        used = self._used(partition, self._closure([partition.name]))
+        if used is None:
+            return deps
+
+        # Partition of the pruned closure -> direct deps it is reachable through
+        through: dict[str, set[str]] = {}
+        kept = set()
+        for direct in sorted(deps):
+            dep = self._partitions.get(direct)
+            if dep is None or not _vhdl_only(dep):
+                kept.add(direct)
+            visited = set()
+            pending = [direct]
+            while pending:
+                name = pending.pop()
+                if name in visited:
+                    continue
+                visited.add(name)
+                through.setdefault(name, set()).add(direct)
+                if self._partitions.get(name) is not None:
+                    pending.extend(self._pruned_deps(name))
+
+        for name in used:
+            kept |= through.get(name, {name})
+        return kept
+
+
+def used_dependencies(partition: "Partition",
+                      lookup: Callable[[str], Optional["Partition"]],
+                      pruner: Optional[DependencyPruner] = None) -> set[str]:
+    """Declared dependencies of a partition its sources actually need
+
+    A declared dep is needed when the partition uses a unit of the dep or
+    of any partition in the dep's closure: a unit used without a direct
+    dep declaration must stay reachable. As deps of the closure are pruned
+    too, a used partition no dep reaches anymore is returned as a direct
+    dep. All deps are kept when the partition cannot be judged: it has
+    non-VHDL sources, or instantiates components bound to no indexed
+    entity.
+
+    Args:
+        partition: Partition to check
+        lookup: Partition lookup for its dependencies, as declared
+        pruner: Pruner of the filter set to reuse, see DependencyPruner
+    """
+    if not _vhdl_only(partition):
+        return set(partition.deps)
+
+    partitions = {partition.name: partition}
+    pending = list(partition.deps)
+    while pending:
+        name = pending.pop()
+        if name in partitions:
+            continue
+        partitions[name] = lookup(name)
+        if partitions[name] is not None:
+            pending.extend(partitions[name].deps)
+
+    if pruner is None:
+        pruner = DependencyPruner()
+    return pruner.pruned_deps(partition.name, partitions)
+
+class PartitionAudit:
+    """Declared and actual dependencies of a partition"""
+
+    def __init__(self, name: str, declared: set[str], used: Optional[set[str]],
+                 indirect: set[str]):
+        """
+        name: Partition name
+        declared: Dependencies listed in its Makefile
+        used: Partitions its VHDL references, None if it cannot be judged
+        indirect: Partitions it uses that are only reachable through the
+            closure of its declared deps
+        """
+        self.name = name
+        self.declared = declared
+        self.used = used
+        self.indirect = indirect
+
+    @property
+    def unused(self) -> set[str]:
+        """Declared deps the sources never reference"""
+        if self.used is None:
+            return set()
+        return self.declared - self.used
+
+    @property
+    def missing(self) -> set[str]:
+        """Referenced partitions not reachable through declared deps"""
+        if self.used is None:
+            return set()
+        return self.used - self.declared - self.indirect
+
+
+def audit_tree(repository: "NSLRepository", filter_vars: dict[str, str],
+               jobs: Optional[int] = None) -> list[PartitionAudit]:
+    """Audit every partition of a repository for one filter set
+
+    Args:
+        repository: NSL repository
+        filter_vars: Filter variables for Makefile evaluation
+        jobs: Worker processes for NSLRepository.expand_all()
+    """
+    names = sorted(repository.expand_all(filter_vars, jobs=jobs))
+    partitions = {}
+    for name in names:
+        partition = repository.partition_lookup(name, filter_vars, prune=False)
+        if partition is not None:
+            partitions[name] = partition
+
+    graph = DependencyGraph({name: p.deps for name, p in partitions.items()})
+    index, owners = _index(p for p in partitions.values() if _vhdl_only(p))
+
+    audits = []
+    for name, partition in partitions.items():
+        declared = set(partition.deps)
+        if not _vhdl_only(partition):
+            audits.append(PartitionAudit(name, declared, None, set()))
+            continue
+
+        used = _used(index, owners, name)
+        # Deps without VHDL are not indexed, assume they are needed
+        used |= {d for d in declared if d not in partitions or not _vhdl_only(partitions[d])}
+
+        reachable = set()
+        for dep in declared:
+            if dep in graph.ids:
+                reachable |= graph.deps_of(dep)
+        audits.append(PartitionAudit(name, declared, used, (used - declared) & reachable))
+    return audits
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.option("-s", "--set", "settings", type = str, multiple = True,
+                  help = "Filter variable, as name=value")
+    @click.option("-j", "--jobs", type = int, default = None)
+    @click.option("--indirect", is_flag = True,
+                  help = "Also report deps only reachable through other deps")
+    def audit(root, settings, jobs, indirect):
+        from .tree import NSLTreeLoader
+
+        filter_vars = dict([v.split('=', 1) for v in settings])
+        repository = NSLTreeLoader(Path(root)).load()
+        for result in audit_tree(repository, filter_vars, jobs = jobs):
+            for dep in sorted(result.unused):
+                print(f"{result.name}: unused {dep}")
+            for dep in sorted(result.missing):
+                print(f"{result.name}: missing {dep}")
+            if indirect:
+                for dep in sorted(result.indirect):
+                    print(f"{result.name}: indirect {dep}")
+
+    audit()
@@ -0,0 +1,166 @@
+"""On-disk caches for the NSL tree loader
+
+NSL Makefiles almost never change between two gbs runs, yet every run used
+to re-read and re-parse all of them. This module holds the persistent side
+of the loader: where cache files live and how parsed Makefiles are stored.
+
+The cache location is taken from ``GBS_NSL_CACHE_DIR``. It defaults to
+``$XDG_CACHE_HOME/gbs-nsl`` (``~/.cache/gbs-nsl``). Setting the variable to
+an empty string or to ``off`` disables on-disk caching altogether; the
+in-process layer is kept.
+
+A cache is only ever an accelerator: any I/O or decoding failure falls back
+to the uncached path.
+"""
+
+from pathlib import Path
+from typing import Callable, Optional
+import hashlib
+import os
+import pickle
+import tempfile
+
+from ..trace import count
+
+
+def cache_directory(name: str) -> Optional[Path]:
+    """Return the directory holding the cache called ``name``
+
+    Returns None if on-disk caching is disabled.
+    """
+    root = os.environ.get("GBS_NSL_CACHE_DIR")
+    if root is None:
+        xdg = os.environ.get("XDG_CACHE_HOME")
+        base = Path(xdg) if xdg else Path.home() / ".cache"
+        return base / "gbs-nsl" / name
+    if root in ("", "off", "0"):
+        return None
+    return Path(root) / name
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write ``data`` to ``path`` so that readers never see a partial file
+
+    Concurrent gbs processes may fill the same cache, the last rename wins.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class ParseCache:
+    """Cache of parsed Makefile statement lists, or of any per-file parse
+
+    Entries are keyed by the Makefile's resolved path. An entry is valid when
+    the file's mtime and size still match; if they do not, the content hash
+    is compared before parsing again, so a touched-but-unchanged file only
+    costs a read and a hash.
+
+    Two layers are kept: an in-process dictionary, so that a repository
+    building many Makefile objects for the same file only stats it, and an
+    optional directory of pickled entries shared across gbs invocations.
+
+    Path resolution is memoized in-process: a symlink retargeted while the
+    process runs is only followed again after forget().
+    """
+
+    # Bump whenever the Statement classes or the parser output change
+    FORMAT = 1
+
+    def __init__(self, parse: Callable[[Path, str], list], directory: Optional[Path] = None,
+                 name: str = "parse"):
+        """
+        parse: callable building a statement list from a path and its text
+        directory: where to persist entries, None for memory only
+        name: cache name in trace counters
+        """
+        self.name = name
+        self._parse = parse
+        self._directory = directory
+        self._memory: dict[Path, tuple[int, int, str, tuple]] = {}
+        # path as given -> resolved path
+        self._resolved: dict[Path, Path] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, path: Path) -> Path:
+        digest = hashlib.sha1(str(path).encode()).hexdigest()
+        return self._directory / f"{digest}.pickle"
+
+    def _load_entry(self, path: Path) -> Optional[tuple[int, int, str, tuple]]:
+        if self._directory is None:
+            return None
+        try:
+            with self._entry_path(path).open("rb") as f:
+                fmt, name, mtime_ns, size, digest, statements = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError,
+                TypeError, AttributeError, ImportError):
+            return None
+        if fmt != self.FORMAT or name != str(path):
+            return None
+        return mtime_ns, size, digest, statements
+
+    def _store_entry(self, path: Path, entry: tuple[int, int, str, tuple]) -> None:
+        self._memory[path] = entry
+        if self._directory is None:
+            return
+        data = pickle.dumps((self.FORMAT, str(path)) + entry, pickle.HIGHEST_PROTOCOL)
+        try:
+            write_atomic(self._entry_path(path), data)
+        except OSError:
+            pass
+
+    def statements(self, path: Path) -> list:
+        """Return the parsed statements of the Makefile at ``path``"""
+        return list(self.shared(path))
+
+    def shared(self, path: Path) -> tuple:
+        """Parsed statements of the Makefile at ``path``, shared
+
+        The same tuple is returned until the file changes, callers must not
+        modify its statements.
+        """
+        resolved = self._resolved.get(path)
+        if resolved is None:
+            resolved = self._resolved[path] = path.resolve()
+        path = resolved
+        st = path.stat()
+
+        entry = self._memory.get(path)
+        if entry is None:
+            entry = self._load_entry(path)
+        if entry is not None and entry[:2] == (st.st_mtime_ns, st.st_size):
+            self._memory[path] = entry
+            self.hits += 1
+            count(f"{self.name} cache hit")
+            return entry[3]
+
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if entry is not None and entry[2] == digest:
+            # Touched but unchanged: refresh the stat part of the key
+            self.hits += 1
+            count(f"{self.name} cache hit")
+            statements = entry[3]
+        else:
+            self.misses += 1
+            count(f"{self.name} cache miss")
+            statements = tuple(self._parse(path, raw.decode(errors="replace")))
+        self._store_entry(path, (st.st_mtime_ns, st.st_size, digest, statements))
+        return statements
+
+    def forget(self, path: Path) -> None:
+        """Drop the in-process entry for ``path``"""
+        resolved = path.resolve()
+        self._memory.pop(resolved, None)
+        for given in [p for p, r in self._resolved.items() if p == path or r == resolved]:
+            del self._resolved[given]
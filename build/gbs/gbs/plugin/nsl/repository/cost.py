@@ -0,0 +1,234 @@
+"""Partition cost hints and critical-path scheduling
+
+Analyzing unisim.vcomponents or xilinxcorelib costs orders of magnitude
+more than nsl_logic.bool, yet a scheduler picking ready partitions in name
+or discovery order may start the heavyweights last, and serialize the end
+of the build behind them.
+
+PartitionCost describes how expensive a partition is: its source bytes and
+file count, and the analysis time recorded by previous runs, if any.
+CostHistory keeps those times under the gbs-nsl cache directory.
+CriticalPathScheduler orders ready partitions by the length of the longest
+chain of work they block, heaviest chain first.
+
+Builds not driven by gbs can record times and print a schedule from the
+command line:
+
+    python -m gbs.plugin.nsl.repository.cost record lib unisim.vcomponents 41.5
+    python -m gbs.plugin.nsl.repository.cost schedule lib -s hwdep=simulation
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import atexit
+import json
+import os
+
+from .cache import cache_directory, write_atomic
+from .graph import DependencyGraph
+
+# Analysis throughput assumed before any time was recorded, in bytes/s
+DEFAULT_BYTES_PER_SECOND = 200_000
+
+# Fixed cost of analyzing one file, in seconds (process start, library I/O)
+FILE_OVERHEAD = 0.02
+
+
+class PartitionCost:
+    """Cost hints of a partition"""
+
+    __slots__ = ("_sources", "_source_bytes", "analysis_seconds")
+
+    def __init__(self, sources: Iterable[Path], analysis_seconds: Optional[float] = None):
+        """
+        sources: source files of the partition
+        analysis_seconds: analysis time recorded by previous runs
+        """
+        self._sources = list(sources)
+        self._source_bytes: Optional[int] = None
+        self.analysis_seconds = analysis_seconds
+
+    @property
+    def file_count(self) -> int:
+        return len(self._sources)
+
+    @property
+    def source_bytes(self) -> int:
+        """Total size of the sources, missing ones count as empty"""
+        if self._source_bytes is None:
+            total = 0
+            for path in self._sources:
+                try:
+                    total += os.stat(path).st_size
+                except OSError:
+                    pass
+            self._source_bytes = total
+        return self._source_bytes
+
+    def estimate(self, bytes_per_second: float = DEFAULT_BYTES_PER_SECOND) -> float:
+        """Expected analysis time in seconds, recorded time first"""
+        if self.analysis_seconds is not None:
+            return self.analysis_seconds
+        return self.file_count * FILE_OVERHEAD + self.source_bytes / bytes_per_second
+
+    def __repr__(self):
+        return (f"<PartitionCost files={self.file_count} bytes={self.source_bytes} "
+                f"seconds={self.analysis_seconds}>")
+
+
+class CostHistory:
+    """Analysis times of partitions, recorded across runs
+
+    Times are smoothed with an exponential moving average, so a single
+    slow run on a loaded host does not reorder every later build.
+    """
+
+    FORMAT = 1
+
+    # Weight of a new sample in the moving average
+    SMOOTHING = 0.3
+
+    def __init__(self, path: Optional[Path]):
+        """
+        path: JSON file holding the history, None to keep it in memory
+        """
+        self.path = path
+        # partition -> (seconds, source bytes when recorded)
+        self._times: dict[str, tuple[float, int]] = {}
+        self._dirty = False
+        if path is None:
+            return
+        try:
+            data = json.loads(path.read_text())
+            if data.get("format") == self.FORMAT:
+                self._times = {name: (float(s), int(b)) for name, (s, b) in data["times"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    def seconds(self, partition_name: str) -> Optional[float]:
+        """Smoothed analysis time of a partition, None if never recorded"""
+        entry = self._times.get(partition_name)
+        return None if entry is None else entry[0]
+
+    def record(self, partition_name: str, seconds: float, source_bytes: int = 0) -> None:
+        """Add an analysis time sample"""
+        previous = self.seconds(partition_name)
+        if previous is not None:
+            seconds = previous + self.SMOOTHING * (seconds - previous)
+        self._times[partition_name] = (seconds, source_bytes)
+        self._dirty = True
+
+    def bytes_per_second(self) -> float:
+        """Average throughput of recorded analyses, for unrecorded partitions"""
+        seconds = sum(s for s, b in self._times.values() if b)
+        total = sum(b for s, b in self._times.values() if b)
+        if seconds <= 0 or total <= 0:
+            return DEFAULT_BYTES_PER_SECOND
+        return total / seconds
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        data = json.dumps({"format": self.FORMAT, "times": self._times}, sort_keys=True)
+        try:
+            write_atomic(self.path, data.encode())
+        except OSError:
+            return
+        self._dirty = False
+
+
+_cost_history: Optional[CostHistory] = None
+
+def cost_history() -> CostHistory:
+    """Process-wide cost history, persisted under the gbs-nsl cache directory"""
+    global _cost_history
+    if _cost_history is None:
+        directory = cache_directory(f"cost-v{CostHistory.FORMAT}")
+        _cost_history = CostHistory(directory / "history.json" if directory else None)
+        atexit.register(_cost_history.save)
+    return _cost_history
+
+
+class CriticalPathScheduler:
+    """Longest-critical-path-first ordering of partitions
+
+    The priority of a partition is its own cost plus the heaviest chain of
+    partitions transitively waiting on it. Starting the highest priority
+    ready partition first keeps long chains, typically vendor libraries
+    everything else depends on, off the tail of a parallel build.
+    """
+
+    def __init__(self, graph: DependencyGraph, costs: dict[str, float]):
+        """
+        graph: Dependency graph of the partitions to build
+        costs: Estimated cost of each partition, missing ones cost nothing
+        """
+        dependents: dict[str, list[str]] = {name: [] for name in graph.names}
+        for name in graph.names:
+            for dep in graph.direct_deps(name):
+                dependents[dep].append(name)
+
+        # Dependents come later in topological order, walk it backwards
+        self.priorities: dict[str, float] = {}
+        for name in reversed(graph.order):
+            chain = max((self.priorities[d] for d in dependents[name]), default=0.0)
+            self.priorities[name] = costs.get(name, 0.0) + chain
+
+    def order(self, ready: Iterable[str]) -> list[str]:
+        """Ready partitions, the one to start first first
+
+        Ties are broken by name, for reproducible schedules.
+        """
+        return sorted(ready, key=lambda name: (-self.priorities.get(name, 0.0), name))
+
+    def critical_path(self) -> float:
+        """Lower bound of the build time with unlimited workers"""
+        return max(self.priorities.values(), default=0.0)
+
+
+if __name__ == "__main__":
+    import click
+
+    root_argument = click.argument(
+        "root", type = click.Path(dir_okay = True, file_okay = False, exists = True, path_type = Path))
+    settings_option = click.option(
+        "-s", "--set", "settings", type = str, multiple = True,
+        help = "Filter variable, as name=value")
+
+    def load(root, settings):
+        from .tree import NSLTreeLoader
+
+        return NSLTreeLoader(root).load(), dict([v.split('=', 1) for v in settings])
+
+    @click.group()
+    def cli():
+        pass
+
+    @cli.command()
+    @root_argument
+    @click.argument("partition", type = str)
+    @click.argument("seconds", type = float)
+    @settings_option
+    def record(root, partition, seconds, settings):
+        """Record the analysis time of a partition"""
+        repository, filter_vars = load(root, settings)
+        found = repository.partition_lookup(partition, filter_vars)
+        if found is None:
+            raise click.ClickException(f"No partition {partition}")
+        repository.record_analysis_time(found, seconds)
+
+    @cli.command()
+    @root_argument
+    @click.option("-t", "--top", "tops", type = str, multiple = True,
+                  help = "Partition the build needs, the whole tree if none")
+    @settings_option
+    @click.option("-j", "--jobs", type = int, default = None, help = "Worker processes")
+    def schedule(root, tops, settings, jobs):
+        """Partitions by decreasing critical-path priority, in seconds"""
+        repository, filter_vars = load(root, settings)
+        scheduler = repository.scheduler(filter_vars, tops or None, jobs)
+        for name in scheduler.order(scheduler.priorities):
+            print(f"{scheduler.priorities[name]:10.2f} {name}")
+        print(f"critical path: {scheduler.critical_path():.2f}s")
+
+    cli()
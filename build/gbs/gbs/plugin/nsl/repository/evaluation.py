@@ -0,0 +1,303 @@
+"""Makefile evaluation with filter-variable sensitivity
+
+Most NSL Makefiles never look at ``tool``, ``hwdep`` or ``target_part``, so
+evaluating them once per filter set is wasted work. Evaluations here record
+the variables they read, in the Makefile body as well as while expanding the
+requested results. Only the branches actually taken contribute reads. A
+result can then be reused for any filter set that agrees on those variables.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import glob
+import os
+
+from ..trace import count
+from .makefile import Batch, Makefile, Context
+from .store import Dependency, stat_dependency
+
+# A projection of a filter set: (variable, value or None if unset) pairs
+Projection = tuple[tuple[str, Optional[str]], ...]
+
+# Variables of a library Makefile listing its packages
+LIBRARY_VARIABLES = ("packages",)
+
+# Variables of a package Makefile the partition is built from
+PACKAGE_VARIABLES = (
+    "vhdl-sources",
+    "verilog-sources",
+    "systemverilog-sources",
+    "vhpidirect-sources",
+    "deps",
+)
+
+
+def filter_context_vars(filter_vars: dict) -> dict[str, str]:
+    """Filter variables as they are stored in a Makefile context"""
+    return {key: str(value) for key, value in filter_vars.items()}
+
+
+def glob_directory(pattern: str) -> Path:
+    """Deepest directory whose listing decides the result of a glob
+
+    The directory is normalized, as the pattern is by $(wildcard), see
+    fscache.DirectoryCache.glob().
+    """
+    parts = []
+    for part in Path(os.path.normpath(pattern)).parent.parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(os.path.normpath(Path.cwd().joinpath(*parts)))
+
+
+class Evaluation:
+    """Result of a Makefile evaluation"""
+
+    __slots__ = ("values", "projection", "directories", "dependencies")
+
+    def __init__(self, values: dict[str, str], projection: Projection,
+                 directories: tuple[Path, ...], dependencies: tuple[Dependency, ...]):
+        """
+        values: expanded value of each requested variable
+        projection: filter variables the result depends on
+        directories: directories whose content the result depends on,
+            through $(wildcard)
+        dependencies: state of the Makefile, then of directories, when
+            the evaluation was made
+        """
+        self.values = values
+        self.projection = projection
+        self.directories = directories
+        self.dependencies = dependencies
+
+    def globbed_unchanged(self) -> bool:
+        """Whether the directories the evaluation globbed are as they were"""
+        return all(stat_dependency(Path(path)) == (path, mtime_ns, size)
+                   for path, mtime_ns, size in self.dependencies[1:])
+
+
+def _dependencies(makefile_stat: Dependency, directories: tuple[Path, ...]
+                  ) -> tuple[Dependency, ...]:
+    return (makefile_stat,) + tuple(stat_dependency(d) for d in directories)
+
+
+def evaluate(makefile_path: Path, filter_vars: dict[str, str],
+             names: Iterable[str]) -> Evaluation:
+    """Interpret a Makefile and expand some of its variables
+
+    Args:
+        makefile_path: Makefile to interpret
+        filter_vars: Initial context, as returned by filter_context_vars
+        names: Variables to expand after interpretation
+
+    As in build.mk, srcdir is the Makefile's directory, and relative
+    $(wildcard) patterns are resolved against it.
+    """
+    count("evaluations per Makefile", key=str(makefile_path))
+    context = Context(filter_vars)
+    context["srcdir"] = str(makefile_path.parent.absolute())
+    context.directory = makefile_path.parent
+    reads = context.track_reads()
+    makefile_stat = stat_dependency(makefile_path.resolve())
+
+    makefile = Makefile(makefile_path)
+    makefile.interpret(context)
+
+    values = {name: context.variable(name) for name in names}
+    projection = tuple(sorted((name, filter_vars.get(name)) for name in reads))
+    directories = tuple(sorted({glob_directory(g) for g in context.globs}))
+    return Evaluation(values, projection, directories, _dependencies(makefile_stat, directories))
+
+
+def evaluate_many(makefile_path: Path, filter_sets: list[dict[str, str]],
+                  names: Iterable[str]) -> list[Evaluation]:
+    """Equivalent of evaluate() for several filter sets, in one walk
+
+    Statements are evaluated once per group of filter sets that agree on
+    every variable read so far, see makefile.Batch.
+
+    Returns:
+        One evaluation per filter set, in order
+    """
+    names = tuple(names)
+    count("evaluations per Makefile", len(filter_sets), key=str(makefile_path))
+    srcdir = str(makefile_path.parent.absolute())
+    makefile_stat = stat_dependency(makefile_path.resolve())
+    batch = Batch([dict(fv, srcdir=srcdir) for fv in filter_sets], track_reads=True,
+                  directory=makefile_path.parent)
+    batch.interpret(Makefile(makefile_path))
+
+    def expand(context):
+        return {name: context.variable(name) for name in names}
+
+    values = batch.run(expand)
+    contexts = batch.contexts()
+
+    evaluations = []
+    shared: dict[int, tuple] = {}
+    for filter_vars, context, v in zip(filter_sets, contexts, values):
+        if id(context) not in shared:
+            directories = tuple(sorted({glob_directory(g) for g in context.globs}))
+            shared[id(context)] = (
+                directories,
+                _dependencies(makefile_stat, directories),
+                sorted(context.reads),
+            )
+        directories, dependencies, reads = shared[id(context)]
+        projection = tuple((name, filter_vars.get(name)) for name in reads)
+        evaluations.append(Evaluation(v, projection, directories, dependencies))
+    return evaluations
+
+
+def evaluate_library(lib_path: Path, filter_vars: dict[str, str]
+                     ) -> list[tuple[Path, tuple[str, ...], Evaluation]]:
+    """Evaluate a library Makefile and the Makefiles of its packages
+
+    This is the unit of work of a whole-tree expansion. It only takes and
+    returns picklable data so that it can run in a worker process.
+
+    Returns:
+        (Makefile, requested variables, evaluation) for the library
+        Makefile, as a package list and as a bare partition, then for each
+        package Makefile
+    """
+    makefile_path = lib_path / "Makefile"
+    library = evaluate(makefile_path, filter_vars, LIBRARY_VARIABLES)
+    results = [
+        (makefile_path, LIBRARY_VARIABLES, library),
+        (makefile_path, PACKAGE_VARIABLES, evaluate(makefile_path, filter_vars, PACKAGE_VARIABLES)),
+    ]
+    for package in library.values["packages"].split():
+        package_makefile = lib_path / package / "Makefile"
+        if package_makefile.exists():
+            results.append((package_makefile, PACKAGE_VARIABLES,
+                            evaluate(package_makefile, filter_vars, PACKAGE_VARIABLES)))
+    return results
+
+
+class EvaluationMemo:
+    """Memo of Makefile evaluations, keyed by what they actually read
+
+    For every (Makefile, requested variables) pair, keeps a list of
+    evaluations. A lookup hits when the filter set agrees with one entry's
+    projection: interpretation is deterministic, so it would take the same
+    branches and produce the same values. Entries of a Makefile are dropped
+    when its stat changes, and an entry when the stat of a directory it
+    globbed changes.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple[Path, tuple[str, ...]],
+                            tuple[tuple[int, int], list[Evaluation]]] = {}
+        self._directories: dict[Path, set[Path]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _matches(projection: Projection, filter_vars: dict[str, str]) -> bool:
+        for name, value in projection:
+            if filter_vars.get(name) != value:
+                return False
+        return True
+
+    def cached(self, makefile_path: Path, filter_vars: dict[str, str],
+               names: tuple[str, ...]) -> Optional[Evaluation]:
+        """Still valid entry evaluate() would return, without evaluating"""
+        for evaluation in self._evaluations(makefile_path, names):
+            if self._matches(evaluation.projection, filter_vars):
+                return evaluation
+        return None
+
+    def evaluate(self, makefile_path: Path, filter_vars: dict[str, str],
+                 names: tuple[str, ...]) -> Evaluation:
+        """Memoized equivalent of the module-level evaluate()
+
+        The returned evaluation is shared, callers must not modify it.
+        """
+        evaluations = self._evaluations(makefile_path, names)
+        for evaluation in evaluations:
+            if self._matches(evaluation.projection, filter_vars):
+                self.hits += 1
+                count("evaluation memo hit")
+                return evaluation
+
+        self.misses += 1
+        count("evaluation memo miss")
+        evaluation = evaluate(makefile_path, filter_vars, names)
+        self._add(makefile_path, evaluations, evaluation)
+        return evaluation
+
+    def evaluate_many(self, makefile_path: Path, filter_sets: list[dict[str, str]],
+                      names: tuple[str, ...]) -> list[Evaluation]:
+        """Memoized equivalent of the module-level evaluate_many()
+
+        Filter sets without a matching entry are evaluated together in a
+        single batch.
+        """
+        evaluations = self._evaluations(makefile_path, names)
+        results: list[Optional[Evaluation]] = []
+        missing = []
+        for i, filter_vars in enumerate(filter_sets):
+            for evaluation in evaluations:
+                if self._matches(evaluation.projection, filter_vars):
+                    self.hits += 1
+                    count("evaluation memo hit")
+                    results.append(evaluation)
+                    break
+            else:
+                results.append(None)
+                missing.append(i)
+
+        if missing:
+            self.misses += len(missing)
+            count("evaluation memo miss", len(missing))
+            batch = evaluate_many(makefile_path, [filter_sets[i] for i in missing], names)
+            for i, evaluation in zip(missing, batch):
+                results[i] = evaluation
+                self._add(makefile_path, evaluations, evaluation)
+        return results
+
+    def add(self, makefile_path: Path, names: tuple[str, ...], evaluation: Evaluation) -> None:
+        """Record an evaluation made elsewhere, e.g. in a worker process"""
+        self._add(makefile_path, self._evaluations(makefile_path, names), evaluation)
+
+    def _evaluations(self, makefile_path: Path, names: tuple[str, ...]) -> list[Evaluation]:
+        """Still valid evaluations of a Makefile"""
+        st = makefile_path.stat()
+        stat_key = (st.st_mtime_ns, st.st_size)
+        key = (makefile_path, names)
+
+        cached = self._entries.get(key)
+        if cached is None or cached[0] != stat_key:
+            if cached is not None:
+                self._directories.pop(makefile_path, None)
+            cached = (stat_key, [])
+            self._entries[key] = cached
+        elif not all(evaluation.globbed_unchanged() for evaluation in cached[1]):
+            count("evaluation memo stale")
+            cached[1][:] = [e for e in cached[1] if e.globbed_unchanged()]
+        return cached[1]
+
+    def _add(self, makefile_path: Path, evaluations: list[Evaluation], evaluation: Evaluation) -> None:
+        evaluations.append(evaluation)
+        if evaluation.directories:
+            self._directories.setdefault(makefile_path, set()).update(evaluation.directories)
+
+    def forget(self, makefile_path: Path) -> None:
+        """Drop all entries of a Makefile, however its path was spelled"""
+        resolved = makefile_path.resolve()
+        for path in {k[0] for k in self._entries} | set(self._directories):
+            if path == makefile_path or path.resolve() == resolved:
+                for key in [k for k in self._entries if k[0] == path]:
+                    del self._entries[key]
+                self._directories.pop(path, None)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        self._entries.clear()
+        self._directories.clear()
+
+    def globbing(self, directory: Path) -> list[Path]:
+        """Makefiles an evaluation of which globbed directory"""
+        return [path for path, directories in self._directories.items() if directory in directories]
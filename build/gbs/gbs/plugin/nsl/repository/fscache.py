@@ -0,0 +1,117 @@
+"""Cached filesystem view for $(wildcard)
+
+Vendor libraries (unisim, simprim, machxo2) check for a .prepared marker
+with $(wildcard) on every evaluation. Going to the filesystem for each of
+them on every partition lookup is wasteful, as these directories hardly
+ever change during a gbs run.
+
+DirectoryCache keeps directory listings and glob results. A listing is
+revalidated by a stat of its directory: adding, removing or renaming an
+entry updates the directory mtime. A glob result is revalidated by the
+stat of every directory it listed.
+"""
+
+from pathlib import Path
+from typing import Optional
+import fnmatch
+import glob
+import os
+import re
+
+from ..trace import count
+
+
+class DirectoryCache:
+    """Directory listings and glob results with stat-based invalidation"""
+
+    def __init__(self):
+        # directory -> (mtime_ns, entry names)
+        self._listings: dict[str, tuple[int, frozenset[str]]] = {}
+        # pattern -> (((directory, mtime_ns), ...), matches)
+        self._globs: dict[str, tuple[tuple[tuple[str, int], ...], list[str]]] = {}
+        self._patterns: dict[str, re.Pattern] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _listing(self, directory: str, visited: list[tuple[str, int]]) -> Optional[frozenset[str]]:
+        """Entries of a directory, None if it is not one"""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            visited.append((directory, -1))
+            return None
+        visited.append((directory, mtime_ns))
+
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        try:
+            names = frozenset(os.listdir(directory))
+        except OSError:
+            names = None
+        if names is not None:
+            self._listings[directory] = (mtime_ns, names)
+        return names
+
+    def _valid(self, visited: tuple[tuple[str, int], ...]) -> bool:
+        for directory, mtime_ns in visited:
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                current = -1
+            if current != mtime_ns:
+                return False
+        return True
+
+    def _match(self, part: str, names: frozenset[str]) -> list[str]:
+        regex = self._patterns.get(part)
+        if regex is None:
+            regex = re.compile(fnmatch.translate(part))
+            self._patterns[part] = regex
+        # As for shell globs, only an explicit leading dot matches dot files
+        hidden = part.startswith(".")
+        return sorted(n for n in names if regex.match(n) and (hidden or not n.startswith(".")))
+
+    def glob(self, pattern: str) -> list[str]:
+        """Paths matching an absolute glob pattern
+
+        Supports the *, ? and [...] wildcards within path components, as
+        $(wildcard) does.
+        """
+        pattern = os.path.normpath(pattern)
+        cached = self._globs.get(pattern)
+        if cached is not None and self._valid(cached[0]):
+            self.hits += 1
+            count("wildcard cache hit")
+            return cached[1]
+        self.misses += 1
+        count("wildcard cache miss")
+
+        visited: list[tuple[str, int]] = []
+        parts = Path(pattern).parts
+        candidates = [parts[0]]
+        for part in parts[1:]:
+            matches = []
+            for candidate in candidates:
+                names = self._listing(candidate, visited)
+                if names is None:
+                    continue
+                if glob.has_magic(part):
+                    found = self._match(part, names)
+                else:
+                    found = [part] if part in names else []
+                matches.extend(os.path.join(candidate, name) for name in found)
+            candidates = matches
+
+        self._globs[pattern] = (tuple(visited), candidates)
+        return candidates
+
+
+_directory_cache: Optional[DirectoryCache] = None
+
+def directory_cache() -> DirectoryCache:
+    """Process-wide directory cache"""
+    global _directory_cache
+    if _directory_cache is None:
+        _directory_cache = DirectoryCache()
+    return _directory_cache
@@ -0,0 +1,207 @@
+"""Indexed partition dependency graph
+
+build.mk computes dependency closures with recursive Make functions
+(deep_deps, uniq, filter-out-many) that are quadratic or worse in the
+number of packages. This graph is built once per filter set instead:
+partitions get integer IDs, transitive closures are stored as bitsets (one
+Python int per partition) and a stable topological order is computed up
+front. "All deps of X" is then a single lookup and a compile order for any
+top set is a filter over the precomputed order.
+
+The graph can be emitted as a Makefile include, so the legacy Make flow
+can skip its own recursive evaluation (see NSL_DEPS_MK in build.mk).
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import heapq
+
+
+class DependencyCycle(Exception):
+    """Partitions depending on each other, no compile order exists"""
+    pass
+
+
+class DependencyGraph:
+    """Dependency DAG of a set of partitions
+
+    Partitions referenced as a dependency but absent from the input are
+    kept as nodes without dependencies, and reported by unresolved().
+    """
+
+    def __init__(self, deps: dict[str, Iterable[str]]):
+        """
+        deps: partition name -> names of partitions it directly depends on
+        """
+        names = set(deps)
+        for d in deps.values():
+            names.update(d)
+
+        self.names: list[str] = sorted(names)
+        self.ids: dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self._resolved = frozenset(deps)
+        self._deps: list[tuple[int, ...]] = [
+            tuple(sorted(self.ids[d] for d in deps.get(name, ()) if d != name))
+            for name in self.names
+        ]
+
+        self.order: list[str] = [self.names[i] for i in self._topological_order()]
+        self._position: dict[int, int] = {self.ids[name]: i for i, name in enumerate(self.order)}
+
+        # Deps always come first in topological order, their closure is known
+        self._closure: list[int] = [0] * len(self.names)
+        for name in self.order:
+            i = self.ids[name]
+            bits = 0
+            for d in self._deps[i]:
+                bits |= (1 << d) | self._closure[d]
+            self._closure[i] = bits
+
+        self._deps_cache: dict[int, frozenset[str]] = {}
+        self._dependents: Optional[list[int]] = None
+
+    def _topological_order(self) -> list[int]:
+        """Kahn's algorithm, ties broken by name for a stable order"""
+        dependents: list[list[int]] = [[] for _ in self.names]
+        pending = [len(d) for d in self._deps]
+        for i, deps in enumerate(self._deps):
+            for d in deps:
+                dependents[d].append(i)
+
+        ready = [i for i, count in enumerate(pending) if not count]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            i = heapq.heappop(ready)
+            order.append(i)
+            for j in dependents[i]:
+                pending[j] -= 1
+                if not pending[j]:
+                    heapq.heappush(ready, j)
+
+        if len(order) != len(self.names):
+            cyclic = sorted(self.names[i] for i, count in enumerate(pending) if count)
+            raise DependencyCycle(f"Circular dependency within {' '.join(cyclic)}")
+        return order
+
+    def unresolved(self) -> list[str]:
+        """Partitions that are depended upon but were not provided"""
+        return [name for name in self.names if name not in self._resolved]
+
+    def direct_deps(self, name: str) -> list[str]:
+        """Direct dependencies of a partition"""
+        return [self.names[d] for d in self._deps[self.ids[name]]]
+
+    def closure_bits(self, name: str) -> int:
+        """Transitive dependencies of a partition, as a bitset of IDs"""
+        return self._closure[self.ids[name]]
+
+    def depends_on(self, name: str, dep: str) -> bool:
+        """Whether name transitively depends on dep"""
+        return bool(self._closure[self.ids[name]] >> self.ids[dep] & 1)
+
+    def deps_of(self, name: str) -> frozenset[str]:
+        """Transitive dependencies of a partition, itself excluded"""
+        i = self.ids[name]
+        try:
+            return self._deps_cache[i]
+        except KeyError:
+            pass
+        deps = frozenset(self._names_of(self._closure[i]))
+        self._deps_cache[i] = deps
+        return deps
+
+    def dependents_bits(self, name: str) -> int:
+        """Partitions transitively depending on name, as a bitset of IDs"""
+        if self._dependents is None:
+            # Reverse topological order visits dependents before their deps
+            dependents = [0] * len(self.names)
+            for name_ in reversed(self.order):
+                i = self.ids[name_]
+                for d in self._deps[i]:
+                    dependents[d] |= (1 << i) | dependents[i]
+            self._dependents = dependents
+        return self._dependents[self.ids[name]]
+
+    def dependents_of(self, name: str) -> frozenset[str]:
+        """Partitions transitively depending on name, itself excluded"""
+        return frozenset(self._names_of(self.dependents_bits(name)))
+
+    def _names_of(self, bits: int) -> Iterable[str]:
+        while bits:
+            low = bits & -bits
+            yield self.names[low.bit_length() - 1]
+            bits ^= low
+
+    def _bits_of(self, tops: Iterable[str]) -> int:
+        bits = 0
+        for top in tops:
+            i = self.ids[top]
+            bits |= (1 << i) | self._closure[i]
+        return bits
+
+    def compile_order(self, tops: Iterable[str]) -> list[str]:
+        """Tops and their transitive dependencies, dependencies first"""
+        bits = self._bits_of(tops)
+        ids = []
+        while bits:
+            low = bits & -bits
+            ids.append(low.bit_length() - 1)
+            bits ^= low
+        ids.sort(key=self._position.__getitem__)
+        return [self.names[i] for i in ids]
+
+    def to_makefile(self, tops: Optional[Iterable[str]] = None) -> str:
+        """Render the graph as a Makefile include for build.mk
+
+        Defines, for every partition, the variables build.mk would
+        otherwise compute recursively: <partition>-deepdeps-unsorted and
+        <partition>-intradeps-unsorted. nsl-deps-order holds the
+        topological order.
+
+        Args:
+            tops: Restrict the output to these partitions and their deps
+        """
+        names = self.order if tops is None else self.compile_order(tops)
+        lines = [
+            "# Generated by gbs.plugin.nsl.repository.graph, do not edit",
+            "",
+            f"nsl-deps-order := {' '.join(names)}",
+            "",
+        ]
+        for name in names:
+            library = name.split(".", 1)[0]
+            deep = sorted(self.deps_of(name))
+            intra = sorted(d for d in self.direct_deps(name) if d.startswith(library + "."))
+            lines.append(f"{name}-deepdeps-unsorted := {' '.join(deep)}".rstrip())
+            lines.append(f"{name}-intradeps-unsorted := {' '.join(intra)}".rstrip())
+        return "\n".join(lines) + "\n"
+
+    def write_makefile(self, path: Path, tops: Optional[Iterable[str]] = None) -> None:
+        """Write to_makefile() to path, leaving it untouched if unchanged"""
+        content = self.to_makefile(tops)
+        if not path.exists() or path.read_text() != content:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.option("-s", "--set", "settings", type = str, multiple = True,
+                  help = "Filter variable, as name=value")
+    @click.option("-t", "--top", "tops", type = str, multiple = True,
+                  help = "Only emit this partition and its dependencies")
+    @click.option("-o", "--output", type = click.Path(dir_okay = False), required = True)
+    @click.option("-j", "--jobs", type = int, default = None)
+    def dump(root, settings, tops, output, jobs):
+        from .tree import NSLTreeLoader
+
+        filter_vars = dict([v.split('=', 1) for v in settings])
+        repository = NSLTreeLoader(Path(root)).load()
+        graph = repository.dependency_graph(filter_vars, jobs = jobs)
+        graph.write_makefile(Path(output), tops or None)
+
+    dump()
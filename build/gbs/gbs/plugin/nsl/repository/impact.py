@@ -0,0 +1,218 @@
+"""Changed-file impact analysis and test selection
+
+Maps files to the partitions they affect, and partitions to the test
+projects whose dependency closure includes them. Editing a single package
+source then only selects the handful of projects that actually build it
+instead of the whole suite.
+
+The mapping is conservative: a file is considered affecting a partition when
+it is one of its sources or one of the Makefiles it is evaluated from (the
+library Makefile affects every package of its library). A changed file that
+lives neither in the NSL tree nor in a test project (e.g. build scripts, the
+gbs plugin itself) selects every project. So does a file of the NSL tree no
+partition owns under any filter set: a .prepared marker or a new source read
+through $(wildcard), a header included by C sources, a new package.
+"""
+
+from pathlib import Path
+from typing import Iterable
+import subprocess
+
+from .graph import DependencyGraph
+from .evaluation import filter_context_vars
+
+
+class ImpactIndex:
+    """Reverse index from files to dependent partitions, for one filter set"""
+
+    def __init__(self, repository: "NSLRepository", filter_vars: dict[str, str]):
+        """
+        repository: NSL repository to index
+        filter_vars: Filter variables the partitions are evaluated with
+        """
+        self.graph: DependencyGraph = repository.dependency_graph(filter_vars)
+        self._owners: dict[Path, set[str]] = {}
+
+        for name in self.graph.names:
+            partition = repository.partition_lookup(name, filter_vars)
+            if partition is None:
+                continue
+            for source in partition.sources:
+                self._own(Path(source.path), name)
+            library, package = name.split(".", 1)
+            lib_path = repository.library_path(library)
+            self._own(lib_path / "Makefile", name)
+            if package != "_bare":
+                self._own(lib_path / package / "Makefile", name)
+
+    def _own(self, path: Path, partition_name: str) -> None:
+        self._owners.setdefault(path.resolve(), set()).add(partition_name)
+
+    def owners(self, path: Path) -> set[str]:
+        """Partitions a file directly belongs to"""
+        return self._owners.get(path.resolve(), set())
+
+    def affected(self, changed: Iterable[Path]) -> set[str]:
+        """Partitions owning a changed file, and all their dependents
+
+        Files without owners are ignored, see TestSelector.select().
+        """
+        bits = 0
+        for path in changed:
+            for name in self.owners(path):
+                bits |= (1 << self.graph.ids[name]) | self.graph.dependents_bits(name)
+        return {self.graph.names[i] for i in range(bits.bit_length()) if bits >> i & 1}
+
+
+class TestProject:
+    """A project of a gbs test suite, as far as dependencies go"""
+
+    def __init__(self, name: str, path: Path, deps: list[str], filter_sets: list[dict[str, str]]):
+        """
+        name: project name in the suite
+        path: project directory
+        deps: partitions the project root depends on
+        filter_sets: filter variables of each project output
+        """
+        self.name = name
+        self.path = path
+        self.deps = deps
+        self.filter_sets = filter_sets
+
+    @classmethod
+    def load(cls, name: str, path: Path) -> "TestProject":
+        import yaml
+
+        with (path / "project.gbs.yaml").open() as f:
+            project = yaml.safe_load(f) or {}
+
+        deps = list((project.get("root") or {}).get("deps") or [])
+        filter_sets = [dict(output.get("filter_vars") or {})
+                       for output in project.get("output") or []]
+        return cls(name, path, deps, filter_sets or [{}])
+
+
+def load_suite(suite_file: Path) -> list[TestProject]:
+    """Projects of a gbs test suite file"""
+    import yaml
+
+    with suite_file.open() as f:
+        suite = yaml.safe_load(f) or {}
+
+    return [TestProject.load(project["name"], (suite_file.parent / project["path"]).resolve())
+            for project in suite.get("projects") or []]
+
+
+class TestSelector:
+    """Selects the test projects affected by a set of changed files"""
+
+    def __init__(self, repository: "NSLRepository", projects: list[TestProject], transform=None):
+        """
+        repository: NSL repository the projects depend on
+        projects: projects of the suite
+        transform: callable deriving NSL Makefile variables from a project's
+            filter variables, e.g. NslPlugin.transform_filter_vars
+        """
+        self.repository = repository
+        self.projects = projects
+        self._transform = transform
+        self._indexes: dict[frozenset, ImpactIndex] = {}
+
+    def _filter_vars(self, filter_vars: dict[str, str]) -> dict[str, str]:
+        if self._transform is None:
+            return filter_vars
+        # Explicit project variables win over derived ones
+        merged = dict(self._transform(filter_vars))
+        merged.update(filter_vars)
+        return merged
+
+    def index(self, filter_vars: dict[str, str]) -> ImpactIndex:
+        """Impact index for a filter set, built once per distinct set"""
+        filter_vars = self._filter_vars(filter_vars)
+        key = frozenset(filter_context_vars(filter_vars).items())
+        index = self._indexes.get(key)
+        if index is None:
+            index = ImpactIndex(self.repository, filter_vars)
+            self._indexes[key] = index
+        return index
+
+    def select(self, changed: Iterable[Path]) -> list[TestProject]:
+        """Projects whose build may be affected by the changed files"""
+        changed = [Path(p).resolve() for p in changed]
+        root = Path(self.repository.root).resolve()
+
+        for path in changed:
+            if path.is_relative_to(root):
+                # May still change partitions, e.g. through $(wildcard)
+                if not any(self.index(filter_vars).owners(path)
+                           for project in self.projects for filter_vars in project.filter_sets):
+                    return list(self.projects)
+                continue
+            if any(path.is_relative_to(project.path) for project in self.projects):
+                continue
+            return list(self.projects)
+
+        selected = []
+        for project in self.projects:
+            if any(path.is_relative_to(project.path) for path in changed):
+                selected.append(project)
+                continue
+            for filter_vars in project.filter_sets:
+                index = self.index(filter_vars)
+                affected = index.affected(changed)
+                if any(dep in affected for dep in project.deps):
+                    selected.append(project)
+                    break
+        return selected
+
+
+def git_changed_files(since: str, cwd: Path) -> list[Path]:
+    """Files changed since a git revision, including uncommitted changes"""
+    top = subprocess.run(["git", "rev-parse", "--show-toplevel"], cwd=cwd,
+                         check=True, capture_output=True, text=True).stdout.strip()
+    names = subprocess.run(["git", "diff", "--name-only", since], cwd=top,
+                           check=True, capture_output=True, text=True).stdout.split("\n")
+    return [Path(top) / name for name in names if name]
+
+
+if __name__ == "__main__":
+    import click
+    import yaml
+
+    @click.command()
+    @click.argument("suite", type = click.Path(dir_okay = False, exists = True))
+    @click.argument("files", type = click.Path(), nargs = -1)
+    @click.option("-r", "--root", type = click.Path(file_okay = False, exists = True), required = True,
+                  help = "NSL library directory (lib/)")
+    @click.option("--since", type = str, default = None,
+                  help = "Take changed files from git diff against this revision")
+    @click.option("-o", "--output", type = click.Path(dir_okay = False), default = None,
+                  help = "Write a suite file restricted to the selected projects")
+    def select(suite, files, root, since, output):
+        from .tree import NSLTreeLoader
+        from .. import NslPlugin
+
+        suite = Path(suite)
+        changed = [Path(f) for f in files]
+        if since is not None:
+            changed += git_changed_files(since, suite.parent)
+
+        repository = NSLTreeLoader(Path(root)).load()
+        selector = TestSelector(repository, load_suite(suite), NslPlugin().transform_filter_vars)
+        names = {project.name for project in selector.select(changed)}
+
+        if output is None:
+            for name in sorted(names):
+                print(name)
+            return
+
+        with suite.open() as f:
+            content = yaml.safe_load(f)
+        content["projects"] = [p for p in content.get("projects") or [] if p["name"] in names]
+        # Keep project paths valid wherever the filtered suite is written
+        for p in content["projects"]:
+            p["path"] = str((suite.parent / p["path"]).resolve())
+        with open(output, "w") as f:
+            yaml.safe_dump(content, f, sort_keys = False)
+
+    select()
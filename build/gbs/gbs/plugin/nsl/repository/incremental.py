@@ -0,0 +1,149 @@
+"""Design-unit level incremental re-analysis
+
+At partition granularity, touching one architecture in nsl_bnoc rebuilds
+everything downstream. Analysis dependencies between VHDL design units are
+much narrower: architectures depend on their entity, package bodies on
+their package, and units on the packages they use. Nothing depends on an
+architecture or a package body.
+
+AnalysisState records, per analyzed file, the digests computed by the VHDL
+scanner (see vhdl.DesignFile): one of its whole content and one of its
+primary units only. plan_reanalysis() compares a compile set against it
+and returns the files to analyze again:
+
+- a file whose content changed (comments and whitespace aside),
+- a file depending, for analysis, on a file whose interface changed.
+
+Analyzers such as GHDL invalidate the dependents of a unit whenever it is
+re-analyzed, even with an unchanged interface: they are marked obsolete.
+NSL .pkg.vhd files hold a package along with its body, so editing the body
+re-analyzes the package too. plan_reanalysis() therefore re-analyzes the
+dependents of any re-analyzed primary unit by default. With strict=False,
+for analyzers that keep them, an edit limited to an architecture or a
+package body in a file of its own only re-analyzes that file.
+"""
+
+from pathlib import Path
+from typing import Optional
+import json
+
+from .cache import write_atomic
+from .vhdl import DesignFile, DesignIndex
+
+
+class AnalysisState:
+    """Digests of VHDL files as of their last successful analysis
+
+    Kept as a JSON file, typically next to the analyzer's work libraries.
+    A missing or unreadable file is an empty state: everything is analyzed.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, path: Path):
+        """
+        path: State file
+        """
+        self.path = path
+        # "library:path" -> (interface digest, content digest)
+        self._files: dict[str, tuple[str, str]] = {}
+        try:
+            data = json.loads(path.read_text())
+            if data.get("format") == self.FORMAT:
+                self._files = {key: tuple(value) for key, value in data["files"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    @staticmethod
+    def _key(design_file: DesignFile) -> str:
+        return f"{design_file.library}:{Path(design_file.path).resolve()}"
+
+    def get(self, design_file: DesignFile) -> Optional[tuple[str, str]]:
+        """(interface, content) digests of a file at its last analysis"""
+        return self._files.get(self._key(design_file))
+
+    def record(self, design_file: DesignFile) -> None:
+        """Note a file as successfully analyzed"""
+        self._files[self._key(design_file)] = (design_file.interface, design_file.digest)
+
+    def forget(self, design_file: DesignFile) -> None:
+        """Note a file as needing analysis, e.g. after a failure"""
+        self._files.pop(self._key(design_file), None)
+
+    def save(self) -> None:
+        data = json.dumps({"format": self.FORMAT, "files": self._files}, indent=0, sort_keys=True)
+        try:
+            write_atomic(self.path, data.encode())
+        except OSError:
+            pass
+
+
+def plan_reanalysis(index: DesignIndex, files: list[DesignFile], state: AnalysisState,
+                    strict: bool = True) -> list[DesignFile]:
+    """Files of a compile set that need to be analyzed again
+
+    Args:
+        index: Index the files come from
+        files: Files to build, in analysis order, e.g. from
+            DesignIndex.compile_set()
+        state: Digests as of the last analysis
+        strict: Re-analyze dependents of every re-analyzed primary unit,
+            not only of those whose interface changed, as GHDL needs
+
+    Returns:
+        Files to analyze, in analysis order
+    """
+    # Files whose dependents must be analyzed again
+    invalidating: set[int] = set()
+    plan = []
+
+    for design_file in files:
+        previous = state.get(design_file)
+        changed = previous is None or previous[1] != design_file.digest
+        stale = any(id(d) in invalidating for d in index.analysis_dependencies(design_file))
+        if not (changed or stale):
+            continue
+
+        plan.append(design_file)
+        if not design_file.declares_primary_unit():
+            continue
+        # A primary unit re-analyzed against changed dependencies may
+        # export different declarations, even with the same text
+        if strict or stale or previous is None or previous[0] != design_file.interface:
+            invalidating.add(id(design_file))
+
+    return plan
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.argument("sources", type = click.Path(dir_okay = False, exists = True), nargs = -1)
+    @click.option("-t", "--top", type = str, required = True, help = "Top entity")
+    @click.option("-d", "--dep", "deps", type = str, multiple = True,
+                  help = "Partition the top depends on")
+    @click.option("-s", "--set", "settings", type = str, multiple = True,
+                  help = "Filter variable, as name=value")
+    @click.option("-w", "--state", type = click.Path(dir_okay = False), required = True,
+                  help = "Analysis state file")
+    @click.option("--strict/--relaxed", default = True,
+                  help = "Whether the analyzer obsoletes dependents on re-analysis (default: strict)")
+    @click.option("--record", is_flag = True, help = "Record the planned files as analyzed")
+    def plan(root, sources, top, deps, settings, state, strict, record):
+        from .tree import NSLTreeLoader
+
+        filter_vars = dict([v.split('=', 1) for v in settings])
+        repository = NSLTreeLoader(Path(root)).load()
+        index = repository.vhdl_index(deps, filter_vars, [Path(s) for s in sources])
+        analysis_state = AnalysisState(Path(state))
+        files = plan_reanalysis(index, index.compile_set(top), analysis_state, strict)
+        for design_file in files:
+            print(design_file.library, design_file.path)
+        if record:
+            for design_file in files:
+                analysis_state.record(design_file)
+            analysis_state.save()
+
+    plan()
@@ -0,0 +1,90 @@
+"""Hash-consed paths, sources and partitions
+
+A planning session evaluating many filter sets looks up the same partitions
+over and over, and most lookups produce exactly the same content. Building
+fresh Path, SourceFile and Partition objects every time makes memory grow
+with the number of configurations instead of with the number of distinct
+results.
+
+InternTable hands out one canonical object per distinct content. Canonical
+objects are shared between lookups, so their collections are immutable:
+partition sources and include directories are tuples, deps a frozenset. A
+caller trying to modify one lookup's result then fails, instead of silently
+changing every other lookup sharing it.
+"""
+
+from pathlib import Path
+from typing import Iterable
+import os
+
+from gbs.repository.model import Partition, SourceFile
+
+
+class InternTable:
+    """Canonical instances of repository objects, keyed by content"""
+
+    __slots__ = ("_paths", "_include_dirs", "_sources", "_partitions")
+
+    def __init__(self):
+        self._paths: dict[str, Path] = {}
+        self._include_dirs: dict[tuple[str, ...], tuple[Path, ...]] = {}
+        self._sources: dict[tuple[str, str, tuple[str, ...]], SourceFile] = {}
+        self._partitions: dict[tuple, Partition] = {}
+
+    def path(self, path: str) -> Path:
+        """Canonical Path for a path string"""
+        interned = self._paths.get(path)
+        if interned is None:
+            # setdefault keeps the first one if threads race
+            interned = self._paths.setdefault(path, Path(path))
+        return interned
+
+    def join(self, directory: Path, name: str) -> Path:
+        """Canonical directory / name, without building a Path on hits"""
+        return self.path(os.path.join(directory, name))
+
+    def source(self, path: str, file_type: str, include_dirs: Iterable[str] = ()) -> SourceFile:
+        """Canonical SourceFile"""
+        include_dirs = tuple(str(d) for d in include_dirs)
+        key = (path, file_type, include_dirs)
+        try:
+            return self._sources[key]
+        except KeyError:
+            pass
+
+        if include_dirs:
+            dirs = self._include_dirs.get(include_dirs)
+            if dirs is None:
+                dirs = self._include_dirs.setdefault(include_dirs, tuple(self.path(d) for d in include_dirs))
+            source = SourceFile(path=self.path(path), file_type=file_type, include_dirs=dirs)
+        else:
+            source = SourceFile(path=self.path(path), file_type=file_type)
+        return self._sources.setdefault(key, source)
+
+    def partition(self, name: str, sources: Iterable[SourceFile], deps: Iterable[str]) -> Partition:
+        """Canonical Partition
+
+        sources must be canonical themselves: they are compared by identity.
+        """
+        sources = tuple(sources)
+        deps = frozenset(deps)
+        key = (name, tuple(id(s) for s in sources), deps)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions.setdefault(
+                key, Partition(name=name, sources=sources, deps=deps))
+        return partition
+
+    def clear(self) -> None:
+        """Forget all canonical objects"""
+        self._paths.clear()
+        self._include_dirs.clear()
+        self._sources.clear()
+        self._partitions.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "paths": len(self._paths),
+            "sources": len(self._sources),
+            "partitions": len(self._partitions),
+        }
@@ -1,7 +1,12 @@
-from typing import Optional, Tuple, List, Iterator
+from typing import Callable, Optional, Tuple, List, Iterator
 from pathlib import Path
+import os
 import re
 
+from ..trace import traced
+from .cache import ParseCache, cache_directory
+from .fscache import directory_cache
+
 class MakefileError(Exception):
     """A malformed or unsupported construct in a Makefile.
 
@@ -19,31 +24,35 @@ class _UnbalancedConditional(Exception):
 def balanced_paren(n: int) -> str:
     return r"[^()]*?(?:\("*n+r"[^()]*?"+r"\)[^()]*?)*?"*n
 
-def nested_eval(max_depth: int) -> str:
-    assert max_depth
-    maybe_data = r"[^()]*?"
-    data = r"[^()]+"
-    eval_open = r"\$\("
-    eval_close = r"\)"
-    eval_ = eval_open + balanced_paren(max_depth - 1) + eval_close
-    return r"(?:" + eval_ + r"|" + data + r")"
-
-def nested_value(max_depth: int) -> str:
-    maybe_data = r"[^()]*?"
-    data = r"[^()]+"
-    if max_depth:
-        return maybe_data + r"(?:" + nested_eval(max_depth) + maybe_data + r")*?"
-    return data
-
-def nested_arg(max_depth: int) -> str:
-    maybe_data = r"[^(),]*?"
-    data = r"[^(),]+"
-    if max_depth:
-        return maybe_data + r"(?:" + nested_eval(max_depth) + maybe_data + r")*?"
-    return data
+def closing_delimiter(value: str, start: int) -> int:
+    """
+    Return the index of the delimiter closing the one at value[start]
+
+    Only the delimiter kind opened at start is counted, as Make does. Returns
+    -1 if it is never closed.
+    """
+    opening = value[start]
+    closing = ")" if opening == "(" else "}"
+    depth = 0
+    for i in range(start, len(value)):
+        c = value[i]
+        if c == opening:
+            depth += 1
+        elif c == closing:
+            depth -= 1
+            if not depth:
+                return i
+    return -1
 
 class Statement:
-    pass
+    # Compiled form, built on first evaluation, see compile()
+    _compiled = None
+
+    def __getstate__(self):
+        # Compiled forms are closures, statements are pickled by ParseCache
+        state = self.__dict__.copy()
+        state.pop("_compiled", None)
+        return state
 
 class Assignment(Statement):
     """
@@ -66,20 +75,38 @@ class Assignment(Statement):
         var and value are both expanded with Make variable expansion
         rules at evaluation of assignment.
         """
-        var = context.expand(self.var)
+        compiled = self._compiled or self.compile()
+        compiled(context)
 
-        if self.mode == "?=" and var in context:
-            return
-
-        if self.mode == ":=":
-            value = context.expand(self.value)
+    def compile(self) -> Callable[["Context"], None]:
+        """
+        Lower the assignment into a closure performing it
+        """
+        var = self.var
+        value = self.value
+        target = expansion(var)
+        constant = "$" not in var
+
+        if self.mode == "?=":
+            def assign(context):
+                name = var if constant else target(context)
+                if not context.is_defined(name):
+                    context[name] = value
+        elif self.mode == ":=":
+            source = expansion(value)
+            def assign(context):
+                name = var if constant else target(context)
+                context[name] = source(context)
+        elif self.mode == "+=":
+            def assign(context):
+                name = var if constant else target(context)
+                context[name] = context.lookup(name, "") + " " + value
         else:
-            value = self.value
-
-        if self.mode == "+=":
-            value = context.get(var, "") + " " + value
+            def assign(context):
+                context[var if constant else target(context)] = value
 
-        context[var] = value
+        self._compiled = assign
+        return assign
 
 class Warning(Statement):
     """
@@ -111,17 +138,29 @@ class Condition(Statement):
         """
         Evaluate condition through context
         """
-        if self.mode == "ifeq":
-            a, b = self.ab_split(self.test)
-            a = context.expand(a)
-            b = context.expand(b)
-            return a.strip() == b.strip()
-        if self.mode == "ifneq":
-            a, b = self.ab_split(self.test)
-            a = context.expand(a)
-            b = context.expand(b)
-            return a.strip() != b.strip()
-        raise NotImplementedError(self.mode)
+        compiled = self._compiled or self.compile()
+        return compiled(context)
+
+    def compile(self) -> Callable[["Context"], bool]:
+        """
+        Lower the condition into a closure testing it
+        """
+        if self.mode not in ("ifeq", "ifneq"):
+            raise NotImplementedError(self.mode)
+        a, b = self.ab_split(self.test)
+        left = expansion(a)
+        right = expansion(b)
+        equal = self.mode == "ifeq"
+
+        if "$" not in a and "$" not in b:
+            result = (a.strip() == b.strip()) == equal
+            test = lambda context: result
+        else:
+            def test(context):
+                return (left(context).strip() == right(context).strip()) == equal
+
+        self._compiled = test
+        return test
     
     @classmethod
     def ab_split(cls, ab: str) -> Tuple[str, str]:
@@ -131,6 +170,16 @@ class Condition(Statement):
 class Else(Statement):
     pass
 
+class Branch:
+    """
+    A conditional along with the statements of both its branches, as
+    nested by Makefile.structure()
+    """
+    def __init__(self, condition: Condition, true: list, false: list):
+        self.condition = condition
+        self.true = true
+        self.false = false
+
 class EndIf(Statement):
     pass
         
@@ -149,28 +198,38 @@ class Reader:
 
     @classmethod
     def arg_split(cls, string: str) -> List[str]:
-        arg_re = re.compile('^' + nested_value(5) + "$")
-        no_commas = string.split(',')
+        """
+        Split function arguments on commas that are not nested in a
+        parenthesized or braced group. Whitespace is kept.
+        """
         args = []
-        cur = []
-        for nc in no_commas:
-            cur.append(nc)
-            part = ','.join(cur)
-            if arg_re.match(part):
-                args.append(part)
-                cur = []
-        if cur:
-            part = ','.join(cur)
-            args.append(part)
+        depth = 0
+        start = 0
+        for i, c in enumerate(string):
+            if c in "({":
+                depth += 1
+            elif c in ")}":
+                depth -= 1
+            elif c == "," and not depth:
+                args.append(string[start:i])
+                start = i + 1
+        args.append(string[start:])
         return args
     
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, text: Optional[str] = None):
+        """
+        path: Makefile path, used for reading and error messages
+        text: Makefile content, if already read by the caller
+        """
         self.path = path
+        self.text = text
 
     def __iter__(self) -> Iterator[Statement]:
-        fd = self.path.open("r")
+        text = self.text
+        if text is None:
+            text = self.path.read_text()
         else_if = False
-        for line in fd.readlines():
+        for line in text.splitlines():
             line = line.rstrip().split("#", 1)[0]
 
             if not line:
@@ -219,93 +278,114 @@ class Context(dict):
     """
     def __init__(self, *args, **kwargs):
         dict.__init__(self)
+        # Expanded values of variables, valid until the next assignment
+        self._memo: dict[str, str] = {}
+        self._expanding: set[str] = set()
+        # Names of variables read, when tracking is enabled
+        self.reads: Optional[set[str]] = None
+        # Expanded $(wildcard) patterns, the evaluation depends on the filesystem
+        self.globs: list[str] = []
+        # Base of relative $(wildcard) patterns, the process cwd if None
+        self.directory: Optional[Path] = None
+        self._wildcards: dict[str, str] = {}
         self.update(dict(*args, **kwargs))
 
-    def evaluate(self, expression: str, exprs: Iterator["Statement"],
-                 do_run: bool = True, prefix: str = ""):
-        """
-        Evaluate make expression (variable expansions, function calls)
-        """
-        #print(prefix, expression)
-        if isinstance(expression, Condition):
-            is_true = expression.evaluate(self)
-            # Consume this conditional's body from the shared iterator: the
-            # true branch up to an Else/EndIf, then the false branch up to the
-            # EndIf. A nested Condition recurses and consumes its own EndIf, so
-            # the next EndIf we see is always ours.
-            in_true_branch = True
-            while True:
-                try:
-                    te = next(exprs)
-                except StopIteration:
-                    raise _UnbalancedConditional(
-                        f"unterminated '{expression.mode}' (missing 'endif')"
-                    )
-                if isinstance(te, EndIf):
-                    return
-                if isinstance(te, Else):
-                    in_true_branch = False
-                    continue
-                branch_active = is_true if in_true_branch else not is_true
-                self.evaluate(te, exprs, do_run = do_run and branch_active,
-                              prefix = prefix + " ")
-
-        if isinstance(expression, (Else, EndIf)):
-            keyword = "else" if isinstance(expression, Else) else "endif"
-            raise _UnbalancedConditional(
-                f"'{keyword}' without matching 'ifeq'/'ifneq'"
-            )
+    def track_reads(self) -> set[str]:
+        """
+        Start recording the names of variables the evaluation reads
 
-        if isinstance(expression, Assignment):
-            if do_run:
-                expression.evaluate(self)
-            return
+        Returns the set being filled. An evaluation only depends on the
+        initial value of the variables in this set.
+        """
+        self.reads = set()
+        return self.reads
 
-        if isinstance(expression, Warning):
-            if do_run:
-                expression.evaluate(self)
-            return
+    def is_defined(self, name: str) -> bool:
+        """
+        Whether a variable is defined, as a recorded read
+        """
+        if self.reads is not None:
+            self.reads.add(name)
+        return name in self
 
-        raise _UnbalancedConditional(f"unexpected statement: {expression!r}")
+    def lookup(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Unexpanded value of a variable, as a recorded read
+        """
+        if self.reads is not None:
+            self.reads.add(name)
+        return self.get(name, default)
 
-    dereference = re.compile(r"\$(?P<to_expand>\("+ balanced_paren(5)+r"\)|[^(])", re.I)
+    def __setitem__(self, key, value):
+        self._memo.clear()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._memo.clear()
+        dict.__delitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        self._memo.clear()
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default = None):
+        self._memo.clear()
+        return dict.setdefault(self, key, default)
+
+    def pop(self, *args):
+        self._memo.clear()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._memo.clear()
+        return dict.popitem(self)
+
+    def clear(self):
+        self._memo.clear()
+        dict.clear(self)
 
     def expanded_items(self):
         return {k: self.expand(v).strip() for (k, v) in self.items()}
-    
+
+    @traced("Context.expand", reentrant=False)
     def expand(self, value: str) -> str:
         """
         Perform variable expansion
+
+        The value is scanned once, left to right. Each $(...) or ${...}
+        reference is matched to its closing delimiter and expanded
+        recursively, so nesting depth is not limited. Unterminated
+        references are kept verbatim.
+
+        Values are compiled into closures on first expansion, see
+        expansion().
         """
-        #print(f"Expand {value}", end = "")
-        while True:
-            before = value
-            value = self.dereference.sub(self._dollar, value)
-            if before == value:
-                #print(f" -> {before} ({self})")
-                return before
-
-    def _dollar(self, m: str) -> str:
-        """
-        expand $(...)
-
-        - Can be a function: $(function arg1,arg2,arg3)
-        - Can be a variable: $(var)
-        """
-        exp = m.group("to_expand")
-        #print(f"$<{exp}>")
-        if exp.startswith('('):
-            if ' ' in exp:
-                function, args = exp[1:-1].split(' ', 1)
-                args = Reader.arg_split(args)
-                handler = getattr(self,
-                                  "_func_"+function.replace("-", "_"),
-                                  self._func__default)
-                return handler(function, *args)
-            exp = self.expand(exp[1:-1])
-        else:
-            exp = self.expand(exp)
-        return self.get(exp)
+        if "$" not in value:
+            return value
+        return expansion(value)(self)
+
+    def variable(self, name: str) -> str:
+        """
+        Fully expanded value of a variable, empty if undefined
+
+        Values are expanded at reference time, as for Make recursive (=)
+        variables. Results are memoized until the context is next assigned.
+        """
+        if self.reads is not None:
+            self.reads.add(name)
+        try:
+            return self._memo[name]
+        except KeyError:
+            pass
+        if name in self._expanding:
+            raise MakefileError(f"Recursive variable '{name}' references itself")
+        self._expanding.add(name)
+        try:
+            value = self.expand(self.get(name) or "")
+        finally:
+            self._expanding.discard(name)
+        self._memo[name] = value
+        return value
 
     def _func__default(self, function : str, *args) -> str:
         raise NotImplementedError(f"Function {function} not implemented")
@@ -316,31 +396,41 @@ class Context(dict):
         """
         pattern = self.expand(pattern)
         text = self.expand(text)
-
-        expected_result = function == "filter"
-        
-        pattern = re.escape(pattern).replace("%", ".*")
-        p = re.compile("^" + pattern + "$")
-        r = []
-
-        for item in text.split():
-            item = item.strip()
-            if bool(p.match(item)) == expected_result:
-                r.append(item)
-        return ' '.join(r)
+        return filter_words(filter_regex(pattern), text, function == "filter")
 
     _func_filter_out = _func_filter
 
     def _func_wildcard(self, function : str, path: str) -> str:
         """
-        $(wildcard pattern)
+        $(wildcard pattern...)
+
+        Relative patterns are resolved against the context directory and
+        matches are returned relative to it.
         """
-        path = self.expand(path)
-        if path.startswith("/"):
-            paths = Path("/").glob("." + path)
-        else:
-            paths = Path(".").glob(path)
-        return ' '.join([str(x) for x in paths])
+        return self.wildcard(self.expand(path))
+
+    def wildcard(self, patterns: str) -> str:
+        """
+        Paths matching expanded $(wildcard) patterns, memoized per context
+        """
+        try:
+            return self._wildcards[patterns]
+        except KeyError:
+            pass
+
+        base = os.path.abspath(self.directory if self.directory is not None else ".")
+        matches = []
+        for pattern in patterns.split():
+            absolute = os.path.join(base, pattern)
+            self.globs.append(absolute)
+            found = directory_cache().glob(absolute)
+            if not os.path.isabs(pattern):
+                found = [os.path.relpath(f, base) for f in found]
+            matches.extend(found)
+
+        result = ' '.join(matches)
+        self._wildcards[patterns] = result
+        return result
 
     def _func_if(self, function: str, cond: str, true: str, false: str) -> str:
         """
@@ -360,6 +450,368 @@ class Context(dict):
         t = self.expand(t)
         return self.expand(text).replace(f, t)
 
+def filter_regex(pattern: str) -> re.Pattern:
+    """
+    Compiled regex of a $(filter) pattern, % matching any string
+    """
+    try:
+        return _filter_regexes[pattern]
+    except KeyError:
+        pass
+    regex = re.compile("^" + re.escape(pattern).replace("%", ".*") + "$")
+    if len(_filter_regexes) >= _COMPILED_MAX:
+        _filter_regexes.clear()
+    _filter_regexes[pattern] = regex
+    return regex
+
+def filter_words(regex: re.Pattern, text: str, keep: bool) -> str:
+    """
+    Words of text matching regex if keep, not matching it otherwise
+    """
+    match = regex.match
+    return ' '.join([item for item in text.split() if bool(match(item)) == keep])
+
+# Compiled expansions and filter patterns are kept per string. Makefiles
+# hold a bounded set of them, the bound only guards against pathological
+# computed values.
+_COMPILED_MAX = 65536
+_filter_regexes: dict[str, re.Pattern] = {}
+_expansions: dict[str, Callable[[Context], str]] = {}
+
+def expansion(value: str) -> Callable[[Context], str]:
+    """
+    Closure expanding value in a context, compiled once per string
+
+    The value is split into literal text and references once. Literal
+    parts are folded, variable references with a constant name read the
+    variable directly, and the filter, filter-out, if, subst and wildcard
+    functions are called without dispatch, with constant $(filter) patterns
+    compiled ahead.
+    """
+    try:
+        return _expansions[value]
+    except KeyError:
+        pass
+    compiled = _compile_expansion(value)
+    if len(_expansions) >= _COMPILED_MAX:
+        _expansions.clear()
+    _expansions[value] = compiled
+    return compiled
+
+def _constant(value: str) -> Callable[[Context], str]:
+    return lambda context: value
+
+def _compile_expansion(value: str) -> Callable[[Context], str]:
+    # Same scan as Context.expand documents: literals and references
+    parts: list = []
+    pos = 0
+    end = len(value)
+    dollar = value.find("$")
+    while dollar >= 0:
+        parts.append(value[pos:dollar])
+        if dollar + 1 == end:
+            pos = dollar
+            break
+        c = value[dollar + 1]
+        if c in "({":
+            close = closing_delimiter(value, dollar + 1)
+            if close < 0:
+                parts.append(value[dollar:dollar + 2])
+                pos = dollar + 2
+            else:
+                parts.append(_compile_reference(value[dollar + 2:close]))
+                pos = close + 1
+        elif c == "$":
+            parts.append("$")
+            pos = dollar + 2
+        else:
+            parts.append(_compile_variable(c))
+            pos = dollar + 2
+        dollar = value.find("$", pos)
+    parts.append(value[pos:])
+
+    # Fold adjacent literals
+    folded: list = []
+    for part in parts:
+        if isinstance(part, str):
+            if not part:
+                continue
+            if folded and isinstance(folded[-1], str):
+                folded[-1] += part
+                continue
+        folded.append(part)
+
+    if not folded:
+        return _constant("")
+    if len(folded) == 1:
+        part = folded[0]
+        return _constant(part) if isinstance(part, str) else part
+
+    parts = tuple(folded)
+    def expand(context):
+        return "".join([part if part.__class__ is str else part(context) for part in parts])
+    return expand
+
+def _compile_variable(name: str) -> Callable[[Context], str]:
+    return lambda context: context.variable(name)
+
+def _compile_reference(exp: str) -> Callable[[Context], str]:
+    """
+    Compile the inside of $(...)
+
+    - Can be a function: $(function arg1,arg2,arg3)
+    - Can be a variable: $(var), whose name may itself need expansion
+    """
+    function, sep, args = exp.partition(" ")
+    if sep and "$" not in function:
+        args = Reader.arg_split(args)
+        compiler = _FUNCTIONS.get((function, len(args)))
+        if compiler is not None:
+            return compiler(function, *args)
+        # Unknown function or unexpected arity: fail as the method does,
+        # when evaluated
+        method = "_func_" + function.replace("-", "_")
+        return lambda context: getattr(context, method, context._func__default)(function, *args)
+
+    if "$" not in exp:
+        return _compile_variable(exp)
+    name = expansion(exp)
+    return lambda context: context.variable(name(context))
+
+def _compile_filter(function: str, pattern: str, text: str) -> Callable[[Context], str]:
+    keep = function == "filter"
+    words = expansion(text)
+    if "$" not in pattern:
+        regex = filter_regex(pattern)
+        return lambda context: filter_words(regex, words(context), keep)
+    patterns = expansion(pattern)
+    def apply(context):
+        regex = filter_regex(patterns(context))
+        return filter_words(regex, words(context), keep)
+    return apply
+
+def _compile_if(function: str, cond: str, true: str, false: str) -> Callable[[Context], str]:
+    test = expansion(cond)
+    then = expansion(true)
+    otherwise = expansion(false)
+    return lambda context: then(context) if test(context) else otherwise(context)
+
+def _compile_subst(function: str, f: str, t: str, text: str) -> Callable[[Context], str]:
+    old = expansion(f)
+    new = expansion(t)
+    words = expansion(text)
+    def apply(context):
+        a = old(context)
+        b = new(context)
+        return words(context).replace(a, b)
+    return apply
+
+def _compile_wildcard(function: str, path: str) -> Callable[[Context], str]:
+    patterns = expansion(path)
+    return lambda context: context.wildcard(patterns(context))
+
+# (function, argument count) -> compiler
+_FUNCTIONS = {
+    ("filter", 2): _compile_filter,
+    ("filter-out", 2): _compile_filter,
+    ("if", 3): _compile_if,
+    ("subst", 3): _compile_subst,
+    ("wildcard", 1): _compile_wildcard,
+}
+
+@traced("Reader", lambda path, text: path)
+def _read(path: Path, text: str) -> list[Statement]:
+    return list(Reader(path, text))
+
+_parse_cache: Optional[ParseCache] = None
+
+def parse_cache() -> ParseCache:
+    """
+    Process-wide parse cache, persisted under the gbs-nsl cache directory
+    """
+    global _parse_cache
+    if _parse_cache is None:
+        _parse_cache = ParseCache(
+            _read, cache_directory(f"parse-v{ParseCache.FORMAT}"), name="parse")
+    return _parse_cache
+
+class _Divergence(Exception):
+    """Internal: a batch evaluation read a variable on which configurations
+    sharing a context disagree. Batch forks the context and retries."""
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name = name
+
+class SharedContext(Context):
+    """
+    A context shared by several configurations during a batch evaluation
+
+    It holds the variables all its configurations agree on. Reading one of
+    the undecided variables, on which they differ and that the Makefile did
+    not assign yet, interrupts the evaluation so that the context can be
+    forked.
+    """
+    def __init__(self, values: dict, undecided: frozenset):
+        Context.__init__(self, values)
+        self.undecided = undecided
+
+    def __setitem__(self, key, value):
+        if key in self.undecided:
+            self.undecided = self.undecided - {key}
+        Context.__setitem__(self, key, value)
+
+    def is_defined(self, name: str) -> bool:
+        if name in self.undecided:
+            raise _Divergence(name)
+        return Context.is_defined(self, name)
+
+    def lookup(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        if name in self.undecided:
+            raise _Divergence(name)
+        return Context.lookup(self, name, default)
+
+    def variable(self, name: str) -> str:
+        if name in self.undecided:
+            raise _Divergence(name)
+        return Context.variable(self, name)
+
+class Batch:
+    """
+    Evaluation of Makefiles for several configurations at once
+
+    Configurations start in a single shared context. Statements are
+    evaluated once per group of configurations that still agree on every
+    variable read so far. A group is only forked when it reads a variable
+    its members disagree on, so cost grows with the number of divergent
+    branches rather than with the number of configurations.
+    """
+    def __init__(self, initial: list[dict[str, str]], track_reads: bool = False,
+                 directory: Optional[Path] = None):
+        """
+        initial: initial variables of each configuration
+        track_reads: record variable reads in every context
+        directory: base of relative $(wildcard) patterns
+        """
+        self.initial = initial
+        keys = set()
+        for values in initial:
+            keys.update(values)
+        common = {}
+        for key in keys:
+            first = initial[0].get(key) if initial else None
+            if first is not None and all(values.get(key) == first for values in initial):
+                common[key] = first
+
+        context = SharedContext(common, frozenset(keys - set(common)))
+        context.directory = directory
+        if track_reads:
+            context.track_reads()
+        # (context, indices of configurations sharing it)
+        self.groups: list[tuple[SharedContext, list[int]]] = [(context, list(range(len(initial))))]
+
+    def _fork(self, context: SharedContext, members: list[int], name: str
+              ) -> list[tuple[SharedContext, list[int]]]:
+        by_value: dict[Optional[str], list[int]] = {}
+        for i in members:
+            by_value.setdefault(self.initial[i].get(name), []).append(i)
+
+        groups = []
+        for value, forked in by_value.items():
+            values = dict(context)
+            if value is not None:
+                values[name] = value
+            child = SharedContext(values, context.undecided - {name})
+            if context.reads is not None:
+                child.reads = context.reads | {name}
+            child.globs = list(context.globs)
+            child.directory = context.directory
+            groups.append((child, forked))
+        return groups
+
+    def _apply(self, groups, function) -> list[tuple[SharedContext, list[int], object]]:
+        """
+        Call function(context) for each group, forking groups as needed
+
+        function must not modify the context before reading from it, so
+        that it can be retried after a fork.
+        """
+        results = []
+        pending = list(reversed(groups))
+        while pending:
+            context, members = pending.pop()
+            try:
+                result = function(context)
+            except _Divergence as d:
+                pending.extend(reversed(self._fork(context, members, d.name)))
+                continue
+            results.append((context, members, result))
+        return results
+
+    def run(self, function) -> list:
+        """
+        Call function(context) for every group, return one result per
+        configuration
+        """
+        results = [None] * len(self.initial)
+        applied = self._apply(self.groups, function)
+        self.groups = [(context, members) for context, members, _ in applied]
+        for _, members, result in applied:
+            for i in members:
+                results[i] = result
+        return results
+
+    def _walk(self, body: list, groups: list) -> list:
+        for item in body:
+            if isinstance(item, Branch):
+                applied = self._apply(groups, item.condition.evaluate)
+                true = [(c, m) for c, m, r in applied if r]
+                false = [(c, m) for c, m, r in applied if not r]
+                groups = self._walk(item.true, true) + self._walk(item.false, false)
+            else:
+                groups = [(c, m) for c, m, _ in self._apply(groups, item.evaluate)]
+        return groups
+
+    @traced("Batch.interpret", lambda self, makefile: makefile.filename)
+    def interpret(self, makefile: "Makefile") -> None:
+        """
+        Interpret a Makefile in every configuration
+        """
+        self.groups = self._walk(makefile.structure(), self.groups)
+
+    def contexts(self) -> list[SharedContext]:
+        """
+        Context of each configuration, configurations that never diverged
+        share the same object
+        """
+        return self.run(lambda context: context)
+
+# Makefile path -> (statements, compiled program)
+_programs: dict[Path, tuple[tuple, Callable[[Context], None]]] = {}
+
+def _compile_body(body: list) -> Callable[[Context], None]:
+    steps = []
+    for item in body:
+        if isinstance(item, Branch):
+            steps.append(_compile_branch(item))
+        elif not isinstance(item, Warning):
+            steps.append(item.evaluate)
+    steps = tuple(steps)
+    def run(context):
+        for step in steps:
+            step(context)
+    return run
+
+def _compile_branch(branch: Branch) -> Callable[[Context], None]:
+    test = branch.condition.evaluate
+    true = _compile_body(branch.true)
+    false = _compile_body(branch.false)
+    def run(context):
+        if test(context):
+            true(context)
+        else:
+            false(context)
+    return run
+
 class Makefile:
     """
     A makefile interpreter
@@ -367,21 +819,79 @@ class Makefile:
     filename: Path
     expressions: list[Statement]
 
-    def __init__(self, filename: Path):
+    def __init__(self, filename: Path, cache: Optional[ParseCache] = None):
+        """
+        filename: Makefile to parse
+        cache: parse cache to go through, defaults to the process-wide one
+        """
         self.filename = filename
-        self.expressions = list(Reader(filename))
+        if cache is None:
+            cache = parse_cache()
+        self._statements = cache.shared(filename)
+        self.expressions = list(self._statements)
+        self._structure: Optional[list] = None
 
+    def structure(self) -> list:
+        """
+        Statements with conditionals nested as Branch objects
+        """
+        if self._structure is None:
+            try:
+                self._structure, _ = self._nest(iter(self.expressions))
+            except _UnbalancedConditional as exc:
+                raise MakefileError(f"{self.filename}: {exc}") from None
+        return self._structure
+
+    @classmethod
+    def _nest(cls, exprs: Iterator[Statement], condition: Optional[Condition] = None
+              ) -> tuple[list, Optional[Statement]]:
+        """
+        Consume statements up to the Else/EndIf closing condition, return
+        them along with that terminator
+        """
+        body = []
+        for e in exprs:
+            if isinstance(e, Condition):
+                true, end = cls._nest(exprs, e)
+                false = []
+                # As in Context.evaluate, a repeated else stays in the false branch
+                while isinstance(end, Else):
+                    more, end = cls._nest(exprs, e)
+                    false += more
+                body.append(Branch(e, true, false))
+            elif isinstance(e, (Else, EndIf)):
+                if condition is None:
+                    keyword = "else" if isinstance(e, Else) else "endif"
+                    raise _UnbalancedConditional(
+                        f"'{keyword}' without matching 'ifeq'/'ifneq'"
+                    )
+                return body, e
+            else:
+                body.append(e)
+        if condition is not None:
+            raise _UnbalancedConditional(
+                f"unterminated '{condition.mode}' (missing 'endif')"
+            )
+        return body, None
+
+    def program(self) -> Callable[[Context], None]:
+        """
+        The Makefile lowered into a closure interpreting it in a context
+
+        Only the branches taken are evaluated. Programs are compiled once
+        per parsed statement list, and shared by Makefile objects of the
+        same file.
+        """
+        cached = _programs.get(self.filename)
+        if cached is not None and cached[0] is self._statements:
+            return cached[1]
+        program = _compile_body(self.structure())
+        _programs[self.filename] = (self._statements, program)
+        return program
+
+    @traced("Makefile.interpret", lambda self, context: self.filename)
     def interpret(self, context: "Context"):
-        exprs = iter(self.expressions)
-        try:
-            while True:
-                try:
-                    e = next(exprs)
-                except StopIteration:
-                    break
-                context.evaluate(e, exprs)
-        except _UnbalancedConditional as exc:
-            raise MakefileError(f"{self.filename}: {exc}") from None
+        self.program()(context)
 
 if __name__ == "__main__":
     import sys
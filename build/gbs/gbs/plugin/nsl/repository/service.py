@@ -0,0 +1,499 @@
+"""Warm NSL repository service
+
+Every gbs invocation loads the NSL tree and evaluates what it needs from
+scratch; the persistent caches help, but still cost a stat per file and a
+database round trip per partition. This module keeps one NSLRepository
+alive in a server process, with its parsed Makefiles, package lists and
+evaluated partitions in memory, and serves lookups over a Unix socket.
+
+Changes are picked up through inotify (or polling, where inotify is not
+available) on the directories of the Makefiles and sources the repository
+has used. Only entries derived from a changed file are invalidated, see
+NSLRepository.invalidate().
+
+The protocol is JSON lines: one request object per line, answered by one
+response object per line.
+
+    {"op": "lookup", "partition": "nsl_data.crc", "filter_vars": {...}}
+    {"ok": true, "record": "<PartitionRecord.encode()>"}
+
+gbs uses the service when GBS_NSL_SERVICE is set, either to a socket path
+or to "auto" for the default one; ServiceRepository falls back to local
+evaluation when the service is unreachable.
+"""
+
+from pathlib import Path
+from typing import Optional
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from gbs.logging import get_logger
+from .cache import cache_directory
+from .evaluation import filter_context_vars
+from .store import PartitionRecord
+from .tree import NSLRepository
+
+logger = get_logger(__name__)
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+               | IN_CREATE | IN_DELETE | IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")
+
+
+def default_socket_path(root: Path) -> Optional[Path]:
+    """Socket of the service for a repository root, None if caching is off"""
+    directory = cache_directory("service")
+    if directory is None:
+        return None
+    digest = hashlib.sha1(str(Path(root).resolve()).encode()).hexdigest()[:16]
+    return directory / f"{digest}.sock"
+
+
+class InotifyWatcher:
+    """Directory watcher on top of Linux inotify, through libc"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories: dict[int, Path] = {}
+        self._watched: set[Path] = set()
+
+    def add(self, directory: Path) -> None:
+        if directory in self._watched:
+            return
+        wd = self._add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            # Vanished or unreadable directory, nothing to watch
+            return
+        self._directories[wd] = directory
+        self._watched.add(directory)
+
+    def wait(self, timeout: float) -> Optional[list[Path]]:
+        """Paths changed since the last call, None if events were lost"""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self._directories.get(wd)
+            if directory is not None:
+                changed.append(directory / os.fsdecode(name) if name else directory)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Directory watcher comparing listings and stats periodically"""
+
+    def __init__(self, interval: float = 1.0):
+        self._interval = interval
+        # directory -> {name: (mtime_ns, size)}
+        self._snapshots: dict[Path, dict[str, tuple[int, int]]] = {}
+
+    @staticmethod
+    def _snapshot(directory: Path) -> dict[str, tuple[int, int]]:
+        entries = {}
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+        return entries
+
+    def add(self, directory: Path) -> None:
+        if directory not in self._snapshots:
+            self._snapshots[directory] = self._snapshot(directory)
+
+    def wait(self, timeout: float) -> Optional[list[Path]]:
+        time.sleep(min(timeout, self._interval))
+        changed = []
+        for directory, previous in list(self._snapshots.items()):
+            current = self._snapshot(directory)
+            for name in previous.keys() | current.keys():
+                if previous.get(name) != current.get(name):
+                    changed.append(directory / name)
+            self._snapshots[directory] = current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher():
+    """inotify watcher if the platform supports it, a polling one otherwise"""
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError, TypeError):
+        logger.debug("inotify unavailable, polling for changes")
+        return PollingWatcher()
+
+
+class RepositoryService:
+    """Serves an in-memory NSLRepository over a Unix socket"""
+
+    def __init__(self, repository: NSLRepository, socket_path: Path, watcher=None):
+        """
+        repository: Repository to keep warm
+        socket_path: Unix socket to listen on
+        watcher: Directory watcher, defaults to make_watcher()
+        """
+        self.repository = repository
+        self.socket_path = socket_path
+        self._watcher = watcher if watcher is not None else make_watcher()
+        self._watch_lock = threading.Lock()
+        self._running = False
+        self._server: Optional[socketserver.UnixStreamServer] = None
+        # (partition, filter set, prune) -> (encoded record or None,
+        # directories of the Makefiles it was evaluated from)
+        self._records: dict[tuple, tuple[Optional[str], frozenset[Path]]] = {}
+        # Held by request and watcher threads alike around the use of
+        # _records and of the repository, whose caches are not thread-safe.
+        # A record is also never stored after an invalidation it predates.
+        self._lock = threading.RLock()
+        self.requests = 0
+        self.hits = 0
+        self.invalidations = 0
+
+    def _watch(self, paths) -> None:
+        """Watch the directories of paths the repository used"""
+        with self._watch_lock:
+            for path in paths:
+                self._watcher.add(Path(path).parent)
+
+    def _watch_loop(self) -> None:
+        while self._running:
+            changed = self._watcher.wait(1.0)
+            if changed is None:
+                logger.debug("Watcher lost events, dropping all evaluations")
+                self.invalidate_all()
+                continue
+            for path in changed:
+                try:
+                    self.invalidate(path)
+                except Exception as e:
+                    # Serving stale records is worse than evaluating again
+                    logger.warning(f"Failed to invalidate {path} ({type(e).__name__}: {e}), "
+                                   "dropping all evaluations")
+                    self.invalidate_all()
+
+    def invalidate(self, path: Path) -> None:
+        """Drop state derived from a changed file"""
+        logger.debug(f"Changed: {path}")
+        # A new, removed or modified file next to a Makefile may change its
+        # evaluation, through $(wildcard) or by being the Makefile itself
+        directory = path.parent
+        with self._lock:
+            self.invalidations += 1
+            for key in [k for k, (_, dirs) in self._records.items() if directory in dirs]:
+                del self._records[key]
+            self.repository.invalidate(path)
+
+    def invalidate_all(self) -> None:
+        """Drop all state"""
+        with self._lock:
+            self.invalidations += 1
+            self._records.clear()
+            self.repository.invalidate_all()
+
+    def _lookup(self, request: dict) -> dict:
+        with self._lock:
+            return self._locked_lookup(request)
+
+    def _locked_lookup(self, request: dict) -> dict:
+        filter_vars = request.get("filter_vars") or {}
+        key = (request["partition"], frozenset(filter_context_vars(filter_vars).items()),
+               request.get("prune"))
+        cached = self._records.get(key)
+        if cached is not None:
+            self.hits += 1
+            return {"record": cached[0]}
+
+        record = self.repository.partition_record(request["partition"], filter_vars, request.get("prune"))
+        if record is None:
+            # The partition may appear with a new package Makefile, or a
+            # library Makefile change
+            encoded, directories = None, frozenset([self._library_directory(request["partition"])])
+        elif self.repository.prunes(request.get("prune")):
+            # Pruned deps follow from the VHDL sources and Makefiles of every
+            # partition the declared deps reach
+            records, missing = self._declared_closure(request["partition"], filter_vars)
+            self._watch(path for r in records for path, _, _ in r.sources)
+            encoded = record.encode()
+            directories = frozenset(
+                [Path(m).parent for r in records for m in r.definition_files]
+                + [Path(path).parent for r in records for path, _, _ in r.sources]
+                + [self._library_directory(name) for name in missing])
+        else:
+            self._watch(path for path, _, _ in record.sources)
+            encoded = record.encode()
+            directories = frozenset(Path(m).parent for m in record.definition_files)
+        self._watch(d / "Makefile" for d in directories)
+        self._records[key] = (encoded, directories)
+        return {"record": encoded}
+
+    def _library_directory(self, partition_name: str) -> Path:
+        """Directory a partition, found or not, is declared in"""
+        try:
+            return self.repository.library_path(partition_name.split(".", 1)[0]).resolve()
+        except KeyError:
+            return self.repository.root.resolve()
+
+    def _declared_closure(self, partition_name: str, filter_vars: dict
+                          ) -> tuple[list[PartitionRecord], set[str]]:
+        """Unpruned records of a partition and of the partitions its deps reach
+
+        Returns:
+            The records, and the names of reached partitions not found
+        """
+        records = []
+        missing = set()
+        pending, seen = [partition_name], {partition_name}
+        while pending:
+            name = pending.pop()
+            record = self.repository.partition_record(name, filter_vars, False)
+            if record is None:
+                missing.add(name)
+                continue
+            records.append(record)
+            for dep in record.deps:
+                if dep not in seen:
+                    seen.add(dep)
+                    pending.append(dep)
+        return records, missing
+
+    def _compile_order(self, request: dict) -> dict:
+        with self._lock:
+            graph = self.repository.dependency_graph(request.get("filter_vars") or {})
+            self._watch(self.repository.definition_files)
+        tops = request.get("tops")
+        return {"order": graph.order if tops is None else graph.compile_order(tops)}
+
+    def handle(self, request: dict) -> dict:
+        """Answer one request"""
+        self.requests += 1
+        op = request.get("op")
+        if op == "lookup":
+            return self._lookup(request)
+        if op == "compile_order":
+            return self._compile_order(request)
+        if op == "invalidate":
+            for path in request.get("paths") or []:
+                self.invalidate(Path(path).absolute())
+            return {}
+        if op == "stats":
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "invalidations": self.invalidations,
+                "definition_files": len(self.repository.definition_files),
+            }
+        if op == "ping":
+            return {}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {}
+        raise ValueError(f"Unknown operation {op!r}")
+
+    def serve_forever(self) -> None:
+        """Serve until a shutdown request"""
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = {"ok": True, **service.handle(json.loads(line))}
+                    except Exception as e:
+                        response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+        self._server = Server(str(self.socket_path), Handler)
+        self._running = True
+        watcher = threading.Thread(target=self._watch_loop, name="nsl-watch", daemon=True)
+        watcher.start()
+        logger.info(f"NSL repository service listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._running = False
+            self._server.server_close()
+            watcher.join()
+            self._watcher.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class ServiceClient:
+    """Client of a RepositoryService"""
+
+    def __init__(self, socket_path: Path, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self._timeout = timeout
+        self._socket: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError:
+            sock.close()
+            raise
+        self._socket = sock
+        self._file = sock.makefile("rwb")
+
+    def request(self, op: str, **arguments) -> dict:
+        """Send a request and wait for its response
+
+        Raises:
+            OSError: Service unreachable
+            RuntimeError: Request failed on the service side
+        """
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            try:
+                self._file.write(json.dumps({"op": op, **arguments}).encode() + b"\n")
+                self._file.flush()
+                line = self._file.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionResetError("NSL repository service closed the connection")
+        response = json.loads(line)
+        if not response.pop("ok"):
+            raise RuntimeError(response["error"])
+        return response
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = None
+            self._file = None
+
+
+class ServiceRepository(NSLRepository):
+    """NSLRepository answering lookups from a warm service when possible
+
+    Any failure to reach the service falls back to local evaluation, for
+    the rest of the process.
+    """
+
+    def __init__(self, socket_path: Path, **kwargs):
+        super().__init__(**kwargs)
+        self._client: Optional[ServiceClient] = ServiceClient(socket_path)
+
+    def partition_lookup(self, partition_name, filter_vars, prune=None):
+        if self._client is not None:
+            try:
+                response = self._client.request(
+                    "lookup", partition=partition_name, filter_vars=filter_vars, prune=prune)
+            except (OSError, RuntimeError, ValueError) as e:
+                logger.debug(f"NSL repository service unavailable ({e}), evaluating locally")
+                self._client.close()
+                self._client = None
+            else:
+                if response["record"] is None:
+                    return None
+                return self._partition_from_record(
+                    partition_name, PartitionRecord.decode(response["record"]))
+        return super().partition_lookup(partition_name, filter_vars, prune)
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.group()
+    def cli():
+        pass
+
+    @cli.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.option("--socket", "socket_path", type = click.Path(), default = None)
+    @click.option("--poll", is_flag = True, help = "Poll for changes instead of using inotify")
+    def serve(root, socket_path, poll):
+        from .tree import NSLTreeLoader
+
+        os.environ.pop("GBS_NSL_SERVICE", None)
+        repository = NSLTreeLoader(Path(root)).load()
+        socket_path = Path(socket_path) if socket_path else default_socket_path(Path(root))
+        if socket_path is None:
+            raise click.UsageError("No default socket path with caching disabled, use --socket")
+        RepositoryService(repository, socket_path, PollingWatcher() if poll else None).serve_forever()
+
+    @cli.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.argument("op", type = str)
+    @click.option("--socket", "socket_path", type = click.Path(), default = None)
+    @click.option("-a", "--arguments", type = str, default = "{}", help = "Request arguments, as JSON")
+    def query(root, op, socket_path, arguments):
+        socket_path = Path(socket_path) if socket_path else default_socket_path(Path(root))
+        print(json.dumps(ServiceClient(socket_path).request(op, **json.loads(arguments)), indent = 2))
+
+    cli()
@@ -0,0 +1,181 @@
+"""Persistent store of evaluated NSL partitions
+
+Every gbs process used to start from scratch and re-evaluate the whole
+reachable tree, even when a test suite launches dozens of projects against
+the same NSL checkout. This store keeps fully evaluated partitions in a
+sqlite database under the gbs-nsl cache directory.
+
+Entries are keyed by resolved repository root, partition name and a digest
+of the filter variables, and hold absolute paths. Each entry lists the files and directories its evaluation
+depended on (library and package Makefiles, directories inspected through
+$(wildcard)) with their stat, and is ignored when any of them changed.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from ..trace import count
+
+# (path, mtime_ns, size), mtime_ns and size are -1 for a missing path
+Dependency = tuple[str, int, int]
+
+# (path, file type, include directories)
+SourceRecord = tuple[str, str, tuple[str, ...]]
+
+
+def filter_digest(filter_vars: dict[str, str]) -> str:
+    """Stable digest of a filter set"""
+    data = json.dumps(sorted(filter_vars.items()), separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def stat_dependency(path: Path) -> Dependency:
+    """Current state of a dependency"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (str(path), -1, -1)
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+
+class PartitionRecord:
+    """Serializable content of an evaluated partition"""
+
+    __slots__ = ("sources", "deps", "definition_files")
+
+    def __init__(self, sources: list[SourceRecord], deps: list[str],
+                 definition_files: list[str]):
+        """
+        sources: sources of the partition
+        deps: qualified partition dependencies
+        definition_files: Makefiles the partition was evaluated from
+        """
+        self.sources = sources
+        self.deps = deps
+        self.definition_files = definition_files
+
+    def encode(self) -> str:
+        return json.dumps([self.sources, self.deps, self.definition_files],
+                          separators=(",", ":"))
+
+    @classmethod
+    def decode(cls, data: str) -> "PartitionRecord":
+        sources, deps, definition_files = json.loads(data)
+        return cls([(p, t, tuple(i)) for (p, t, i) in sources], deps, definition_files)
+
+
+class PartitionStore:
+    """sqlite-backed store of PartitionRecord
+
+    Safe to share between threads of a process and between processes; all
+    failures to read or write the database degrade to cache misses.
+    """
+
+    SCHEMA = 1
+
+    # Writes are grouped in transactions of this many partitions
+    BATCH = 64
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=OFF")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS partitions ("
+                    " root TEXT, name TEXT, filter_digest TEXT,"
+                    " dependencies TEXT, record TEXT,"
+                    " PRIMARY KEY (root, name, filter_digest))"
+                )
+                db.commit()
+            except (OSError, sqlite3.Error):
+                return None
+            self._db = db
+            atexit.register(self.close)
+        return self._db
+
+    def get(self, root: Path, name: str, digest: str) -> Optional[PartitionRecord]:
+        """Return the stored partition, if present and still valid"""
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT dependencies, record FROM partitions"
+                    " WHERE root = ? AND name = ? AND filter_digest = ?",
+                    (str(root), name, digest)).fetchone()
+            except sqlite3.Error:
+                row = None
+
+        if row is None:
+            self.misses += 1
+            count("partition store miss")
+            return None
+
+        for path, mtime_ns, size in json.loads(row[0]):
+            if stat_dependency(Path(path)) != (path, mtime_ns, size):
+                self.misses += 1
+                count("partition store miss")
+                return None
+
+        self.hits += 1
+        count("partition store hit")
+        return PartitionRecord.decode(row[1])
+
+    def put(self, root: Path, name: str, digest: str, record: PartitionRecord,
+            dependencies: Iterable[Dependency]) -> None:
+        """Store a partition along with the state of what it depends on
+
+        dependencies are stat_dependency() results taken when the partition
+        was evaluated, not when storing it: an entry saved with newer stats
+        than its content would pass validation.
+        """
+        deps = json.dumps(sorted(set(dependencies)))
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?)",
+                    (str(root), name, digest, deps, record.encode()))
+                self._pending += 1
+                if self._pending >= self.BATCH:
+                    db.commit()
+                    self._pending = 0
+            except sqlite3.Error:
+                pass
+
+    def flush(self) -> None:
+        """Commit pending writes"""
+        with self._lock:
+            if self._db is not None and self._pending:
+                try:
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+                self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -11,19 +11,40 @@ IMPORTANT: NSL Makefiles are evaluated on demand during dependency resolution.
 Filter variables are passed as Makefile variables when evaluating partitions.
 """
 
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
+import asyncio
+import multiprocessing
+import os
 import sys
+import threading
 
 # Import from main GBS
 gbs_src = Path(__file__).parents[4] / "src"
 if gbs_src.exists() and str(gbs_src) not in sys.path:
     sys.path.insert(0, str(gbs_src))
 
-from gbs.repository.model import Repository, Partition, SourceFile
+from gbs.repository.model import Repository, Partition
 from gbs.repository.loader import RepositoryLoader, LoadError
 from gbs.logging import get_logger
-from .makefile import Makefile, Context
+from ..trace import count, traced
+from .audit import DependencyPruner, used_dependencies
+from .cache import cache_directory
+from .cost import CostHistory, CriticalPathScheduler, PartitionCost, cost_history
+from .evaluation import (
+    Evaluation,
+    EvaluationMemo,
+    LIBRARY_VARIABLES,
+    PACKAGE_VARIABLES,
+    evaluate_library,
+    filter_context_vars,
+)
+from .graph import DependencyGraph
+from .interning import InternTable
+from .makefile import parse_cache
+from .store import PartitionRecord, PartitionStore, filter_digest, stat_dependency
+from .vhdl import DesignFile, DesignIndex, scan_cache
 
 logger = get_logger(__name__)
 
@@ -35,16 +56,116 @@ class NSLRepository(Repository):
     which packages (partitions) are available and what sources they contain.
     """
 
-    def __init__(self, name: str, root: Path, libraries: dict[str, Path]):
+    def __init__(
+        self,
+        name: str,
+        root: Path,
+        libraries: dict[str, Path],
+        store: Optional[PartitionStore] = None,
+        prune_deps: bool = False,
+        lookup_workers: int = 4
+    ):
         """Initialize NSL repository
 
         Args:
             name: Repository name
             root: Repository root path
             libraries: Dictionary of library name -> library directory path
+            store: Persistent partition store shared across invocations
+            prune_deps: Drop declared deps the VHDL sources never reference,
+                see audit.used_dependencies()
+            lookup_workers: Threads evaluating partition_lookup_async()
+                requests
         """
         super().__init__(name, root)
         self._libraries = libraries
+        self._store = store
+        self._prune_deps = prune_deps
+        self._lock = threading.RLock()
+        self._lookup_workers = lookup_workers
+        self._lookup_pool: Optional[ThreadPoolExecutor] = None
+        # (partition, filter set, prune) -> lookup in progress
+        self._lookups: dict[tuple, Future] = {}
+        self._evaluations = EvaluationMemo()
+        # Canonical paths, sources and partitions shared by all lookups
+        self._interned = InternTable()
+        # filter set -> (definition file stats, graph)
+        self._graphs: dict[frozenset, tuple[list, DependencyGraph]] = {}
+        # filter set -> pruner of its partition deps
+        self._pruners: dict[frozenset, DependencyPruner] = {}
+        self._cost_history: Optional[CostHistory] = None
+        # Library Makefile evaluations listing packages, served by the memo
+        # or not
+        self.enumeration_hits = 0
+        self.enumeration_misses = 0
+
+    def _evaluate_makefile(
+        self,
+        makefile_path: Path,
+        filter_vars: dict[str, str],
+        names: tuple[str, ...],
+        evaluations: Optional[list[Evaluation]] = None
+    ) -> dict[str, str]:
+        """Interpret a Makefile and return the expanded value of names
+
+        Evaluations are memoized on the filter variables they read, so
+        filter sets differing only on variables a Makefile ignores share
+        one evaluation. The evaluation used is appended to evaluations,
+        if given.
+        """
+        evaluation = self._evaluations.evaluate(
+            makefile_path, filter_context_vars(filter_vars), names)
+        if evaluations is not None:
+            evaluations.append(evaluation)
+
+        self._add_definition_file(makefile_path.resolve())
+        return evaluation.values
+
+    def _add_definition_file(self, path: Path) -> None:
+        """Track a Makefile as a definition file"""
+        with self._lock:
+            if path not in self.definition_files:
+                self.definition_files.append(path)
+
+    def invalidate(self, path: Path) -> None:
+        """Drop in-memory state derived from a file that changed
+
+        Every cache revalidates its entries on use anyway; this releases
+        stale entries early, e.g. when a file watcher reports a change.
+        """
+        # Normalized as globbed directories are, see evaluation.glob_directory()
+        path = Path(os.path.normpath(Path(path).absolute()))
+        # Makefiles whose $(wildcard) results may change too
+        makefiles = self._evaluations.globbing(path.parent)
+        if path.name == "Makefile":
+            parse_cache().forget(path)
+            makefiles.append(path)
+
+        for makefile_path in makefiles:
+            self._evaluations.forget(makefile_path)
+            resolved = makefile_path.resolve()
+            for key, (stats, _) in list(self._graphs.items()):
+                if any(Path(p) == resolved for p, _, _ in stats):
+                    del self._graphs[key]
+        if makefiles:
+            # Partitions may change content: without this, canonical objects
+            # of every past content would pile up in a long-lived process
+            self._interned.clear()
+
+        if path.suffix.lower() in (".vhd", ".vhdl"):
+            scan_cache().forget(path)
+            self._pruners.clear()
+
+    def invalidate_all(self) -> None:
+        """Drop all in-memory evaluation state"""
+        self._evaluations.clear()
+        self._graphs.clear()
+        self._pruners.clear()
+        self._interned.clear()
+
+    def library_path(self, library_name: str) -> Path:
+        """Directory of a library"""
+        return self._libraries[library_name]
 
     def file_types(self) -> set[str]:
         """Source file types the planner must always be able to consume.
@@ -59,16 +180,381 @@ class NSLRepository(Repository):
         """
         return {"vhdl"}
 
-    def partition_lookup(self, partition_name: str, filter_vars: dict[str, str]) -> Optional[Partition]:
+    def expand_all(self, filter_vars: dict[str, str], jobs: Optional[int] = None) -> dict[str, Partition]:
+        """Evaluate every library and package of the tree for one filter set
+
+        Library Makefiles and the Makefiles of their packages are evaluated
+        concurrently in a process pool, the interpreter being CPU-bound pure
+        Python. Results seed this repository's caches, so later
+        partition_lookup() calls with the same filter set are cheap.
+
+        Args:
+            filter_vars: Filter variables for Makefile evaluation
+            jobs: Worker processes, defaults to the CPU count. With 1,
+                everything is evaluated in this process.
+
+        Returns:
+            Dictionary of partition name -> Partition, including the
+            "library._bare" partition of every library
+        """
+        context_vars = filter_context_vars(filter_vars)
+        libraries = sorted(self._libraries.items())
+
+        if jobs == 1:
+            results = [evaluate_library(path, context_vars) for _, path in libraries]
+        else:
+            # Forking would copy locks other threads (service requests,
+            # async lookups) may hold. Spawned workers start from the
+            # current directory, as relative library paths need.
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [pool.submit(evaluate_library, path, context_vars)
+                           for _, path in libraries]
+                results = [future.result() for future in futures]
+
+        for library in results:
+            for makefile_path, names, evaluation in library:
+                self._evaluations.add(makefile_path, names, evaluation)
+
+        partitions = {}
+        for library_name, lib_path in libraries:
+            names = [f"{library_name}._bare"]
+            names += [f"{library_name}.{package}"
+                      for package in self._enumerate_library_packages(lib_path, filter_vars)]
+            for partition_name in names:
+                partition = self.partition_lookup(partition_name, filter_vars)
+                if partition is not None:
+                    partitions[partition_name] = partition
+
+        logger.debug(
+            f"Expanded {len(partitions)} partitions from {len(libraries)} libraries "
+            f"(evaluations: {self._evaluations.hits} reused, {self._evaluations.misses} run)"
+        )
+        return partitions
+
+    def dependency_graph(self, filter_vars: dict[str, str], jobs: Optional[int] = None) -> DependencyGraph:
+        """Dependency graph of the whole tree for one filter set
+
+        The graph is kept per filter set and rebuilt when any definition
+        file it was built from changed.
+
+        Args:
+            filter_vars: Filter variables for Makefile evaluation
+            jobs: Worker processes for expand_all() when building the graph
+        """
+        key = frozenset(filter_context_vars(filter_vars).items())
+        cached = self._graphs.get(key)
+        if cached is not None:
+            stats, graph = cached
+            if all(stat_dependency(Path(path)) == (path, mtime_ns, size)
+                   for path, mtime_ns, size in stats):
+                return graph
+
+        partitions = self.expand_all(filter_vars, jobs=jobs)
+        graph = DependencyGraph({name: p.deps for name, p in partitions.items()})
+        stats = [stat_dependency(path) for path in self.definition_files]
+        self._graphs[key] = (stats, graph)
+
+        unresolved = graph.unresolved()
+        if unresolved:
+            logger.debug(f"Dependency graph has unresolved partitions: {' '.join(unresolved)}")
+        return graph
+
+    @property
+    def cost_history(self) -> CostHistory:
+        """Analysis times recorded by previous runs"""
+        if self._cost_history is None:
+            self._cost_history = cost_history()
+        return self._cost_history
+
+    def partition_cost(self, partition: Partition) -> PartitionCost:
+        """Cost hints of a partition, see cost.PartitionCost"""
+        return PartitionCost([source.path for source in partition.sources],
+                             self.cost_history.seconds(partition.name))
+
+    def record_analysis_time(self, partition: Partition, seconds: float) -> None:
+        """Record how long analyzing a partition took, for later schedules"""
+        self.cost_history.record(partition.name, seconds,
+                                 self.partition_cost(partition).source_bytes)
+
+    def scheduler(self, filter_vars: dict[str, str], tops: Optional[Iterable[str]] = None,
+                  jobs: Optional[int] = None) -> CriticalPathScheduler:
+        """Critical-path scheduler for the partitions of a build
+
+        Args:
+            filter_vars: Filter variables for Makefile evaluation
+            tops: Partitions the build needs, with their closure. Defaults
+                to the whole tree.
+            jobs: Worker processes for expand_all() when building the graph
+        """
+        graph = self.dependency_graph(filter_vars, jobs=jobs)
+        names = graph.order if tops is None else graph.compile_order(tops)
+        bytes_per_second = self.cost_history.bytes_per_second()
+
+        costs = {}
+        for name in names:
+            found = self.partition_lookup_with_cost(name, filter_vars)
+            if found is not None:
+                costs[name] = found[1].estimate(bytes_per_second)
+        return CriticalPathScheduler(graph, costs)
+
+    def vhdl_index(
+        self,
+        deps: Iterable[str],
+        filter_vars: dict[str, str],
+        sources: Iterable[Path] = ()
+    ) -> DesignIndex:
+        """Design units of the VHDL sources reachable from some partitions
+
+        Args:
+            deps: Partitions to index, along with their dependencies
+            filter_vars: Filter variables for Makefile evaluation
+            sources: Additional VHDL sources, analyzed into work
+
+        Returns:
+            Index of the sources, in partition compile order then in
+            Makefile order, sources last
+        """
+        deps = list(deps)
+        partitions: dict[str, set[str]] = {}
+        sources_of: dict[str, list[Path]] = {}
+        pending = list(deps)
+        while pending:
+            name = pending.pop()
+            if name in partitions:
+                continue
+            partition = self.partition_lookup(name, filter_vars)
+            if partition is None:
+                partitions[name] = set()
+                continue
+            partitions[name] = set(partition.deps)
+            sources_of[name] = [s.path for s in partition.sources if s.file_type == "vhdl"]
+            pending.extend(partition.deps)
+
+        files = []
+        for name in DependencyGraph(partitions).compile_order(deps):
+            library = name.split(".", 1)[0]
+            files += [(library, path) for path in sources_of.get(name, ())]
+        files += [("work", path) for path in sources]
+        return DesignIndex(files)
+
+    def vhdl_compile_set(
+        self,
+        top: str,
+        deps: Iterable[str],
+        filter_vars: dict[str, str],
+        sources: Iterable[Path] = ()
+    ) -> list[DesignFile]:
+        """Minimal VHDL sources needed to elaborate a top entity
+
+        Partitions reachable from deps are looked up, their VHDL sources
+        indexed, and only the files the top entity actually uses are
+        kept, in analysis order. See vhdl.DesignIndex.
+
+        Args:
+            top: Top entity, declared in one of sources
+            deps: Partitions the top depends on
+            filter_vars: Filter variables for Makefile evaluation
+            sources: VHDL sources of the top, analyzed into work
+
+        Returns:
+            Design files, each with the library it is analyzed into
+        """
+        index = self.vhdl_index(deps, filter_vars, sources)
+        compile_set = index.compile_set(top)
+        logger.debug(f"VHDL compile set of {top}: {len(compile_set)} of {len(index.files)} files")
+        return compile_set
+
+    def partition_lookup_many(
+        self,
+        partition_name: str,
+        filter_sets: list[dict[str, str]]
+    ) -> list[Optional[Partition]]:
+        """Lookup a partition for several filter sets at once
+
+        The library and package Makefiles are each interpreted in a single
+        walk for all filter sets, forking only where they take different
+        branches, see makefile.Batch.
+
+        Returns:
+            One expanded Partition, or None, per filter set
+        """
+        library_name, _, package_name = partition_name.partition('.')
+        lib_path = self._libraries.get(library_name)
+        if lib_path is not None and package_name:
+            context_sets = [filter_context_vars(fv) for fv in filter_sets]
+            lib_makefile = lib_path / "Makefile"
+            makefile_path = lib_makefile if package_name == "_bare" else lib_path / package_name / "Makefile"
+            if lib_makefile.exists():
+                self._evaluations.evaluate_many(lib_makefile, context_sets, LIBRARY_VARIABLES)
+            if makefile_path.exists():
+                self._evaluations.evaluate_many(makefile_path, context_sets, PACKAGE_VARIABLES)
+
+        return [self.partition_lookup(partition_name, filter_vars) for filter_vars in filter_sets]
+
+    async def partition_lookup_async(
+        self,
+        partition_name: str,
+        filter_vars: dict[str, str],
+        prune: Optional[bool] = None
+    ) -> Optional[Partition]:
+        """partition_lookup() off the event loop
+
+        The lookup runs in a bounded thread pool, so that Makefile I/O and
+        interpretation do not stall other coroutines. Concurrent requests
+        for the same partition and filter set share a single evaluation.
+        """
+        key = (partition_name, frozenset(filter_context_vars(filter_vars).items()), prune)
+        with self._lock:
+            future = self._lookups.get(key)
+            if future is None:
+                if self._lookup_pool is None:
+                    self._lookup_pool = ThreadPoolExecutor(
+                        max_workers=self._lookup_workers, thread_name_prefix="nsl-lookup")
+                future = self._lookup_pool.submit(
+                    self.partition_lookup, partition_name, dict(filter_vars), prune)
+                self._lookups[key] = future
+                future.add_done_callback(lambda f: self._lookup_done(key, f))
+        # Cancelling one waiter must not cancel the lookup others share
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _lookup_done(self, key: tuple, future: Future) -> None:
+        with self._lock:
+            if self._lookups.get(key) is future:
+                del self._lookups[key]
+
+    def partition_lookup(
+        self,
+        partition_name: str,
+        filter_vars: dict[str, str],
+        prune: Optional[bool] = None
+    ) -> Optional[Partition]:
         """Lookup partition by name and expand with filter variables
 
         Args:
             partition_name: Partition name in "library.partition" format
             filter_vars: Filter variables for Makefile evaluation
+            prune: Drop unused declared deps, defaults to the repository
+                setting
 
         Returns:
             Expanded Partition or None if not found
         """
+        partition = self._lookup_partition(partition_name, filter_vars)
+        if partition is None:
+            return None
+
+        if self.prunes(prune):
+            key = frozenset(filter_context_vars(filter_vars).items())
+            with self._lock:
+                pruner = self._pruners.setdefault(key, DependencyPruner())
+            used = used_dependencies(partition, lambda name: self._lookup_partition(name, filter_vars),
+                                     pruner)
+            if used != partition.deps:
+                logger.debug(f"Partition {partition_name}: pruned unused deps "
+                             f"{' '.join(sorted(set(partition.deps) - used))}")
+                partition = self._interned.partition(partition.name, partition.sources, used)
+        return partition
+
+    def prunes(self, prune: Optional[bool] = None) -> bool:
+        """Whether partition_lookup() drops unused deps, for its prune argument"""
+        return self._prune_deps if prune is None else prune
+
+    def partition_lookup_with_cost(
+        self,
+        partition_name: str,
+        filter_vars: dict[str, str],
+        prune: Optional[bool] = None
+    ) -> Optional[tuple[Partition, PartitionCost]]:
+        """partition_lookup() along with the cost hints of the partition
+
+        Partitions are shared between lookups, see interning.InternTable,
+        so hints are returned next to them rather than attached.
+        """
+        partition = self.partition_lookup(partition_name, filter_vars, prune)
+        if partition is None:
+            return None
+        return partition, self.partition_cost(partition)
+
+    def _lookup_partition(self, partition_name: str, filter_vars: dict[str, str]) -> Optional[Partition]:
+        """Partition as declared by the Makefiles, see partition_lookup()"""
+        if self._store is None:
+            return self._resolve_partition(partition_name, filter_vars)
+
+        # Reuse a partition evaluated by an earlier gbs run, as long as none
+        # of the Makefiles or globbed directories it came from changed
+        # The store is shared by checkouts, tell them apart however the root
+        # was spelled
+        root = self.root.resolve()
+        digest = filter_digest(filter_context_vars(filter_vars))
+        record = self._store.get(root, partition_name, digest)
+        if record is not None and self._record_is_ours(partition_name, record):
+            logger.debug(f"Partition {partition_name} loaded from store")
+            return self._partition_from_record(partition_name, record)
+
+        # Stored along with the state of its dependencies when they were
+        # evaluated, which may be earlier than now for memoized evaluations
+        evaluations: list[Evaluation] = []
+        partition = self._resolve_partition(partition_name, filter_vars, evaluations)
+        if partition is not None:
+            makefiles = self._partition_makefiles(partition_name)
+            dependencies = [d for evaluation in evaluations for d in evaluation.dependencies]
+            self._store.put(root, partition_name, digest,
+                            self._partition_to_record(partition, makefiles),
+                            dependencies)
+        return partition
+
+    def partition_record(self, partition_name: str, filter_vars: dict[str, str],
+                         prune: Optional[bool] = None) -> Optional[PartitionRecord]:
+        """partition_lookup() result in serializable form"""
+        partition = self.partition_lookup(partition_name, filter_vars, prune)
+        if partition is None:
+            return None
+        return self._partition_to_record(partition, self._partition_makefiles(partition_name))
+
+    def _partition_makefiles(self, partition_name: str) -> list[Path]:
+        """Makefiles a partition is evaluated from, library Makefile first"""
+        library_name, package_name = partition_name.split('.', 1)
+        lib_path = self._libraries[library_name]
+        makefiles = [lib_path / "Makefile"]
+        if package_name != "_bare":
+            makefiles.append(lib_path / package_name / "Makefile")
+        return makefiles
+
+    @staticmethod
+    def _partition_to_record(partition: Partition, makefiles: list[Path]) -> PartitionRecord:
+        # Paths are made absolute, records are read from other directories
+        sources = [
+            (str(Path(source.path).absolute()), source.file_type,
+             tuple(str(Path(d).absolute()) for d in (getattr(source, "include_dirs", None) or ())))
+            for source in partition.sources
+        ]
+        return PartitionRecord(sources, sorted(partition.deps),
+                               [str(m.resolve()) for m in makefiles])
+
+    def _record_is_ours(self, partition_name: str, record: PartitionRecord) -> bool:
+        """Whether a stored record was evaluated from this checkout's Makefiles"""
+        if partition_name.split('.', 1)[0] not in self._libraries:
+            return False
+        expected = [str(m.resolve()) for m in self._partition_makefiles(partition_name)]
+        if record.definition_files != expected:
+            logger.debug(f"Stored partition {partition_name} comes from another tree, ignored")
+            return False
+        return True
+
+    def _partition_from_record(self, partition_name: str, record: PartitionRecord) -> Partition:
+        for makefile in record.definition_files:
+            self._add_definition_file(Path(makefile))
+
+        sources = [self._interned.source(path, file_type, include_dirs)
+                   for path, file_type, include_dirs in record.sources]
+        return self._interned.partition(partition_name, sources, record.deps)
+
+    def _resolve_partition(self, partition_name: str, filter_vars: dict[str, str],
+                           evaluations: Optional[list[Evaluation]] = None) -> Optional[Partition]:
+        """Evaluate a partition from the Makefiles, see partition_lookup()
+
+        The Makefile evaluations used are appended to evaluations, if given.
+        """
         # Parse partition name
         if '.' not in partition_name:
             logger.warning(f"Partition name must be in 'library.partition' format: {partition_name}")
@@ -89,10 +575,11 @@ class NSLRepository(Repository):
             if not makefile_path.exists():
                 logger.warning(f"Bare library {library_name} has no Makefile at {makefile_path}")
                 return None
-            return self._evaluate_package(partition_name, lib_path, makefile_path, filter_vars, library_name)
+            return self._evaluate_package(partition_name, lib_path, makefile_path, filter_vars, library_name,
+                                          evaluations)
 
         # Enumerate packages for this library using filter vars
-        packages = self._enumerate_library_packages(lib_path, filter_vars)
+        packages = self._enumerate_library_packages(lib_path, filter_vars, evaluations)
 
         # Check if requested package is in the enumerated list
         if package_name not in packages:
@@ -106,14 +593,19 @@ class NSLRepository(Repository):
             logger.warning(f"Package {package_name} has no Makefile at {makefile_path}")
             return None
 
-        return self._evaluate_package(partition_name, package_path, makefile_path, filter_vars, library_name)
+        return self._evaluate_package(partition_name, package_path, makefile_path, filter_vars, library_name,
+                                      evaluations)
 
-    def _enumerate_library_packages(self, lib_path: Path, filter_vars: dict[str, str]) -> list[str]:
+    @traced("NSLRepository._enumerate_library_packages",
+            lambda self, lib_path, *args, **kwargs: lib_path.name)
+    def _enumerate_library_packages(self, lib_path: Path, filter_vars: dict[str, str],
+                                    evaluations: Optional[list[Evaluation]] = None) -> list[str]:
         """Enumerate packages in a library by evaluating library Makefile
 
         Args:
             lib_path: Path to library directory
             filter_vars: Filter variables for enumeration
+            evaluations: Receives the Makefile evaluation used, if given
 
         Returns:
             List of package names available with these filter vars
@@ -123,34 +615,34 @@ class NSLRepository(Repository):
             logger.warning(f"Library has no Makefile at {makefile_path}")
             return []
 
-        # Create Makefile context with filter variables
-        context = Context()
-
-        for key, value in filter_vars.items():
-            context[key] = str(value)
-
-        # Parse and interpret library Makefile
-        makefile = Makefile(makefile_path)
-        makefile.interpret(context)
-
-        # Track this Makefile as a definition file
-        if makefile_path.resolve() not in self.definition_files:
-            self.definition_files.append(makefile_path.resolve())
-
-        # Extract package list (filter-dependent!)
-        packages_str = context.expand(context.get("packages", ""))
-        packages = packages_str.split()
-
-        logger.debug(f"Library {lib_path.name} enumerated: {len(packages)} packages")
+        # Extract package list (filter-dependent!), the library evaluation
+        # is memoized along with the package ones
+        hit = self._evaluations.cached(
+            makefile_path, filter_context_vars(filter_vars), LIBRARY_VARIABLES) is not None
+        values = self._evaluate_makefile(makefile_path, filter_vars, LIBRARY_VARIABLES, evaluations)
+        packages = values["packages"].split()
+
+        with self._lock:
+            if hit:
+                self.enumeration_hits += 1
+            else:
+                self.enumeration_misses += 1
+            hits, misses = self.enumeration_hits, self.enumeration_misses
+        count("library enumeration memo " + ("hit" if hit else "miss"))
+        logger.debug(f"Library {lib_path.name} enumerated: {len(packages)} packages, "
+                     f"memo {'hit' if hit else 'miss'} ({hits} hits, {misses} misses so far)")
         return packages
 
+    @traced("NSLRepository._evaluate_package",
+            lambda self, partition_name, *args, **kwargs: partition_name)
     def _evaluate_package(
         self,
         partition_name: str,
         package_path: Path,
         makefile_path: Path,
         filter_vars: dict[str, str],
-        library_name: str
+        library_name: str,
+        evaluations: Optional[list[Evaluation]] = None
     ) -> Partition:
         """Evaluate package Makefile to get sources and dependencies
 
@@ -160,59 +652,43 @@ class NSLRepository(Repository):
             makefile_path: Path to package Makefile
             filter_vars: Filter variables
             library_name: Library name for qualifying deps
+            evaluations: Receives the Makefile evaluation used, if given
 
         Returns:
             Expanded Partition
         """
         logger.debug(f"Evaluating NSL package {makefile_path} with filter vars {filter_vars}")
 
-        # Create Makefile context with filter variables
-        context = Context()
-
-        for key, value in filter_vars.items():
-            context[key] = str(value)
-
-        # Parse and interpret Makefile
-        makefile = Makefile(makefile_path)
-        makefile.interpret(context)
-
-        # Track this Makefile as a definition file
-        if makefile_path.resolve() not in self.definition_files:
-            self.definition_files.append(makefile_path.resolve())
+        values = self._evaluate_makefile(makefile_path, filter_vars, PACKAGE_VARIABLES, evaluations)
 
         # Extract sources
-        vhdl_sources_str = context.expand(context.get("vhdl-sources", ""))
-        verilog_sources_str = context.expand(context.get("verilog-sources", ""))
-        systemverilog_sources_str = context.expand(context.get("systemverilog-sources", ""))
+        vhdl_sources_str = values["vhdl-sources"]
+        verilog_sources_str = values["verilog-sources"]
+        systemverilog_sources_str = values["systemverilog-sources"]
 
+        interned = self._interned
         sources = []
 
         # VHDL sources
         for source_file in vhdl_sources_str.split():
             source_file = source_file.strip()
             if source_file and not source_file.startswith('$('):
-                sources.append(SourceFile(
-                    path=package_path / source_file,
-                    file_type="vhdl"
-                ))
+                sources.append(interned.source(
+                    os.path.join(package_path, source_file), "vhdl"))
 
         # Verilog sources
         for source_file in verilog_sources_str.split():
             source_file = source_file.strip()
             if source_file and not source_file.startswith('$('):
-                sources.append(SourceFile(
-                    path=package_path / source_file,
-                    file_type="verilog"
-                ))
+                sources.append(interned.source(
+                    os.path.join(package_path, source_file), "verilog"))
 
         # SystemVerilog sources
         for source_file in systemverilog_sources_str.split():
             source_file = source_file.strip()
             if source_file and not source_file.startswith('$('):
-                sources.append(SourceFile(
-                    path=package_path / source_file,
-                    file_type="systemverilog"
-                ))
+                sources.append(interned.source(
+                    os.path.join(package_path, source_file), "systemverilog"))
 
         # GHDL VHPIDIRECT C sources. Package Makefiles declare these in
         # vhpidirect-sources under their tool==ghdl branch; the GHDL simulate
@@ -224,19 +700,17 @@ class NSLRepository(Repository):
         # under build/support/vhpidirect (a sibling of lib/), not GHDL. Attach
         # that include directory so the compile finds it without per-project
         # configuration.
-        vhpidirect_support = self.root.parent / "build" / "support" / "vhpidirect"
-        vhpidirect_sources_str = context.expand(context.get("vhpidirect-sources", ""))
+        vhpidirect_support = (os.path.join(self.root.parent, "build", "support", "vhpidirect"),)
+        vhpidirect_sources_str = values["vhpidirect-sources"]
         for source_file in vhpidirect_sources_str.split():
             source_file = source_file.strip()
             if source_file and not source_file.startswith('$('):
-                sources.append(SourceFile(
-                    path=package_path / source_file,
-                    file_type="ghdl-vhpidirect-c",
-                    include_dirs=[vhpidirect_support],
-                ))
+                sources.append(interned.source(
+                    os.path.join(package_path, source_file), "ghdl-vhpidirect-c",
+                    vhpidirect_support))
 
         # Extract dependencies and qualify them
-        deps_str = context.expand(context.get("deps", ""))
+        deps_str = values["deps"]
         deps = set()
 
         for dep in deps_str.split():
@@ -257,14 +731,14 @@ class NSLRepository(Repository):
                         # Package in current library
                         deps.add(f"{library_name}.{dep}")
 
-        logger.debug(f"Evaluated partition {partition_name}: {len(sources)} sources, {len(deps)} deps")
-
-        return Partition(
-            name=partition_name,
-            sources=sources,
-            deps=deps
+        logger.debug(
+            f"Evaluated partition {partition_name}: {len(sources)} sources, {len(deps)} deps "
+            f"(evaluations: {self._evaluations.hits} reused, {self._evaluations.misses} run)"
         )
 
+        # Filter sets yielding the same content share one Partition
+        return interned.partition(partition_name, sources, deps)
+
 
 class NSLTreeLoader(RepositoryLoader):
     """Repository loader for NSL tree format"""
@@ -306,8 +780,25 @@ class NSLTreeLoader(RepositoryLoader):
         # Use directory name as repository name
         name = root.name
 
+        store_dir = cache_directory(f"partitions-v{PartitionStore.SCHEMA}")
+        store = PartitionStore(store_dir / "partitions.sqlite") if store_dir else None
+
+        # Opt-in: drop declared deps the VHDL sources never reference
+        prune_deps = os.environ.get("GBS_NSL_PRUNE_DEPS", "") not in ("", "off", "0")
+
         logger.info(f"Loaded NSL repository '{name}' with {len(libraries)} libraries")
-        return NSLRepository(name=name, root=root, libraries=libraries)
+
+        # Opt-in: query a warm repository service, see service.py
+        service = os.environ.get("GBS_NSL_SERVICE", "")
+        if service not in ("", "off", "0"):
+            from .service import ServiceRepository, default_socket_path
+            socket_path = default_socket_path(root) if service in ("1", "on", "auto") else Path(service)
+            if socket_path is not None:
+                return ServiceRepository(socket_path, name=name, root=root, libraries=libraries,
+                                         store=store, prune_deps=prune_deps)
+
+        return NSLRepository(name=name, root=root, libraries=libraries, store=store,
+                             prune_deps=prune_deps)
 
 
 def enumerate_repository_parsers():
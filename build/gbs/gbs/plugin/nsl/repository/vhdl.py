@@ -0,0 +1,373 @@
+"""VHDL design-unit index
+
+Partitions list their VHDL sources, and build.mk only orders them with the
+%.pkg.vhd-first heuristic. A simulation top then analyzes every file of
+every reachable partition, even when it elaborates a fraction of them.
+
+This module scans VHDL files for the design units they declare (entities,
+architectures, packages, package bodies, configurations, contexts) and for
+the units they reference (library/use/context clauses, selected names,
+entity and component instantiations). From a top entity, it computes the
+files actually needed for elaboration, in a valid analysis order.
+
+The scanner is a set of regular expressions over the source with comments
+and strings removed, not a parser. It errs on the side of including too
+much: a reference is followed whenever it names a unit of the index.
+Results are cached per file content, see cache.ParseCache.
+"""
+
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import hashlib
+import heapq
+import re
+
+from .cache import ParseCache, cache_directory
+
+# Bump whenever scan() output changes
+SCAN_FORMAT = 2
+
+# Comments, strings and character literals, blanked before scanning
+_NOISE = re.compile(r"--[^\n]*|/\*.*?\*/|\"(?:[^\"\n]|\"\")*\"|'[^\n]'", re.S)
+
+_LIBRARY = re.compile(r"\blibrary\s+(\w+(?:\s*,\s*\w+)*)\s*;")
+_SELECTED = re.compile(r"\b(\w+)\s*\.\s*(\w+)")
+_ENTITY = re.compile(r"\bentity\s+(\w+)\s+is\b")
+_ARCHITECTURE = re.compile(r"\barchitecture\s+(\w+)\s+of\s+(\w+)\s+is\b")
+_PACKAGE = re.compile(r"\bpackage\s+(?!body\b)(\w+)\s+is\b")
+_PACKAGE_BODY = re.compile(r"\bpackage\s+body\s+(\w+)\s+is\b")
+_CONFIGURATION = re.compile(r"\bconfiguration\s+(\w+)\s+of\s+(\w+)\s+is\b")
+_CONTEXT = re.compile(r"\bcontext\s+(\w+)\s+is\b")
+_ENTITY_INSTANCE = re.compile(r"\bentity\s+(\w+)\s*\.\s*(\w+)")
+_COMPONENT_INSTANCE = re.compile(
+    r"\b\w+\s*:\s*(?:component\s+)?(?:\w+\s*\.\s*)*(\w+)\s+(?:generic|port)\s+map\b")
+
+# Record kinds returned by scan()
+DECLARATIONS = ("entity", "architecture", "package", "package body", "configuration", "context")
+REFERENCES = ("selected", "entity instance", "component")
+
+# Units other units can depend on at analysis time
+PRIMARY_UNITS = ("entity", "package", "configuration", "context")
+
+
+def _blank(m: re.Match) -> str:
+    return " " * len(m.group(0))
+
+
+def _blank_comment(m: re.Match) -> str:
+    return m.group(0) if m.group(0)[0] in "\"'" else _blank(m)
+
+
+def _digests(text: str, starts: list[tuple[int, str]]) -> tuple[str, str]:
+    """Digests of a file's interface and of its whole content
+
+    text has comments blanked. The file is cut at each unit
+    declaration; the interface is made of the primary unit pieces, so
+    editing an architecture or a package body leaves it unchanged.
+    Whitespace is not significant.
+    """
+    interface = hashlib.sha256()
+    content = hashlib.sha256()
+    starts = sorted(starts)
+    bounds = [0] + [start for start, _ in starts] + [len(text)]
+    kinds = [None] + [kind for _, kind in starts]
+    for kind, begin, end in zip(kinds, bounds, bounds[1:]):
+        piece = " ".join(text[begin:end].split()).encode() + b"\n"
+        content.update(piece)
+        # Context clauses heading the file apply to its first unit
+        if kind is None or kind in PRIMARY_UNITS:
+            interface.update(piece)
+    return interface.hexdigest(), content.hexdigest()
+
+
+def scan(path: Path, text: str) -> list[tuple[str, str, Optional[str]]]:
+    """Design units a VHDL file declares and references
+
+    Returns:
+        (kind, name, extra) records. Declarations are (kind, name, entity)
+        with entity set for architectures and configurations. References
+        are ("selected", library, unit) for a name prefixed by a library
+        of a library clause or work, ("entity instance", library, entity)
+        and ("component", name, None). Identifiers are lowercase.
+        A last ("digest", interface, content) record holds the digests of
+        the file's primary units and of the whole file, comments and
+        whitespace excluded.
+    """
+    # Blanking preserves offsets, so declarations found in the scanned
+    # text also delimit units of the digested one
+    digested = _NOISE.sub(_blank_comment, text)
+    text = _NOISE.sub(_blank, text.lower())
+
+    libraries = {"work"}
+    for m in _LIBRARY.finditer(text):
+        libraries.update(name.strip() for name in m.group(1).split(","))
+
+    records = []
+    starts = []
+    for kind, regex, of in (("entity", _ENTITY, False),
+                            ("architecture", _ARCHITECTURE, True),
+                            ("package", _PACKAGE, False),
+                            ("package body", _PACKAGE_BODY, False),
+                            ("configuration", _CONFIGURATION, True),
+                            ("context", _CONTEXT, False)):
+        for m in regex.finditer(text):
+            records.append((kind, m.group(1), m.group(2) if of else None))
+            starts.append((m.start(), kind))
+
+    references = set()
+    for m in _SELECTED.finditer(text):
+        if m.group(1) in libraries:
+            references.add(("selected", m.group(1), m.group(2)))
+    for m in _ENTITY_INSTANCE.finditer(text):
+        references.add(("entity instance", m.group(1), m.group(2)))
+    for m in _COMPONENT_INSTANCE.finditer(text):
+        references.add(("component", m.group(1), None))
+
+    records += sorted(references, key=lambda r: (r[0], r[1], r[2] or ""))
+    records.append(("digest",) + _digests(digested, starts))
+    return records
+
+
+_scan_cache: Optional[ParseCache] = None
+
+def scan_cache() -> ParseCache:
+    """Process-wide scan cache, persisted under the gbs-nsl cache directory"""
+    global _scan_cache
+    if _scan_cache is None:
+        _scan_cache = ParseCache(scan, cache_directory(f"vhdl-v{SCAN_FORMAT}"), name="vhdl scan")
+    return _scan_cache
+
+
+# Predicate restricting an index to some of its files
+Scope = Optional[Callable[["DesignFile"], bool]]
+
+
+class UnitNotFound(Exception):
+    """The requested top unit is not declared by any indexed file"""
+    pass
+
+
+class DesignFile:
+    """A VHDL source file and the design units it declares and references"""
+
+    __slots__ = ("path", "library", "declarations", "references", "interface", "digest")
+
+    def __init__(self, path: Path, library: str, records: list[tuple[str, str, Optional[str]]]):
+        """
+        path: source file
+        library: library the file is analyzed into
+        records: scan() output for the file
+        """
+        self.path = path
+        self.library = library
+        self.declarations = [r for r in records if r[0] in DECLARATIONS]
+        self.references = [r for r in records if r[0] in REFERENCES]
+        _, self.interface, self.digest = records[-1]
+
+    def declares_primary_unit(self) -> bool:
+        """Whether other units may depend on this file for analysis"""
+        return any(kind in PRIMARY_UNITS for kind, _, _ in self.declarations)
+
+    def __repr__(self):
+        return f"<DesignFile {self.library}:{self.path}>"
+
+
+class DesignIndex:
+    """Design units of a set of VHDL files, by library and name"""
+
+    def __init__(self, files: Iterable[tuple[str, Path]], cache: Optional[ParseCache] = None):
+        """
+        files: (library, path) of every VHDL source, in the order build.mk
+            would analyze them. This order breaks ties in compile_set().
+        cache: Scan cache, defaults to the process-wide one
+        """
+        self._cache = scan_cache() if cache is None else cache
+        self.files: list[DesignFile] = []
+        # (kind, library, name) -> indices of declaring files
+        self._units: dict[tuple[str, str, str], list[int]] = {}
+        for library, path in files:
+            self.add(library, path)
+
+    def add(self, library: str, path: Path) -> DesignFile:
+        """Index one more file, after the others"""
+        index = len(self.files)
+        design_file = DesignFile(path, library.lower(), self._cache.statements(path))
+        self.files.append(design_file)
+        for kind, name, entity in design_file.declarations:
+            # Architectures and configurations are looked up by entity
+            key_name = entity if kind in ("architecture", "configuration") else name
+            self._units.setdefault((kind, design_file.library, key_name), []).append(index)
+        return design_file
+
+    def _declaring(self, kind: str, library: str, name: str, scope: Scope = None) -> list[int]:
+        found = self._units.get((kind, library, name), [])
+        if scope is not None:
+            found = [i for i in found if scope(self.files[i])]
+        return found
+
+    def _entity_files(self, library: str, name: str, scope: Scope = None) -> list[int]:
+        """Files needed to elaborate an entity: itself and its architectures"""
+        entity = self._declaring("entity", library, name, scope)
+        if not entity:
+            return []
+        return entity + self._declaring("architecture", library, name, scope)
+
+    def _resolve(self, design_file: DesignFile, scope: Scope = None) -> tuple[set[int], set[int]]:
+        """Files a file needs to be analyzed before it, and to be elaborated
+
+        Only files accepted by scope, if given, are considered, as if the
+        index held no other.
+
+        Returns:
+            (analysis dependencies, elaboration dependencies), the former
+            being a subset of the latter
+        """
+        analysis: set[int] = set()
+        elaboration: set[int] = set()
+        library = design_file.library
+
+        def local(name: str) -> str:
+            return library if name == "work" else name
+
+        for kind, name, entity in design_file.declarations:
+            if kind in ("architecture", "configuration"):
+                analysis.update(self._declaring("entity", library, entity, scope))
+            elif kind == "package body":
+                analysis.update(self._declaring("package", library, name, scope))
+            elif kind == "package":
+                elaboration.update(self._declaring("package body", library, name, scope))
+
+        for kind, first, second in design_file.references:
+            if kind == "selected":
+                lib = local(first)
+                analysis.update(self._declaring("package", lib, second, scope))
+                analysis.update(self._declaring("context", lib, second, scope))
+                analysis.update(self._declaring("entity", lib, second, scope))
+                elaboration.update(self._declaring("package body", lib, second, scope))
+                elaboration.update(self._entity_files(lib, second, scope))
+            elif kind == "entity instance":
+                lib = local(first)
+                analysis.update(self._declaring("entity", lib, second, scope))
+                elaboration.update(self._entity_files(lib, second, scope))
+
+        for kind, name, _ in design_file.references:
+            if kind == "component":
+                elaboration.update(self._bind(design_file, name, scope))
+
+        elaboration |= analysis
+        return analysis, elaboration
+
+    def _bind(self, design_file: DesignFile, component: str, scope: Scope = None) -> list[int]:
+        """Default binding of a component instance: an entity of the same
+        name, in the file's own library first, then in libraries the file
+        references"""
+        library = design_file.library
+        visible = {library if first == "work" else first
+                   for kind, first, _ in design_file.references if kind == "selected"}
+        for lib in [library] + sorted(visible - {library}):
+            found = self._entity_files(lib, component, scope)
+            if found:
+                return found
+        return []
+
+    def unbound_components(self, design_file: DesignFile, scope: Scope = None) -> list[str]:
+        """Components instantiated by a file with no matching entity in the
+        index, e.g. vendor primitives or Verilog modules
+
+        scope: Only consider the files it accepts
+        """
+        return [name for kind, name, _ in design_file.references
+                if kind == "component" and not self._bind(design_file, name, scope)]
+
+    def analysis_dependencies(self, design_file: DesignFile) -> list[DesignFile]:
+        """Files that must be analyzed before design_file"""
+        analysis, _ = self._resolve(design_file)
+        return [self.files[i] for i in sorted(analysis) if self.files[i] is not design_file]
+
+    def elaboration_dependencies(self, design_file: DesignFile, scope: Scope = None) -> list[DesignFile]:
+        """Files design_file directly uses, for analysis or elaboration
+
+        scope: Only consider the files it accepts
+        """
+        _, elaboration = self._resolve(design_file, scope)
+        return [self.files[i] for i in sorted(elaboration) if self.files[i] is not design_file]
+
+    def compile_set(self, top: str, library: str = "work") -> list[DesignFile]:
+        """Files needed to elaborate a top entity, in analysis order
+
+        Only the files reachable from the top are returned. Files are
+        ordered so that every unit is analyzed after those it uses; files
+        not constrained by one another keep their relative input order.
+
+        Args:
+            top: Top entity name
+            library: Library of the top entity
+        """
+        top = top.lower()
+        library = library.lower()
+        roots = self._entity_files(library, top) + self._declaring("configuration", library, top)
+        if not roots:
+            raise UnitNotFound(f"Entity {library}.{top} is not declared by any source")
+
+        resolved: dict[int, tuple[set[int], set[int]]] = {}
+        pending = list(roots)
+        while pending:
+            index = pending.pop()
+            if index in resolved:
+                continue
+            resolved[index] = self._resolve(self.files[index])
+            pending.extend(i for i in resolved[index][1] if i not in resolved)
+
+        return [self.files[i] for i in self._analysis_order(resolved)]
+
+    @staticmethod
+    def _analysis_order(resolved: dict[int, tuple[set[int], set[int]]]) -> list[int]:
+        """Kahn's algorithm over analysis dependencies, ties broken by
+        input order. Files in a cycle, which no order can satisfy, are
+        appended in input order."""
+        dependents: dict[int, list[int]] = {i: [] for i in resolved}
+        pending: dict[int, int] = {}
+        for i, (analysis, _) in resolved.items():
+            deps = analysis - {i}
+            pending[i] = len(deps)
+            for d in deps:
+                dependents[d].append(i)
+
+        ready = [i for i, count in pending.items() if not count]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            i = heapq.heappop(ready)
+            order.append(i)
+            for j in dependents[i]:
+                pending[j] -= 1
+                if not pending[j]:
+                    heapq.heappush(ready, j)
+
+        if len(order) != len(resolved):
+            done = set(order)
+            order += sorted(i for i in resolved if i not in done)
+        return order
+
+
+if __name__ == "__main__":
+    import click
+
+    @click.command()
+    @click.argument("root", type = click.Path(dir_okay = True, file_okay = False, exists = True))
+    @click.argument("sources", type = click.Path(dir_okay = False, exists = True), nargs = -1)
+    @click.option("-t", "--top", type = str, required = True, help = "Top entity")
+    @click.option("-d", "--dep", "deps", type = str, multiple = True,
+                  help = "Partition the top depends on")
+    @click.option("-s", "--set", "settings", type = str, multiple = True,
+                  help = "Filter variable, as name=value")
+    def compile_set(root, sources, top, deps, settings):
+        from .tree import NSLTreeLoader
+
+        filter_vars = dict([v.split('=', 1) for v in settings])
+        repository = NSLTreeLoader(Path(root)).load()
+        files = repository.vhdl_compile_set(top, deps, filter_vars, [Path(s) for s in sources])
+        for design_file in files:
+            print(design_file.library, design_file.path)
+
+    compile_set()
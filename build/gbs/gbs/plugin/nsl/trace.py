@@ -0,0 +1,277 @@
+"""Opt-in tracing of the NSL plugin hot paths
+
+Set GBS_NSL_TRACE to a file name to record timed spans around Makefile
+parsing, interpretation and expansion, package enumeration and evaluation,
+and CDC constraint generation, along with cache hit and miss counters and
+evaluation counts per Makefile. At exit, the trace is written to that file
+as Chrome trace-event JSON (open it in chrome://tracing or Perfetto), and a
+plain-text summary of the top offenders next to it, with a .txt suffix.
+GBS_NSL_TRACE=1 writes gbs-nsl-trace.json in the current directory.
+
+When the variable is unset, empty, "off" or "0", traced() returns functions
+untouched and span() and count() do nothing, so instrumentation costs close
+to nothing. The variable is read once, when this module is imported.
+
+Only the planning process is traced: worker processes started by
+NSLRepository.expand_all(jobs=...) are not.
+"""
+
+from pathlib import Path
+from typing import Callable, Optional
+import asyncio
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+# Trace events kept at most, aggregates are still updated past it
+MAX_EVENTS = 1_000_000
+
+# Rows of each summary table
+SUMMARY_ROWS = 20
+
+
+class _NoSpan:
+    """Span of a disabled tracer"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("_tracer", "_name", "_detail", "_start", "_children", "_stack")
+
+    def __init__(self, tracer: "Tracer", name: str, detail: Optional[str]):
+        self._tracer = tracer
+        self._name = name
+        self._detail = detail
+
+    def __enter__(self):
+        self._stack = self._tracer._stack()
+        self._stack.append(self)
+        self._children = 0
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        duration = end - self._start
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1]._children += duration
+        self._tracer._record(self._name, self._detail, self._start, duration,
+                             duration - self._children, threading.get_ident())
+        return False
+
+
+class Tracer:
+    """Collector of spans and counters"""
+
+    def __init__(self, path: Path):
+        """
+        path: Chrome trace file written by save()
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._events: list[dict] = []
+        # (name, detail) -> [calls, total ns, self ns, max ns]
+        self._spans: dict[tuple[str, Optional[str]], list[int]] = {}
+        self._counters: dict[str, int] = {}
+        # counter -> key -> value
+        self._keyed: dict[str, dict[str, int]] = {}
+
+    def _stack(self) -> list[_Span]:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def active(self, name: str) -> bool:
+        """Whether a span called name is open in the current thread"""
+        return any(s._name == name for s in self._stack())
+
+    def span(self, name: str, detail: Optional[str] = None) -> _Span:
+        """Context manager timing a block
+
+        Spans nest per thread: the self time of a span excludes the time
+        spent in spans opened inside it.
+        """
+        return _Span(self, name, detail)
+
+    def _record(self, name: str, detail: Optional[str], start: int, duration: int,
+                self_time: int, tid: int) -> None:
+        with self._lock:
+            for key in ((name, None), (name, detail)) if detail is not None else ((name, None),):
+                stats = self._spans.get(key)
+                if stats is None:
+                    stats = self._spans[key] = [0, 0, 0, 0]
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] += self_time
+                stats[3] = max(stats[3], duration)
+            if len(self._events) < MAX_EVENTS:
+                event = {
+                    "name": name, "cat": "nsl", "ph": "X", "pid": self._pid, "tid": tid,
+                    "ts": (start - self._origin) / 1000, "dur": duration / 1000,
+                }
+                if detail is not None:
+                    event["args"] = {"detail": detail}
+                self._events.append(event)
+
+    def count(self, name: str, value: int = 1, key: Optional[str] = None) -> None:
+        """Add value to a counter
+
+        Keyed counters (e.g. evaluations per Makefile) only appear in the
+        summary, plain ones also as counter tracks of the trace.
+        """
+        with self._lock:
+            if key is not None:
+                keyed = self._keyed.setdefault(name, {})
+                keyed[key] = keyed.get(key, 0) + value
+                return
+            total = self._counters.get(name, 0) + value
+            self._counters[name] = total
+            if len(self._events) < MAX_EVENTS:
+                self._events.append({
+                    "name": name, "cat": "nsl", "ph": "C", "pid": self._pid,
+                    "ts": (time.perf_counter_ns() - self._origin) / 1000,
+                    "args": {"value": total},
+                })
+
+    def summary(self) -> str:
+        """Plain-text report of the costliest spans and busiest counters"""
+        with self._lock:
+            spans = {k: list(v) for k, v in self._spans.items()}
+            counters = dict(self._counters)
+            keyed = {k: dict(v) for k, v in self._keyed.items()}
+
+        lines = [f"NSL trace, {(time.perf_counter_ns() - self._origin) / 1e9:.3f} s", ""]
+
+        def table(title, rows):
+            lines.append(title)
+            lines.append(f"{'calls':>9} {'total ms':>10} {'self ms':>10} {'max ms':>9}  name")
+            for (name, detail), (calls, total, own, longest) in rows[:SUMMARY_ROWS]:
+                label = name if detail is None else f"{name} {detail}"
+                lines.append(f"{calls:>9} {total / 1e6:>10.1f} {own / 1e6:>10.1f} "
+                             f"{longest / 1e6:>9.1f}  {label}")
+            lines.append("")
+
+        by_self = lambda item: -item[1][2]
+        table("Spans by self time",
+              sorted(((k, v) for k, v in spans.items() if k[1] is None), key=by_self))
+        table("Slowest span instances by self time",
+              sorted(((k, v) for k, v in spans.items() if k[1] is not None), key=by_self))
+
+        if counters:
+            lines.append("Counters")
+            for name, value in sorted(counters.items()):
+                lines.append(f"{value:>9}  {name}")
+            lines.append("")
+
+        for name, values in sorted(keyed.items()):
+            lines.append(f"Top {name}")
+            for key, value in sorted(values.items(), key=lambda kv: (-kv[1], kv[0]))[:SUMMARY_ROWS]:
+                lines.append(f"{value:>9}  {key}")
+            lines.append("")
+
+        return "\n".join(lines)
+
+    def save(self) -> None:
+        """Write the trace and its summary"""
+        with self._lock:
+            events = list(self._events)
+        try:
+            self.path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+            self.path.with_suffix(".txt").write_text(self.summary())
+        except OSError:
+            pass
+
+
+def _tracer_from_environment() -> Optional[Tracer]:
+    value = os.environ.get("GBS_NSL_TRACE", "")
+    if value.lower() in ("", "off", "0"):
+        return None
+    if value.lower() in ("1", "on"):
+        value = "gbs-nsl-trace.json"
+    tracer = Tracer(Path(value).absolute())
+    atexit.register(tracer.save)
+    return tracer
+
+
+_tracer = _tracer_from_environment()
+
+
+def tracer() -> Optional[Tracer]:
+    """Process-wide tracer, None when tracing is disabled"""
+    return _tracer
+
+
+def span(name: str, detail: Optional[str] = None):
+    """Time a block, see Tracer.span()"""
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.span(name, detail)
+
+
+def count(name: str, value: int = 1, key: Optional[str] = None) -> None:
+    """Add to a counter, see Tracer.count()"""
+    if _tracer is not None:
+        _tracer.count(name, value, key)
+
+
+def traced(name: str, detail: Optional[Callable[..., object]] = None,
+           reentrant: bool = True):
+    """Decorator timing each call of a function as a span
+
+    Args:
+        name: Span name
+        detail: Called with the function arguments, returns what tells
+            calls apart in the summary (e.g. a Makefile path)
+        reentrant: Whether recursive calls get their own span; when False,
+            only the outermost call is timed
+
+    Coroutine functions are supported. As coroutines of one thread
+    interleave, their spans are recorded on a track per task and do not
+    nest with others.
+    """
+    def decorator(function):
+        if _tracer is None:
+            return function
+
+        def describe(args, kwargs):
+            return None if detail is None else str(detail(*args, **kwargs))
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter_ns()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    duration = time.perf_counter_ns() - start
+                    _tracer._record(name, describe(args, kwargs), start, duration, duration,
+                                    id(asyncio.current_task()))
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not reentrant and _tracer.active(name):
+                return function(*args, **kwargs)
+            with _tracer.span(name, describe(args, kwargs)):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
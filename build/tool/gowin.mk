@@ -77,7 +77,7 @@ $(build-dir)/$(target).tcl: $(MAKEFILE_LIST)
 	$(foreach u,$(gowin-use-as-gpio),$(call file-append,$@,set_option -use_$u_as_gpio 1))
 	$(call file-append,$@,run syn)
 	$(call file-append,$@,puts {Generating auto constraints...})
-	$(call file-append,$@,exec sh $(BUILD_ROOT)/support/gowin_sdc_auto.sh $(build-dir)/impl/gwsynthesis/$(target).vg $(build-dir)/all.sdc)
+	$(call file-append,$@,exec $(if $(NSL_CDC_NATIVE),$(NSL_CDC) gowin-sdc $(build-dir)/impl/gwsynthesis/$(target).vg -o,sh $(BUILD_ROOT)/support/gowin_sdc_auto.sh $(build-dir)/impl/gwsynthesis/$(target).vg) $(build-dir)/all.sdc)
 	$(foreach s,$(sources),$(call _gowin-project-sdc-$($s-language),$@,$s))
 	$(call file-append,$@,run pnr)
 
@@ -114,7 +114,7 @@ endef
 define ccf_gen
 
 $(build-dir)/$(notdir $(f:.ccf=.ucf)): $f $(build-dir)/$(target).ndf
-	bash $(BUILD_ROOT)/support/ccf_ucf_gen $(build-dir)/$(target).ndf < $$< > $$@
+	$(if $(NSL_CDC_NATIVE),$(NSL_CDC) ucf,bash $(BUILD_ROOT)/support/ccf_ucf_gen) $(build-dir)/$(target).ndf < $$< > $$@
 
 endef
 